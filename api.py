@@ -0,0 +1,375 @@
+"""
+Read-only HTTP API over the latest crawl
+
+    python crawlData.py --serve            # or: python api.py
+    GET /products?url=<product url>        one product
+    GET /products?model=UA55AU7002KXXV     products with that model
+    GET /categories                        category names with product counts
+    GET /categories/<name>?limit=&offset=  products of a category
+    GET /search?q=tivi 55&f.thuong_hieu=Samsung&f.thuong_hieu=LG&r.price=..15000000&facets=thuong_hieu
+    GET /health, /metrics, /metrics.json
+
+Filters: f.<spec key>=<value> (repeat for any of several values) and
+r.<numeric key>=<low>..<high> (either side may be empty, units allowed,
+e.g. r.kich_thuoc_man_hinh=50 inch..). Keys are normalized like in
+specindex, so f.Thương hiệu works too.
+
+Data comes from the spec index written after a crawl. When that index
+is missing or older than the newest all_products file, the API builds
+its own index from that file into data/api_spec_index.pkl and never
+writes the crawler's file. A background thread watches both and swaps
+in the new catalog once it is fully loaded, so requests always see one
+complete crawl. Every response carries an ETag derived from the catalog
+version and the request, and If-None-Match gets a 304.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from dedup import canonicalize_url
+from specindex import SPEC_INDEX_FILE_DEFAULT, SpecIndex, normalize_value, to_bitmap
+
+API_PORT_DEFAULT = 7860
+RELOAD_SECONDS = 30
+SETTLE_SECONDS = 60  # File kết quả không đổi trong khoảng này mới coi là lần crawl đã ghi xong
+PAGE_SIZE_DEFAULT = 20
+PAGE_SIZE_MAX = 200
+API_INDEX_FILE = 'api_spec_index.pkl'  # Chỉ mục do API tự tạo, trong data_dir
+ENDPOINTS = ('products', 'categories', 'search', 'health', 'metrics', 'metrics.json')
+
+API_REQUESTS = metrics.Counter('mediamart_api_requests_total', 'API requests by endpoint and status code')
+API_SECONDS = metrics.Histogram('mediamart_api_seconds', 'API request handling time by endpoint')
+
+
+def latest_products_file(data_dir='data'):
+    """
+    Newest all_products_<timestamp> output in data_dir, None if there is none
+    """
+    files = glob.glob(os.path.join(data_dir, 'all_products_*.jsonl*')) + \
+        glob.glob(os.path.join(data_dir, 'all_products_*.json'))
+    # Tên file chứa timestamp nên sắp theo tên là sắp theo thời gian
+    return max(files, key=os.path.basename) if files else None
+
+
+def file_version(path):
+    """
+    Short id that changes whenever the file is replaced
+    """
+    stat = os.stat(path)
+    return hashlib.blake2b(f"{stat.st_mtime_ns}:{stat.st_size}".encode(), digest_size=8).hexdigest()
+
+
+def newest_index(index_path, build_path):
+    """
+    The more recent of the crawler's index and the one the API built,
+    index_path when neither exists yet
+    """
+    existing = [path for path in (index_path, build_path) if os.path.exists(path)]
+    return max(existing, key=os.path.getmtime) if existing else index_path
+
+
+def stale_source(index_path=SPEC_INDEX_FILE_DEFAULT, data_dir='data'):
+    """
+    Crawl output the index has to be rebuilt from: the newest all_products
+    file when the index is missing or older than it
+
+    A newer file is only used once it has not been written to for
+    SETTLE_SECONDS, so a crawl still in progress is not indexed half way.
+
+    Returns:
+        str or None: Path of the file to index, None if the index is current
+    """
+    source = latest_products_file(data_dir)
+    if source is None:
+        return None
+    if not os.path.exists(index_path):
+        return source
+    modified = os.path.getmtime(source)
+    if os.path.getmtime(index_path) >= modified or time.time() - modified < SETTLE_SECONDS:
+        return None
+    return source
+
+
+class Catalog:
+    """
+    One crawl loaded for serving: the spec index plus lookup tables by
+    URL, model and name tokens. Never modified after construction.
+    """
+
+    def __init__(self, index, version):
+        self.index = index
+        self.version = version
+        self.loaded_at = time.time()
+        self.by_url = {}
+        self.by_model = {}
+        tokens = {}
+        for doc_id, product in enumerate(index.docs):
+            url = product.get('url') or product.get('product_url')
+            if url:
+                self.by_url[canonicalize_url(url)] = doc_id
+            if product.get('model'):
+                self.by_model.setdefault(normalize_value(product['model']), []).append(doc_id)
+            for token in set(normalize_value(product.get('name') or '').split()):
+                tokens.setdefault(token, []).append(doc_id)
+        self.name_tokens = {token: to_bitmap(ids) for token, ids in tokens.items()}
+
+    @classmethod
+    def load(cls, index_path=SPEC_INDEX_FILE_DEFAULT, data_dir='data', build_path=None):
+        """
+        Load the newest spec index, building one first from the newest
+        crawl output when no index exists yet or all are older than it
+
+        Args:
+            index_path (str): Index written by the crawler, only ever read here
+            data_dir (str): Where the crawl output is
+            build_path (str, optional): Where the API writes the index it
+                builds itself, defaults to API_INDEX_FILE in data_dir
+        """
+        build_path = build_path or os.path.join(data_dir, API_INDEX_FILE)
+        index_path = newest_index(index_path, build_path)
+        source = stale_source(index_path, data_dir)
+        if source is None and not os.path.exists(index_path):
+            raise FileNotFoundError(f"Không có {index_path} và chưa có file all_products_* trong {data_dir}")
+        if source is not None:
+            from sinks import read_jsonl
+            print(f"Tạo chỉ mục từ {source}...")
+            if source.endswith('.json'):
+                with open(source, encoding='utf-8') as f:
+                    products = json.load(f)
+            else:
+                products = read_jsonl(source)
+            SpecIndex.build(products).save(build_path)
+            index_path = build_path
+        version = file_version(index_path)
+        return cls(SpecIndex.load(index_path), version)
+
+    def search(self, query, filters, facets, limit, offset):
+        bitmap = self.index.filter(filters)
+        for token in normalize_value(query or '').split():
+            bitmap &= self.name_tokens.get(token, 0)
+        return self.index.page(bitmap, facets, limit, offset)
+
+
+def _parse_range(text):
+    low, sep, high = text.partition('..')
+    if not sep:
+        raise ValueError(f"Khoảng phải có dạng thấp..cao: {text}")
+
+    def bound(value):
+        value = value.strip()
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return bound(low), bound(high)
+
+
+def _facet_params(params):
+    return [facet for facet in params.get('facets', [''])[0].split(',') if facet]
+
+
+def _page_params(params):
+    limit = min(int(params.get('limit', [PAGE_SIZE_DEFAULT])[0]), PAGE_SIZE_MAX)
+    offset = int(params.get('offset', [0])[0])
+    if limit < 0 or offset < 0:
+        raise ValueError("limit và offset phải >= 0")
+    return limit, offset
+
+
+class ApiServer:
+    """
+    Threaded HTTP server answering from the current Catalog, reloaded
+    in the background when the index file changes
+
+    Args:
+        port (int): Port to listen on
+        index_path (str): Spec index file written by the crawler
+        data_dir (str): Where to look for crawl output when the index is missing
+        reload_seconds (float): How often to check the index file for changes
+        build_path (str, optional): Where the API writes an index it builds
+            itself, see Catalog.load
+    """
+
+    def __init__(self, port=API_PORT_DEFAULT, index_path=SPEC_INDEX_FILE_DEFAULT, data_dir='data',
+                 reload_seconds=RELOAD_SECONDS, host='0.0.0.0', build_path=None):
+        self.index_path = index_path
+        self.data_dir = data_dir
+        self.build_path = build_path or os.path.join(data_dir, API_INDEX_FILE)
+        self.reload_seconds = reload_seconds
+        self.catalog = Catalog.load(index_path, data_dir, self.build_path)
+        self._stop = threading.Event()
+        self._httpd = self._make_server(host, port)
+
+    def reload(self):
+        """
+        Load the index again if the file changed or a newer crawl output
+        appeared; the new catalog replaces the old one in a single
+        assignment once it is complete
+
+        Returns:
+            bool: True if a new catalog was swapped in
+        """
+        # Không bật --spec-index thì chỉ có file all_products mới, chỉ mục được tạo lại tại đây
+        current = newest_index(self.index_path, self.build_path)
+        if file_version(current) == self.catalog.version and stale_source(current, self.data_dir) is None:
+            return False
+        catalog = Catalog.load(self.index_path, self.data_dir, self.build_path)
+        self.catalog = catalog
+        print(f"Đã nạp chỉ mục mới: {len(catalog.index.docs)} sản phẩm (phiên bản {catalog.version})")
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_seconds):
+            try:
+                self.reload()
+            except Exception as e:
+                # Giữ nguyên dữ liệu cũ nếu file mới lỗi hoặc đang được thay thế
+                print(f"Lỗi khi nạp lại chỉ mục: {e}")
+
+    def _make_server(self, host, port):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                start = time.perf_counter()
+                endpoint = urlsplit(self.path).path.split('/')[1]
+                # Giới hạn nhãn metrics ở các endpoint đã biết
+                endpoint = endpoint if endpoint in ENDPOINTS else 'other'
+                status = server.handle(self)
+                API_REQUESTS.inc(endpoint=endpoint, status=str(status))
+                API_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        return httpd
+
+    def handle(self, request):
+        # Đọc tham chiếu một lần: cả request dùng cùng một catalog dù có hoán đổi giữa chừng
+        catalog = self.catalog
+        parts = urlsplit(request.path)
+        path = unquote(parts.path).rstrip('/') or '/'
+        params = parse_qs(parts.query)
+        try:
+            if path == '/metrics':
+                return self._send(request, 200, metrics.expose().encode('utf-8'),
+                                  'text/plain; version=0.0.4; charset=utf-8')
+            if path == '/metrics.json':
+                return self._send_json(request, 200, metrics.summary())
+            etag = 'W/"%s-%s"' % (catalog.version, hashlib.blake2b(
+                request.path.encode('utf-8'), digest_size=8).hexdigest())
+            if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+                return self._send(request, 304, b'', None, etag)
+            status, body = self._route(catalog, path, params)
+            return self._send_json(request, status, body, etag if status == 200 else None)
+        except ValueError as e:
+            return self._send_json(request, 400, {'error': str(e)})
+        except Exception as e:
+            # Ví dụ bản ghi sản phẩm lỗi: vẫn trả lời (và ghi metrics) thay vì bỏ dở request
+            print(f"Lỗi khi xử lý {request.path}: {e!r}")
+            return self._send_json(request, 500, {'error': 'Lỗi máy chủ'})
+
+    def _route(self, catalog, path, params):
+        docs = catalog.index.docs
+        if path == '/health':
+            return 200, {'products': len(docs), 'version': catalog.version, 'built_at': catalog.index.built_at,
+                         'loaded_at': catalog.loaded_at}
+        if path == '/products':
+            if 'url' in params:
+                doc_id = catalog.by_url.get(canonicalize_url(params['url'][0]))
+                if doc_id is None:
+                    return 404, {'error': 'Không tìm thấy sản phẩm'}
+                return 200, docs[doc_id].to_dict()
+            if 'model' in params:
+                ids = catalog.by_model.get(normalize_value(params['model'][0]), [])
+                if not ids:
+                    return 404, {'error': 'Không tìm thấy sản phẩm'}
+                return 200, {'total': len(ids), 'products': [docs[doc_id].to_dict() for doc_id in ids]}
+            raise ValueError("Cần tham số url hoặc model")
+        if path == '/categories':
+            return 200, catalog.index.facet_counts('categories')
+        if path.startswith('/categories/'):
+            limit, offset = _page_params(params)
+            bitmap = catalog.index.postings.get('categories', {}).get(normalize_value(path[len('/categories/'):]))
+            if bitmap is None:
+                return 404, {'error': 'Không tìm thấy danh mục'}
+            return 200, catalog.index.page(bitmap, _facet_params(params), limit, offset)
+        if path == '/search':
+            limit, offset = _page_params(params)
+            filters = {}
+            for name, values in params.items():
+                if name.startswith('f.'):
+                    filters[name[2:]] = values
+                elif name.startswith('r.'):
+                    filters[name[2:]] = _parse_range(values[0])
+            return 200, catalog.search(params.get('q', [''])[0], filters, _facet_params(params), limit, offset)
+        return 404, {'error': 'Không có endpoint này'}
+
+    def _send_json(self, request, status, body, etag=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        return self._send(request, status, data, 'application/json; charset=utf-8', etag)
+
+    def _send(self, request, status, data, content_type, etag=None):
+        request.send_response(status)
+        if content_type:
+            request.send_header('Content-Type', content_type)
+        if etag:
+            request.send_header('ETag', etag)
+            # Trình duyệt/proxy được lưu nhưng phải hỏi lại (và nhận 304) trước khi dùng
+            request.send_header('Cache-Control', 'no-cache')
+        request.send_header('Content-Length', str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+        return status
+
+    def serve_forever(self):
+        watcher = threading.Thread(target=self._watch, name="api-reload", daemon=True)
+        watcher.start()
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._stop.set()
+            self._httpd.server_close()
+
+    def start(self):
+        """
+        Serve from a daemon thread
+
+        Returns:
+            ApiServer: self; call shutdown() to stop
+        """
+        threading.Thread(target=self.serve_forever, name="api-http", daemon=True).start()
+        return self
+
+    def shutdown(self):
+        self._stop.set()
+        self._httpd.shutdown()
+
+
+def serve(port=API_PORT_DEFAULT, index_path=SPEC_INDEX_FILE_DEFAULT, data_dir='data'):
+    server = ApiServer(port, index_path, data_dir)
+    print(f"API: http://localhost:{port}/health ({len(server.catalog.index.docs)} sản phẩm)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="API chỉ đọc trên dữ liệu đã crawl")
+    parser.add_argument('--port', type=int, default=API_PORT_DEFAULT,
+                        help=f"Cổng HTTP (mặc định: {API_PORT_DEFAULT})")
+    parser.add_argument('--spec-index-file', default=SPEC_INDEX_FILE_DEFAULT,
+                        help=f"File chỉ mục thông số (mặc định: {SPEC_INDEX_FILE_DEFAULT})")
+    args = parser.parse_args()
+    serve(args.port, args.spec_index_file)
@@ -0,0 +1,225 @@
+import asyncio
+import concurrent.futures
+import itertools
+import os
+import time
+import zlib
+from urllib.parse import urlsplit
+
+import fetcher
+import metrics
+import ratelimit
+from fetcher import CONNECT_TIMEOUT, MAX_RETRIES, READ_TIMEOUT, default_headers
+from product import parse_mediamart_product
+
+DEFAULT_CONCURRENCY = 200  # Số request đồng thời tối đa
+FEED_BATCH = 100           # Số URL lấy từ iterator đầu vào mỗi lần
+
+_DONE = object()
+
+
+def _decode_body(content, content_encoding):
+    """
+    Undo the Content-Encoding of a body read with auto_decompress=False;
+    only the encodings default_headers() can advertise are expected
+    """
+    codings = [coding.strip().lower() for coding in (content_encoding or '').split(',') if coding.strip()]
+    for coding in reversed(codings):
+        if coding in ('gzip', 'x-gzip'):
+            content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+        elif coding == 'deflate':
+            try:
+                content = zlib.decompress(content)
+            except zlib.error:
+                # Một số server gửi deflate thô, không có header zlib
+                content = zlib.decompress(content, -zlib.MAX_WBITS)
+        elif coding == 'br':
+            import brotli
+            content = brotli.decompress(content)
+        elif coding == 'zstd':
+            import zstandard
+            content = zstandard.ZstdDecompressor().decompressobj().decompress(content)
+        elif coding != 'identity':
+            raise ValueError(f"Unknown Content-Encoding: {coding}")
+    return content
+
+
+async def _fetch_html(session, url):
+    """
+    GET a page through the shared per-host rate limiter, retrying
+    transient failures with the same backoff as fetcher.fetch
+
+    The rate limiter's token bucket and concurrency window, the HTTP
+    response cache, the metrics and the fetch counters are shared with
+    fetcher.fetch through the same helpers, so --cache, the AIMD window
+    and the run statistics work the same with both engines.
+
+    Returns:
+        tuple: (status, html); html is None unless the status is 200
+    """
+    import aiohttp
+
+    # SQLite của cache chạy trên luồng riêng để không chặn event loop
+    cached = await asyncio.to_thread(fetcher.lookup_cache, url, stage='product')
+    if cached is not None:
+        return cached.status_code, cached.text if cached.status_code == 200 else None
+
+    limiter = ratelimit.get_limiter(urlsplit(url).netloc)
+    attempt = 0
+    while True:
+        await limiter.acquire_async()
+        start = time.monotonic()
+        try:
+            async with session.get(url) as response:
+                elapsed = time.monotonic() - start
+                # Session không tự giải nén: số byte đọc được là số byte thực nhận, như response.raw ở fetch()
+                raw = await response.read()
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            fetcher.record_attempt(limiter, 'product')
+            delay = fetcher.retry_delay('product', attempt, MAX_RETRIES)
+            if delay is None:
+                raise
+        else:
+            content = _decode_body(raw, response.headers.get('Content-Encoding'))
+            retry_after = fetcher.record_attempt(
+                limiter, 'product', response.status, response.headers, elapsed, time.monotonic() - start,
+                len(raw), len(content),
+            )
+            delay = fetcher.retry_delay('product', attempt, MAX_RETRIES, response.status, retry_after)
+            if delay is None:
+                await asyncio.to_thread(
+                    fetcher.store_cache, url, None, response.status, dict(response.headers), content
+                )
+                if response.status != 200:
+                    return response.status, None
+                return response.status, content.decode(response.charset or 'utf-8', errors='replace')
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def _scrape_one(session, parse_pool, product):
+    """
+    Fetch one product page and hand its HTML to the parse pool
+    """
+    url = product['url']
+    try:
+        status, html = await _fetch_html(session, url)
+        if status != 200:
+            return {"error": f"Failed to fetch the page: {status}", "status": status}
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        product = await loop.run_in_executor(parse_pool, parse_mediamart_product, html, url)
+        # Gồm cả thời gian chờ trong process pool
+        metrics.PARSE_SECONDS.observe(time.perf_counter() - start, stage='product')
+        return product
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _take(links, on_take):
+    batch = list(itertools.islice(links, FEED_BATCH))
+    if on_take is not None:
+        for product in batch:
+            on_take(product)
+    return batch
+
+
+async def _feed(product_links, queue, workers, on_take=None):
+    """
+    Move entries from the input iterator into the queue, then one stop
+    marker per worker; on_take is called with each entry on the same
+    thread that reads the iterator
+    """
+    links = iter(product_links)
+    while True:
+        # Iterator có thể đọc SQLite (frontier) hay tải sitemap: lấy từng lô trên luồng riêng
+        batch = await asyncio.to_thread(_take, links, on_take)
+        if not batch:
+            break
+        for product in batch:
+            await queue.put(product)
+    for _ in range(workers):
+        await queue.put(_DONE)
+
+
+async def _crawl(product_links, concurrency, parse_workers, on_result, on_take=None):
+    import aiohttp
+
+    timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    # Hàng đợi có giới hạn: chỉ đọc trước khoảng một lô cho mỗi worker
+    queue = asyncio.Queue(maxsize=concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def worker(session, parse_pool, result_pool):
+        # Mỗi worker xử lý một URL mỗi lần: số request đang chạy không vượt quá concurrency
+        while True:
+            product = await queue.get()
+            if product is _DONE:
+                return
+            detail = await _scrape_one(session, parse_pool, product)
+            # on_result ghi file và checkpoint frontier: chạy tuần tự trên một luồng riêng
+            await loop.run_in_executor(result_pool, on_result, product, detail)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers) as parse_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=1) as result_pool:
+        async with aiohttp.ClientSession(
+            headers=default_headers(), timeout=timeout, connector=connector, auto_decompress=False
+        ) as session:
+            await asyncio.gather(
+                _feed(product_links, queue, concurrency, on_take),
+                *(worker(session, parse_pool, result_pool) for _ in range(concurrency)),
+            )
+
+
+def crawl_products_async(product_links, concurrency=DEFAULT_CONCURRENCY, parse_workers=None, desc="Crawling",
+                         on_product=None, frontier=None):
+    """
+    Crawl product detail pages with asyncio instead of a thread pool
+
+    Args:
+        product_links (iterable): Dicts from the listing crawler, each with a 'url';
+            consumed lazily, so an iterator keeps memory flat
+        concurrency (int): Maximum number of in-flight HTTP requests
+        parse_workers (int, optional): Number of HTML parsing processes,
+            defaults to the CPU count
+        desc (str): Label for the progress bar
+        on_product (callable, optional): Called with each finished product
+            instead of collecting it into the returned list
+        frontier (CrawlFrontier, optional): Marks every URL in flight when
+            it is taken and failed when it fails, like the thread pool path
+
+    Returns:
+        list: Product dicts in the same shape as the thread pool path
+    """
+    # aiohttp chỉ được import khi dùng engine này
+    from tqdm import tqdm
+
+    parse_workers = parse_workers or os.cpu_count() or 1
+    detailed_products = []
+
+    total = len(product_links) if hasattr(product_links, '__len__') else None
+    with tqdm(total=total, desc=desc) as pbar:
+        def on_result(product, detail):
+            if 'error' not in detail:
+                # Thêm thông tin từ danh sách sản phẩm nếu cần
+                for key in product:
+                    if key not in detail:
+                        detail[key] = product[key]
+                if on_product is not None:
+                    on_product(detail)
+                else:
+                    detailed_products.append(detail)
+                metrics.ITEMS.inc(stage='product', result='ok')
+            else:
+                if frontier is not None:
+                    frontier.mark_failed(product['url'], detail['error'])
+                metrics.ITEMS.inc(stage='product', result='failed')
+                print(f"Lỗi khi crawl sản phẩm {product['url']}: {detail['error']}")
+            pbar.update(1)
+
+        on_take = (lambda product: frontier.mark_in_flight(product['url'])) if frontier is not None else None
+        asyncio.run(_crawl(product_links, concurrency, parse_workers, on_result, on_take))
+
+    return detailed_products
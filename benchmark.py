@@ -0,0 +1,268 @@
+"""
+Offline replay of the recorded pages in fixtures/ through the menu,
+listing and product scrapers.
+
+    python benchmark.py --check          # compare outputs with the expected JSON
+    python benchmark.py --iterations 50  # pages/sec, per-field timings, peak memory
+
+No network access is needed: fetcher.mount() routes every mediamart.vn
+request to the recorded HTML files listed in fixtures/manifest.json.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import requests
+from requests.adapters import BaseAdapter
+
+import fetcher
+import ratelimit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+UNLIMITED_RATE = 1e9
+
+
+class FixtureAdapter(BaseAdapter):
+    """
+    requests transport adapter serving recorded pages from disk; URLs
+    missing from the manifest get a 404, URLs in statuses get that status
+    with an empty body
+    """
+
+    def __init__(self, pages, directory=FIXTURES_DIR, statuses=None):
+        super().__init__()
+        self.directory = directory
+        self.pages = pages
+        self.statuses = statuses if statuses is not None else {}
+        self._cache = {}
+
+    def _body(self, name):
+        body = self._cache.get(name)
+        if body is None:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                body = self._cache[name] = f.read()
+        return body
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = 'utf-8'
+        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        name = self.pages.get(request.url)
+        if request.url in self.statuses:
+            response.status_code = self.statuses[request.url]
+            response._content = b''
+        elif name is None:
+            response.status_code = 404
+            response._content = b''
+        else:
+            response.status_code = 200
+            response._content = self._body(name)
+        return response
+
+    def close(self):
+        pass
+
+
+def load_manifest(directory=FIXTURES_DIR):
+    with open(os.path.join(directory, 'manifest.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def install_fixtures(manifest, directory=FIXTURES_DIR):
+    """
+    Serve every mediamart.vn request from the fixture corpus, without
+    rate limiting since no real server is involved
+    """
+    ratelimit.configure(rate=UNLIMITED_RATE, max_rate=UNLIMITED_RATE)
+    fetcher.mount(fetcher.BASE_URL, FixtureAdapter(manifest['pages'], directory))
+
+
+def _sitemap_incremental(url):
+    """
+    Two sitemap runs against a throwaway incremental store: the second
+    reuses every product whose lastmod predates the first run
+    """
+    import sitemap
+    from incremental import IncrementalCrawler
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'incremental.db')
+        first = IncrementalCrawler(path)
+        for product in sitemap.discover_products(url, reuse=first.reuse_not_modified):
+            first.scrape(product['url'])
+        first.close()
+
+        second = IncrementalCrawler(path)
+        reused = []
+        fetched = []
+        for product in sitemap.discover_products(url, reuse=second.reuse_not_modified, on_reused=reused.append):
+            fetched.append(product['url'])
+            second.scrape(product['url'])
+        removed = [record['url'] for record in second.iter_delta() if record['change'] == 'removed']
+        second.close()
+    return {
+        'reused': [{key: product.get(key) for key in ('url', 'lastmod', 'name')} for product in reused],
+        'fetched': fetched,
+        'removed': removed,
+        'same_lastmod': second.stats['same_lastmod'],
+    }
+
+
+def _import_scrapers():
+    import category
+    import listproduct
+    import product
+    import sitemap
+    return {
+        'menu': lambda url: category.scrape_mediamart_menu(),
+        'listing': listproduct.crawl_cap_noi_products,
+        'product': product.scrape_mediamart_product,
+        'sitemap': lambda url: [list(entry) for entry in sitemap.iter_product_urls(url)],
+        'sitemap_incremental': _sitemap_incremental,
+    }
+
+
+def run_case(scrapers, case):
+    # Các scraper in tiến trình ra stdout, không cần thiết khi benchmark
+    with contextlib.redirect_stdout(io.StringIO()):
+        return scrapers[case['kind']](case['url'])
+
+
+def check(manifest, scrapers, directory=FIXTURES_DIR):
+    """
+    Run every case once and compare with its expected JSON
+
+    Returns:
+        list: Descriptions of the cases whose output differs
+    """
+    failures = []
+    for case in manifest['cases']:
+        output = run_case(scrapers, case)
+        with open(os.path.join(directory, case['expected']), 'r', encoding='utf-8') as f:
+            expected = json.load(f)
+        # So sánh cả thứ tự khóa vì file JSON đầu ra giữ nguyên thứ tự này
+        if json.dumps(output, ensure_ascii=False) != json.dumps(expected, ensure_ascii=False):
+            failures.append(f"{case['kind']} {case['url']} != {case['expected']}")
+    return failures
+
+
+def record(manifest, scrapers, directory=FIXTURES_DIR):
+    """
+    Overwrite the expected JSON files with the current outputs
+    """
+    for case in manifest['cases']:
+        output = run_case(scrapers, case)
+        with open(os.path.join(directory, case['expected']), 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=4)
+            f.write('\n')
+
+
+def benchmark(manifest, scrapers, iterations, directory=FIXTURES_DIR):
+    """
+    Replay every case `iterations` times
+
+    Returns:
+        dict: pages/sec per scraper kind, mean per-field product extraction
+        time in ms, and peak memory
+    """
+    from product import parse_mediamart_product
+
+    results = {'iterations': iterations, 'stages': {}, 'product_fields_ms': {}}
+
+    tracemalloc.start()
+    for kind in ('menu', 'listing', 'product', 'sitemap'):
+        cases = [case for case in manifest['cases'] if case['kind'] == kind]
+        if not cases:
+            continue
+        requests_before = fetcher.fetch_stats()['requests']
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for case in cases:
+                run_case(scrapers, case)
+        elapsed = time.perf_counter() - start
+        pages = fetcher.fetch_stats()['requests'] - requests_before
+        results['stages'][kind] = {
+            'pages': pages,
+            'seconds': round(elapsed, 4),
+            'pages_per_sec': round(pages / elapsed, 1) if elapsed else None,
+        }
+
+    timings = {}
+    parsed = 0
+    for url, name in manifest['pages'].items():
+        if not name.startswith('product_'):
+            continue
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            html = f.read()
+        for _ in range(iterations):
+            parse_mediamart_product(html, url, timings=timings)
+            parsed += 1
+    for step, seconds in timings.items():
+        results['product_fields_ms'][step] = round(seconds / parsed * 1000, 4)
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['peak_traced_mib'] = round(peak / 1024 / 1024, 2)
+    try:
+        import resource
+        # ru_maxrss tính bằng KiB trên Linux
+        results['max_rss_mib'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        pass
+    return results
+
+
+def print_results(results):
+    print(f"Lặp {results['iterations']} lần trên bộ fixtures")
+    for kind, stage in results['stages'].items():
+        print(f"  {kind:<8} {stage['pages']:>6} trang  {stage['seconds']:>8.3f}s  {stage['pages_per_sec']:>8} trang/s")
+    print("Thời gian trích xuất trung bình mỗi trang sản phẩm (ms):")
+    for step, ms in results['product_fields_ms'].items():
+        print(f"  {step:<18} {ms:>8.3f}")
+    print(f"Bộ nhớ Python tối đa: {results['peak_traced_mib']} MiB")
+    if 'max_rss_mib' in results:
+        print(f"RSS tối đa: {results['max_rss_mib']} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark và kiểm tra scraper trên bộ HTML đã ghi sẵn")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--parser', default=None, help="Bộ parse HTML trang chi tiết (lxml, html.parser, selectolax)")
+    parser.add_argument('--check', action='store_true', help="Chỉ so sánh đầu ra với file JSON mong đợi")
+    parser.add_argument('--record', action='store_true', help="Ghi đè file JSON mong đợi bằng đầu ra hiện tại")
+    parser.add_argument('--output', help="Lưu kết quả benchmark dạng JSON")
+    args = parser.parse_args()
+
+    manifest = load_manifest()
+    install_fixtures(manifest)
+    scrapers = _import_scrapers()
+    if args.parser:
+        from product import set_parser_backend
+        set_parser_backend(args.parser)
+
+    if args.record:
+        record(manifest, scrapers)
+        print(f"Đã ghi {len(manifest['cases'])} file kết quả mong đợi")
+        sys.exit(0)
+
+    failures = check(manifest, scrapers)
+    for failure in failures:
+        print(f"KHÁC: {failure}")
+    if args.check:
+        print(f"{len(manifest['cases']) - len(failures)}/{len(manifest['cases'])} trường hợp khớp")
+        sys.exit(1 if failures else 0)
+
+    results = benchmark(manifest, scrapers, args.iterations)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+    sys.exit(1 if failures else 0)
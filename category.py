@@ -1,84 +1,187 @@
+import json
+import os
+import time
+
 from bs4 import BeautifulSoup
-import requests
-def scrape_mediamart_menu():
-    # URL gốc để nối các link tương đối
-    base_url = "https://mediamart.vn"
+from fetcher import BASE_URL, MAX_RETRIES, fetch
+from storage import atomic_path
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+MENU_CACHE_FILE = 'mediamart_menu.json'
+MENU_TTL_DEFAULT = 24 * 3600  # Menu ít thay đổi, crawl lại tối đa mỗi ngày một lần
 
-    response = requests.get(base_url, headers=headers)
-    if response.status_code != 200:
-        print({"error": f"Failed to fetch the page: {response.status_code}"})
-    soup = BeautifulSoup(response.text, 'html.parser')  
+def _parse_menu(html, base_url=BASE_URL):
+    """
+    Đọc menu trang chủ thành cây danh mục và danh sách phẳng
+
+    Mỗi mục cấp 1 (thẻ a trong span.nav-link-text) là một nút gốc; các mục cấp 2
+    (nav-link-2) trong cùng dropdown là con của mục cấp 1 đầu tiên của dropdown đó.
+    Danh sách phẳng giữ đúng thứ tự cũ: các mục cấp 1 rồi đến các mục cấp 2 của từng dropdown.
 
+    Returns:
+        tuple: (tree, menu_items), hoặc (None, None) nếu không tìm thấy menu
+    """
+    soup = BeautifulSoup(html, 'html.parser')
 
     # Tìm container chính của menu
     navbar_main = soup.find('div', id='navbarMain')
+    if not navbar_main:
+        print("Không tìm thấy thẻ div#navbarMain")
+        return None, None
 
     # Danh sách để lưu kết quả
     menu_items = []
+    tree = []
+    # Tập (name, url) đã thêm, tra cứu O(1) thay vì duyệt lại menu_items
+    seen = set()
 
-
-
-    if navbar_main:
-        # --- Lấy các mục menu chính (Level 1 - Các thẻ a trong span.nav-link-text) ---
-        top_level_lis = navbar_main.find('ul', class_='navbar-nav').find_all('li', class_='nav-item dropdown', recursive=False)
-        for li_top in top_level_lis:
-            nav_link_text_span = li_top.find('span', class_='nav-link-text')
-            if nav_link_text_span:
-                inner_span = nav_link_text_span.find('span')
-                if inner_span:
-                    links = inner_span.find_all('a')
-                    for link in links:
-                        name = link.get_text(strip=True)
-                        url = link.get('href', '#')
-                        # Tạo URL tuyệt đối nếu là link tương đối
-                        if url.startswith('/'):
-                            url = base_url + url
-                        if name and url != '#':
-                            menu_items.append({'name': name, 'url': url})
-
-            # --- Lấy các mục menu con (Level 2 - class="nav-link-2") ---
-            submenu_1 = li_top.find('ul', class_='dropdown-menu-1')
-            if submenu_1:
-                # Tìm tất cả các thẻ <a> có class="nav-link-2" trong menu con này
-                sub_links = submenu_1.find_all('a', class_='nav-link-2')
-                for link in sub_links:
-                    # Lấy text, loại bỏ text của thẻ span ẩn bên trong nếu có
+    # --- Lấy các mục menu chính (Level 1 - Các thẻ a trong span.nav-link-text) ---
+    top_level_lis = navbar_main.find('ul', class_='navbar-nav').find_all('li', class_='nav-item dropdown', recursive=False)
+    for li_top in top_level_lis:
+        section = []
+        nav_link_text_span = li_top.find('span', class_='nav-link-text')
+        if nav_link_text_span:
+            inner_span = nav_link_text_span.find('span')
+            if inner_span:
+                links = inner_span.find_all('a')
+                for link in links:
                     name = link.get_text(strip=True)
-                    hidden_span = link.find('span', class_='menu-item-view')
-                    if hidden_span:
-                        name = name.replace(hidden_span.get_text(strip=True), '').strip()
-
                     url = link.get('href', '#')
-
-                    # Đảm bảo URL là tuyệt đối
+                    # Tạo URL tuyệt đối nếu là link tương đối
                     if url.startswith('/'):
                         url = base_url + url
-                    elif not url.startswith('http') and url != '#':
-                        # Có thể là link đầy đủ hoặc link javascript, chỉ lấy link http(s) hoặc tương đối
-                        print(f"Skipping potentially invalid URL: {url} for item: {name}")
-                        continue # Bỏ qua nếu không phải link web hợp lệ
-
-                    # Chỉ thêm nếu có tên và URL hợp lệ (không phải # hoặc javascript:;)
-                    if name and url != '#' and not url.startswith('javascript:'):
-                        # Tránh trùng lặp nếu mục này đã được thêm ở cấp độ 1
-                        is_duplicate = False
-                        for item in menu_items:
-                            if item['name'] == name and item['url'] == url:
-                                is_duplicate = True
-                                break
-                        if not is_duplicate:
-                            menu_items.append({'name': name, 'url': url})
-        return menu_items
+                    if name and url != '#':
+                        menu_items.append({'name': name, 'url': url})
+                        seen.add((name, url))
+                        section.append({'name': name, 'url': url, 'children': []})
+        tree.extend(section)
+
+        # --- Lấy các mục menu con (Level 2 - class="nav-link-2") ---
+        submenu_1 = li_top.find('ul', class_='dropdown-menu-1')
+        if submenu_1:
+            # Tìm tất cả các thẻ <a> có class="nav-link-2" trong menu con này
+            sub_links = submenu_1.find_all('a', class_='nav-link-2')
+            for link in sub_links:
+                # Lấy text, loại bỏ text của thẻ span ẩn bên trong nếu có
+                name = link.get_text(strip=True)
+                hidden_span = link.find('span', class_='menu-item-view')
+                if hidden_span:
+                    name = name.replace(hidden_span.get_text(strip=True), '').strip()
+
+                url = link.get('href', '#')
+
+                # Đảm bảo URL là tuyệt đối
+                if url.startswith('/'):
+                    url = base_url + url
+                elif not url.startswith('http') and url != '#':
+                    # Có thể là link đầy đủ hoặc link javascript, chỉ lấy link http(s) hoặc tương đối
+                    print(f"Skipping potentially invalid URL: {url} for item: {name}")
+                    continue # Bỏ qua nếu không phải link web hợp lệ
 
+                # Chỉ thêm nếu có tên và URL hợp lệ (không phải # hoặc javascript:;)
+                # và chưa được thêm ở cấp độ 1
+                if name and url != '#' and not url.startswith('javascript:') and (name, url) not in seen:
+                    seen.add((name, url))
+                    menu_items.append({'name': name, 'url': url})
+                    node = {'name': name, 'url': url, 'children': []}
+                    if section:
+                        section[0]['children'].append(node)
+                    else:
+                        tree.append(node)
+    return tree, menu_items
+
+def _fetch_menu_html(retries=MAX_RETRIES):
+    response = fetch(BASE_URL, retries=retries, stage='menu')
+    if response.status_code != 200:
+        print({"error": f"Failed to fetch the page: {response.status_code}"})
+    return response.text
+
+def scrape_mediamart_menu():
+    """
+    Danh sách phẳng các danh mục (name, url) cấp 1 và cấp 2 của menu
+    """
+    return _parse_menu(_fetch_menu_html())[1]
+
+def scrape_mediamart_menu_tree():
+    """
+    Cây danh mục của menu: danh sách các nút {'name', 'url', 'children'}
+    """
+    return _parse_menu(_fetch_menu_html())[0]
+
+def iter_menu_tree(tree, parent=None):
+    """
+    Duyệt cây danh mục theo thứ tự trước, trả về (node, parent)
+    """
+    for node in tree or ():
+        yield node, parent
+        yield from iter_menu_tree(node['children'], node)
+
+def load_menu(cache_file=MENU_CACHE_FILE, ttl=MENU_TTL_DEFAULT):
+    """
+    Trả về danh sách danh mục, ưu tiên file cache còn hạn
+    
+    Chỉ crawl lại trang chủ khi file cache cũ hơn ttl giây hoặc chưa tồn tại.
+    Nếu crawl thất bại (ví dụ đang offline) thì dùng lại cache cũ ngay, không thử lại.
+    
+    Args:
+        cache_file (str): File JSON lưu danh mục
+        ttl (float, optional): Thời gian cache còn hạn (giây); None để không bao giờ hết hạn
+        
+    Returns:
+        list: Danh sách danh mục (name, url)
+    """
+    return _load_cached(cache_file, ttl, 'categories')
+
+def load_menu_tree(cache_file=MENU_CACHE_FILE, ttl=MENU_TTL_DEFAULT):
+    """
+    Như load_menu nhưng trả về cây danh mục (name, url, children)
+    
+    Cây và danh sách phẳng được parse từ cùng một lần tải trang chủ và lưu chung một file cache,
+    nên luôn khớp nhau và gọi cả hai hàm chỉ tải menu một lần.
+    """
+    return _load_cached(cache_file, ttl, 'tree')
+
+def _load_cached(cache_file, ttl, view):
+    cached = None
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if isinstance(cached, list):
+            # File cache kiểu cũ chỉ có danh sách phẳng, chưa có cây danh mục
+            cached = {'tree': None, 'categories': cached}
+        age = time.time() - os.path.getmtime(cache_file)
+        if cached[view] is None:
+            print(f"File {cache_file} chưa có cây danh mục, crawl lại menu...")
+        elif ttl is None or age < ttl:
+            print(f"Đọc danh mục từ file {cache_file}")
+            return cached[view]
+        else:
+            print(f"File {cache_file} đã cũ ({age / 3600:.1f} giờ), crawl lại menu...")
     else:
-        print("Không tìm thấy thẻ div#navbarMain")
+        print("Crawling danh mục menu từ trang chủ...")
+    
+    try:
+        # Đã có cache cũ thì thử một lần, lỗi là dùng lại ngay thay vì chờ hết các lần thử lại
+        tree, menu_items = _parse_menu(_fetch_menu_html(retries=0 if cached is not None else MAX_RETRIES))
+    except Exception as e:
+        print(f"Lỗi khi crawl menu: {e}")
+        tree, menu_items = None, None
+    
+    if not menu_items:
+        if cached is not None:
+            print(f"Dùng lại danh mục cũ từ {cache_file}")
+            return cached[view] or []
+        return []
+    
+    # Cây và danh sách phẳng lưu chung một file để không bao giờ lệch nhau
+    save_menu({'tree': tree, 'categories': menu_items}, cache_file)
+    return tree if view == 'tree' else menu_items
 
-menu_items = scrape_mediamart_menu()
-import json
-with open('mediamart_menu.json', 'w', encoding='utf-8') as f:
-    json.dump(menu_items, f, ensure_ascii=False, indent=4)
-print("\nĐã lưu dữ liệu vào file mediamart_menu.json")
\ No newline at end of file
+def save_menu(menu_items, cache_file=MENU_CACHE_FILE):
+    with atomic_path(cache_file) as tmp_file:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(menu_items, f, ensure_ascii=False, indent=4)
+
+if __name__ == "__main__":
+    tree, menu_items = _parse_menu(_fetch_menu_html())
+    save_menu({'tree': tree, 'categories': menu_items})
+    print(f"\nĐã lưu dữ liệu vào file {MENU_CACHE_FILE}")
@@ -1,40 +1,34 @@
+import argparse
+import importlib.util
 import os
 import json
 import time
-import concurrent.futures
-from tqdm import tqdm
-import pandas as pd
-from urllib.parse import urljoin
+import itertools
 
-from category import scrape_mediamart_menu
-from listproduct import crawl_cap_noi_products, save_products_to_json
-from product import scrape_mediamart_product
+from category import MENU_TTL_DEFAULT, load_menu, load_menu_tree
+from dedup import UrlDeduper, merge_categories
+from frontier import FAILED, PENDING, STATE_FILE_DEFAULT, CrawlFrontier, known_urls as frontier_urls
+from fetcher import CACHE_MODES, configure as configure_fetcher, configure_cache, format_fetch_stats
+from incremental import INCREMENTAL_FILE_DEFAULT, IncrementalCrawler, known_urls as incremental_urls
+from listproduct import PAGE_WORKERS, crawl_cap_noi_products
+from metrics import ITEMS, METRICS_PORT_DEFAULT, start_http_server, write_summary
+from pipeline import LISTING_WORKERS_DEFAULT, collect_product_links, crawl_pipeline, windowed_map
+from product import PARSER_BACKEND, PARSER_BACKENDS, scrape_mediamart_product, set_parser_backend
+from ratelimit import MAX_RATE, configure as configure_rate_limit, limiter_stats
+from sinks import COMPRESSIONS, JsonlSink, jsonl_filename, read_jsonl
 
 BASE_URL = "https://mediamart.vn"
 MAX_WORKERS_DEFAULT = 5  # Số luồng mặc định
+CATALOG_HEADROOM = 1.25  # Dư cho sản phẩm mới so với số URL của lần crawl trước
+ENGINE_DEFAULT = 'threads'
 
-def get_menu_categories():
+def get_menu_categories(ttl=MENU_TTL_DEFAULT):
     """
     Lấy danh sách các danh mục từ menu của trang web
-    Nếu đã có file cache, sẽ đọc từ file
+    Nếu file cache còn hạn (ttl giây), sẽ đọc từ file
     """
     try:
-        # Kiểm tra xem file menu đã tồn tại chưa
-        if os.path.exists('mediamart_menu.json'):
-            print("Đọc danh mục từ file mediamart_menu.json")
-            with open('mediamart_menu.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
-        
-        # Nếu không, crawl mới
-        print("Crawling danh mục menu từ trang chủ...")
-        menu_items = scrape_mediamart_menu()
-        
-        # Lưu menu vào file để sử dụng lần sau
-        with open('mediamart_menu.json', 'w', encoding='utf-8') as f:
-            json.dump(menu_items, f, ensure_ascii=False, indent=4)
-        
-        return menu_items
-    
+        return load_menu(ttl=ttl)
     except Exception as e:
         print(f"Lỗi khi crawl menu: {e}")
         return []
@@ -51,6 +45,9 @@ def save_products_to_csv(products, filename):
     Lưu thông tin sản phẩm vào file CSV
     """
     try:
+        # pandas nặng, chỉ import khi thực sự cần xuất CSV
+        import pandas as pd
+        
         # Chuyển đổi cấu trúc dữ liệu phức tạp sang chuỗi
         products_copy = []
         for product in products:
@@ -79,7 +76,8 @@ def save_products_to_csv(products, filename):
         print(f"Lỗi khi lưu file {filename}: {e}")
         return False
 
-def crawl_category_products(category, max_pages=None, max_workers=MAX_WORKERS_DEFAULT, max_products=None):
+def crawl_category_products(category, max_pages=None, max_workers=MAX_WORKERS_DEFAULT, max_products=None,
+                            engine=ENGINE_DEFAULT, concurrency=None, dedup=None, on_product=None):
     """
     Crawl tất cả sản phẩm từ một danh mục cụ thể với đa luồng
     
@@ -88,6 +86,10 @@ def crawl_category_products(category, max_pages=None, max_workers=MAX_WORKERS_DE
         max_pages (int, optional): Số trang tối đa cần crawl
         max_workers (int): Số luồng tối đa để crawl
         max_products (int, optional): Số sản phẩm tối đa cần crawl
+        engine (str): 'threads' hoặc 'asyncio'
+        concurrency (int, optional): Số request đồng thời tối đa khi dùng engine 'asyncio'
+        dedup (UrlDeduper, optional): Tập URL đã crawl dùng chung giữa các danh mục
+        on_product (callable, optional): Gọi với mỗi sản phẩm crawl xong thay vì gom vào danh sách trả về
         
     Returns:
         list: Danh sách các thông tin chi tiết sản phẩm
@@ -96,6 +98,13 @@ def crawl_category_products(category, max_pages=None, max_workers=MAX_WORKERS_DE
     print(f"\nCrawling danh mục: {category['name']} ({category['url']})")
     product_links = get_product_links(category['url'], max_pages)
     
+    # Bỏ các sản phẩm đã crawl ở danh mục khác (ví dụ "Tivi" và "Tivi Samsung")
+    if dedup is not None:
+        found = len(product_links)
+        product_links = dedup.filter(product_links, category['name'])
+        if len(product_links) < found:
+            print(f"Bỏ qua {found - len(product_links)} sản phẩm đã crawl ở danh mục khác")
+    
     # Giới hạn số lượng sản phẩm nếu cần
     if max_products and len(product_links) > max_products:
         product_links = product_links[:max_products]
@@ -107,48 +116,205 @@ def crawl_category_products(category, max_pages=None, max_workers=MAX_WORKERS_DE
         return []
     
     # Crawl chi tiết sản phẩm với đa luồng
+    return scrape_product_details(product_links, max_workers, f"Crawling {category['name']}", engine, concurrency,
+                                  on_product)
+
+def scrape_product_details(product_links, max_workers=MAX_WORKERS_DEFAULT, desc="Crawling",
+                           engine=ENGINE_DEFAULT, concurrency=None, on_product=None,
+                           scrape=scrape_mediamart_product, frontier=None):
+    """
+    Crawl chi tiết cho danh sách sản phẩm lấy từ trang danh mục
+    
+    Args:
+        product_links (iterable): Danh sách hoặc iterator sản phẩm (name, url) từ trang danh mục
+        max_workers (int): Số luồng tối đa (engine 'threads')
+        desc (str): Nhãn cho thanh tiến trình
+        engine (str): 'threads' dùng ThreadPoolExecutor, 'asyncio' dùng async_engine
+        concurrency (int, optional): Số request đồng thời tối đa (engine 'asyncio'), mặc định
+            async_engine.DEFAULT_CONCURRENCY
+        on_product (callable, optional): Gọi với mỗi sản phẩm crawl xong thay vì gom vào danh sách trả về
+        scrape (callable): Hàm lấy chi tiết từ URL, ví dụ IncrementalCrawler.scrape; chỉ engine 'threads'
+            dùng được hàm khác scrape_mediamart_product
+        frontier (CrawlFrontier, optional): Đánh dấu URL đang xử lý và URL lỗi (on_product vẫn gọi mark_done)
+        
+    Returns:
+        list: Danh sách các thông tin chi tiết sản phẩm
+    """
+    if engine == 'asyncio':
+        if scrape is not scrape_mediamart_product:
+            # Engine asyncio tự tải và parse trang, không gọi được hàm scrape đồng bộ
+            raise ValueError("engine 'asyncio' chỉ dùng được với scrape_mediamart_product")
+        from async_engine import DEFAULT_CONCURRENCY, crawl_products_async
+        
+        return crawl_products_async(product_links, concurrency=concurrency or DEFAULT_CONCURRENCY, desc=desc,
+                                    on_product=on_product, frontier=frontier)
+    
+    from tqdm import tqdm
+    
     detailed_products = []
     
+    def scrape_one(product):
+        if frontier is not None:
+            frontier.mark_in_flight(product['url'])
+        return scrape(product['url'])
+    
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Tạo các future cho mỗi sản phẩm
-            future_to_url = {
-                executor.submit(scrape_mediamart_product, product['url']): product
-                for product in product_links
-            }
-            
-            # Hiển thị tiến trình với tqdm
-            with tqdm(total=len(future_to_url), desc=f"Crawling {category['name']}") as pbar:
-                for future in concurrent.futures.as_completed(future_to_url):
-                    product = future_to_url[future]
-                    try:
-                        detail = future.result()
-                        if 'error' not in detail:
-                            # Thêm thông tin từ danh sách sản phẩm nếu cần
-                            for key in product:
-                                if key not in detail:
-                                    detail[key] = product[key]
-                            detailed_products.append(detail)
+        # Chỉ giữ tối đa WINDOW_FACTOR * max_workers task cùng lúc, sản phẩm được lấy dần từ iterator
+        results = windowed_map(scrape_one, product_links, max_workers)
+        
+        # Hiển thị tiến trình với tqdm
+        total = len(product_links) if hasattr(product_links, '__len__') else None
+        with tqdm(total=total, desc=desc) as pbar:
+            for product, future in results:
+                try:
+                    detail = future.result()
+                    if 'error' not in detail:
+                        # Thêm thông tin từ danh sách sản phẩm nếu cần
+                        for key in product:
+                            if key not in detail:
+                                detail[key] = product[key]
+                        if on_product is not None:
+                            on_product(detail)
                         else:
-                            print(f"Lỗi khi crawl sản phẩm {product['url']}: {detail['error']}")
-                    except Exception as e:
-                        print(f"Lỗi khi xử lý kết quả từ {product['url']}: {e}")
-                    pbar.update(1)
+                            detailed_products.append(detail)
+                        ITEMS.inc(stage='product', result='ok')
+                    else:
+                        if frontier is not None:
+                            frontier.mark_failed(product['url'], detail['error'])
+                        ITEMS.inc(stage='product', result='failed')
+                        print(f"Lỗi khi crawl sản phẩm {product['url']}: {detail['error']}")
+                except Exception as e:
+                    if frontier is not None:
+                        frontier.mark_failed(product['url'], e)
+                    ITEMS.inc(stage='product', result='failed')
+                    print(f"Lỗi khi xử lý kết quả từ {product['url']}: {e}")
+                pbar.update(1)
     
     except Exception as e:
         print(f"Lỗi khi crawl sản phẩm: {e}")
     
     return detailed_products
 
-def main(auto_mode=True, max_pages=None, max_products=None, max_workers=MAX_WORKERS_DEFAULT):
+def crawl_category_to_file(category, all_sink, data_dir, compression='none', max_pages=None,
+                           max_workers=MAX_WORKERS_DEFAULT, max_products=None, engine=ENGINE_DEFAULT,
+                           concurrency=None, dedup=None):
+    """
+    Crawl một danh mục, ghi từng sản phẩm vào file riêng của danh mục và file tổng hợp
+    
+    Khi có dedup, sản phẩm đã crawl ở danh mục trước không được crawl lại nên không có trong file
+    của danh mục này; file tổng hợp vẫn có đủ và liệt kê mọi danh mục của sản phẩm.
+    
+    Returns:
+        int: Số sản phẩm đã lưu
+    """
+    safe_name = "".join([c if c.isalnum() else "_" for c in category['name']])
+    category_file = os.path.join(data_dir, jsonl_filename(f"{safe_name}_products", compression))
+    
+    duplicates_before = dedup.duplicates if dedup is not None else 0
+    with JsonlSink(category_file, compression) as category_sink:
+        def on_product(detail):
+            category_sink.write(detail)
+            all_sink.write(detail)
+        
+        crawl_category_products(category, max_pages, max_workers, max_products, engine, concurrency, dedup,
+                                on_product=on_product)
+    
+    if category_sink.count:
+        print(f"Đã lưu {category_sink.count} sản phẩm vào {category_file}")
+    else:
+        os.remove(category_file)
+    skipped = dedup.duplicates - duplicates_before if dedup is not None else 0
+    if skipped:
+        print(f"Lưu ý: {skipped} sản phẩm trùng với danh mục khác không được ghi lại vào file của "
+              f"{category['name']}, xem file all_products")
+    return category_sink.count
+
+def estimate_catalog_size(state_file=STATE_FILE_DEFAULT, incremental_file=INCREMENTAL_FILE_DEFAULT):
+    """
+    Ước lượng số URL sản phẩm từ file trạng thái và file incremental của các lần crawl trước
+    
+    Returns:
+        int or None: None khi chưa có lần crawl nào
+    """
+    known = max(frontier_urls(state_file), incremental_urls(incremental_file))
+    return int(known * CATALOG_HEADROOM) or None
+
+def print_run_stats(data_dir):
+    """
+    In thống kê HTTP và lưu bản tóm tắt metrics (thời gian từng giai đoạn, mã trạng thái, byte) ra file JSON
+    """
+    print(f"\nThống kê HTTP: {format_fetch_stats()}")
+    for host, limiter in limiter_stats().items():
+        print(f"  {host}: {limiter['rate']} req/s, tối đa {limiter['concurrency_limit']} request đồng thời, "
+              f"{limiter['throttled']} lần bị chặn/quá tải")
+    metrics_file = os.path.join(data_dir, f"metrics_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    write_summary(metrics_file)
+    print(f"Đã lưu metrics vào {metrics_file}")
+
+def export_parquet(all_products_file, data_dir, timestamp):
+    """
+    Xuất file kết quả JSONL sang Parquet (cần pyarrow)
+    """
+    from parquet_export import export_products_to_parquet
+    
+    export_products_to_parquet(read_jsonl(all_products_file), os.path.join(data_dir, f"all_products_{timestamp}"))
+
+def build_spec_index(all_products_file, spec_index_file=None):
+    """
+    Tạo chỉ mục thông số từ file kết quả JSONL và lưu ra file
+    """
+    from specindex import SPEC_INDEX_FILE_DEFAULT, SpecIndex
+    
+    spec_index_file = spec_index_file or SPEC_INDEX_FILE_DEFAULT
+    index = SpecIndex.build(read_jsonl(all_products_file))
+    index.save(spec_index_file)
+    print(f"Đã tạo chỉ mục thông số cho {len(index.docs)} sản phẩm, lưu vào {spec_index_file}")
+
+def main(auto_mode=True, max_pages=None, max_products=None, max_workers=MAX_WORKERS_DEFAULT,
+         engine=ENGINE_DEFAULT, concurrency=None, resume=False, state_file=STATE_FILE_DEFAULT,
+         incremental=False, incremental_file=INCREMENTAL_FILE_DEFAULT, compression='none',
+         parquet=False, menu_ttl=MENU_TTL_DEFAULT, fast=False, images=False, image_dir=None,
+         image_workers=None, thumbnail_size=None, price_history=False,
+         price_history_file=None, schedule=False, schedule_file=None,
+         category_budget=None, spec_index=False, spec_index_file=None, discovery='listing'):
     """
     Hàm chính để chạy crawler
     
+    Module của các tính năng tùy chọn (ảnh, lịch sử giá, lập lịch, sitemap, chỉ mục thông số, Parquet,
+    engine asyncio) chỉ được import khi tính năng đó được bật; tham số file/cấu hình của chúng để None
+    thì dùng giá trị mặc định của module tương ứng.
+    
     Args:
         auto_mode (bool): Nếu True, sẽ tự động crawl tất cả sản phẩm mà không cần tương tác
         max_pages (int, optional): Số trang tối đa cần crawl cho mỗi danh mục
         max_products (int, optional): Số sản phẩm tối đa cần crawl
         max_workers (int): Số luồng tối đa để crawl đồng thời
+        engine (str): 'threads' dùng ThreadPoolExecutor, 'asyncio' dùng aiohttp + process pool
+        concurrency (int, optional): Số request đồng thời tối đa khi dùng engine 'asyncio'
+        resume (bool): Tiếp tục lần crawl tất cả sản phẩm (tùy chọn 5) bị dừng giữa chừng
+        state_file (str): File SQLite lưu trạng thái crawl
+        incremental (bool): Dùng ETag/Last-Modified và hash nội dung để chỉ parse trang đã thay đổi (tùy chọn 5)
+        incremental_file (str): File SQLite lưu dữ liệu của các lần crawl trước
+        compression (str): Nén file kết quả JSONL: 'none', 'gzip' hoặc 'zstd'
+        parquet (bool): Xuất thêm file Parquet có kiểu dữ liệu (giá VND, danh sách, bảng thông số)
+        menu_ttl (float, optional): Số giây file cache menu còn hạn; None để luôn dùng cache
+        fast (bool): Lấy giá, khuyến mãi, tồn kho từ trang danh mục và chỉ crawl chi tiết sản phẩm mới
+            hoặc có ô sản phẩm thay đổi (tùy chọn 5, bao gồm incremental)
+        images (bool): Tải ảnh sản phẩm ở nền trong khi crawl, mỗi ảnh chỉ tải và lưu một lần
+        image_dir (str, optional): Thư mục lưu ảnh và chỉ mục ảnh
+        image_workers (int, optional): Số luồng tải ảnh đồng thời
+        thumbnail_size (int, optional): Cạnh dài nhất của thumbnail; None để không tạo (cần Pillow)
+        price_history (bool): Ghi giá, giá gốc và mức giảm giá vào file lịch sử giá (chỉ lưu khi thay đổi)
+        price_history_file (str, optional): File SQLite lịch sử giá
+        schedule (bool): Chỉ quét các danh mục nhiều khả năng đã thay đổi, dựa trên tần suất thay đổi
+            của danh sách sản phẩm ở các lần crawl trước (tùy chọn 5)
+        schedule_file (str, optional): File SQLite lưu lịch sử thay đổi của các danh mục
+        category_budget (int, optional): Số sản phẩm tối đa cần quét trong danh sách của các danh mục được chọn
+        spec_index (bool): Tạo chỉ mục thông số (lọc, đếm facet theo thông số, khoảng giá) từ file kết quả
+        spec_index_file (str, optional): File lưu chỉ mục thông số
+        discovery (str): Cách tìm URL sản phẩm ở tùy chọn 5: 'listing' duyệt trang danh mục, 'sitemap'
+            đọc sitemap của trang (ít request hơn; khi bật incremental, bỏ qua sản phẩm có lastmod
+            cũ hơn lần crawl trước)
     """
     # Tạo thư mục data nếu chưa tồn tại
     data_dir = 'data'
@@ -156,7 +322,7 @@ def main(auto_mode=True, max_pages=None, max_products=None, max_workers=MAX_WORK
         os.makedirs(data_dir)
     try:
         # Lấy danh sách danh mục từ menu
-        categories = get_menu_categories()
+        categories = get_menu_categories(menu_ttl)
         
         # Đảm bảo categories không phải là None
         if categories is None:
@@ -192,24 +358,43 @@ def main(auto_mode=True, max_pages=None, max_products=None, max_workers=MAX_WORK
             max_workers_input = input("Số luồng tối đa để crawl đồng thời (mặc định 5): ")
             max_workers = int(max_workers_input) if max_workers_input else MAX_WORKERS_DEFAULT
         
-        all_products = []
+        # Mỗi luồng (tải trang danh mục + crawl chi tiết) giữ một kết nối keep-alive riêng trong pool
+        configure_fetcher(max_workers + LISTING_WORKERS_DEFAULT * PAGE_WORKERS)
+        
+        # Một sản phẩm có thể nằm trong nhiều danh mục, chỉ crawl chi tiết một lần
+        # Kích thước ước lượng từ các lần trước: danh mục rất lớn thì dùng Bloom filter
+        dedup = UrlDeduper(estimate_catalog_size(state_file, incremental_file))
+        
+        # Ghi từng sản phẩm ra file ngay khi crawl xong thay vì giữ tất cả trong bộ nhớ
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        all_products_file = os.path.join(data_dir, jsonl_filename(f"all_products_{timestamp}", compression))
+        # Ảnh được tải ở nền bởi luồng riêng, không làm chậm việc crawl trang HTML
+        media = None
+        if images:
+            from media import IMAGE_DIR_DEFAULT, MEDIA_WORKERS_DEFAULT, MediaDownloader
+            
+            media = MediaDownloader(image_dir or IMAGE_DIR_DEFAULT, image_workers or MEDIA_WORKERS_DEFAULT,
+                                    thumbnail_size)
+        history = None
+        if price_history:
+            from pricehistory import PRICE_HISTORY_FILE_DEFAULT, PriceHistory
+            
+            price_history_file = price_history_file or PRICE_HISTORY_FILE_DEFAULT
+            history = PriceHistory(price_history_file)
+        
+        def on_write(detail):
+            if media is not None:
+                media.submit_product(detail)
+            if history is not None:
+                history.record(detail)
+        
+        all_sink = JsonlSink(all_products_file, compression, on_write=on_write)
         
         if choice == '1':
             category_index = int(input(f"Chọn danh mục để crawl (1-{len(categories)}): ")) - 1
             if 0 <= category_index < len(categories):
-                selected_category = categories[category_index]
-                products = crawl_category_products(selected_category, max_pages, max_workers, max_products)
-                all_products.extend(products)
-                
-                if products:
-                    # Lưu dữ liệu của danh mục này vào file riêng
-                    category_name = selected_category['name']
-                    safe_name = "".join([c if c.isalnum() else "_" for c in category_name])
-                    
-                    json_file = os.path.join(data_dir, f"{safe_name}_products.json")
-                    csv_file = os.path.join(data_dir, f"{safe_name}_products.csv")
-                    
-                    save_products_to_json(products, json_file)
+                crawl_category_to_file(categories[category_index], all_sink, data_dir, compression,
+                                       max_pages, max_workers, max_products, engine, concurrency, dedup)
         
         elif choice == '2':
             indices = input(f"Nhập các số từ 1-{len(categories)} của danh mục cần crawl (cách nhau bởi dấu phẩy): ")
@@ -217,154 +402,331 @@ def main(auto_mode=True, max_pages=None, max_products=None, max_workers=MAX_WORK
             
             for idx in indices:
                 if 0 <= idx < len(categories):
-                    selected_category = categories[idx]
-                    products = crawl_category_products(selected_category, max_pages, max_workers, max_products)
-                    all_products.extend(products)
-                    
-                    if products:
-                        # Lưu dữ liệu của danh mục này vào file riêng
-                        category_name = selected_category['name']
-                        safe_name = "".join([c if c.isalnum() else "_" for c in category_name])
-                        
-                        json_file = os.path.join(data_dir, f"{safe_name}_products.json")
-                        csv_file = os.path.join(data_dir, f"{safe_name}_products.csv")
-                        
-                        save_products_to_json(products, json_file)
+                    crawl_category_to_file(categories[idx], all_sink, data_dir, compression,
+                                           max_pages, max_workers, max_products, engine, concurrency, dedup)
         
         elif choice == '3':
             for category in categories:
-                products = crawl_category_products(category, max_pages, max_workers, max_products)
-                all_products.extend(products)
-                
-                if products:
-                    # Lưu dữ liệu của danh mục này vào file riêng
-                    category_name = category['name']
-                    safe_name = "".join([c if c.isalnum() else "_" for c in category_name])
-                    
-                    json_file = os.path.join(data_dir, f"{safe_name}_products.json")
-                    csv_file = os.path.join(data_dir, f"{safe_name}_products.csv")
-                    save_products_to_json(products, json_file)
+                crawl_category_to_file(category, all_sink, data_dir, compression,
+                                       max_pages, max_workers, max_products, engine, concurrency, dedup)
         
         elif choice == '4':
             url = input("Nhập URL cụ thể để crawl: ")
             if url.startswith("http"):
                 category_name = input("Nhập tên danh mục: ")
                 category = {'name': category_name, 'url': url}
-                products = crawl_category_products(category, max_pages, max_workers, max_products)
-                all_products.extend(products)
-                
-                if products:
-                    # Lưu dữ liệu của danh mục này vào file riêng
-                    safe_name = "".join([c if c.isalnum() else "_" for c in category_name])
-                    
-                    json_file = os.path.join(data_dir, f"{safe_name}_products.json")
-                    csv_file = os.path.join(data_dir, f"{safe_name}_products.csv")
-                    
-                    save_products_to_json(products, json_file)
-
+                crawl_category_to_file(category, all_sink, data_dir, compression,
+                                       max_pages, max_workers, max_products, engine, concurrency, dedup)
         
         elif choice == '5':
             print("\nCrawl tất cả sản phẩm từ tất cả danh mục...")
-            # Tạo một danh mục tổng hợp tất cả URL sản phẩm
-            all_product_links = []
             
-            # Đầu tiên, thu thập tất cả link sản phẩm từ tất cả danh mục
-            print("Thu thập danh sách sản phẩm từ tất cả danh mục...")
-            for category in categories:
-                print(f"Đang quét danh mục: {category['name']}")
-                category_links = get_product_links(category['url'], max_pages)
-                if category_links:
-                    print(f"Tìm thấy {len(category_links)} sản phẩm trong danh mục {category['name']}")
-                    all_product_links.extend(category_links)
-                    
-            # Giới hạn số lượng sản phẩm nếu cần
-            if max_products and len(all_product_links) > max_products:
-                print(f"Giới hạn tổng số sản phẩm cần crawl thành {max_products} (từ tổng số {len(all_product_links)})")
-                all_product_links = all_product_links[:max_products]
+            # Trạng thái crawl lưu trên đĩa để có thể tiếp tục sau khi bị dừng giữa chừng
+            frontier = CrawlFrontier(state_file, resume=resume)
+            if resume:
+                print(f"Tiếp tục từ {state_file}: {frontier.counts()}")
+                # Sản phẩm đã hoàn thành ở lần chạy trước được ghi lại vào file kết quả mới
+                for detail in frontier.iter_products():
+                    all_sink.write(detail)
             
-            print(f"\nTổng cộng tìm thấy {len(all_product_links)} sản phẩm từ tất cả danh mục")
+            def on_product(detail):
+                frontier.mark_done(detail['url'], detail)
+                all_sink.write(detail)
             
-            if not all_product_links:
-                print("Không tìm thấy sản phẩm nào để crawl!")
-            else:
-                # Crawl chi tiết từng sản phẩm với đa luồng
-                print("Bắt đầu crawl chi tiết sản phẩm...")
-                
-                # Tạo một category giả để sử dụng với hàm crawl_category_products
-                pseudo_category = {
-                    'name': 'all_products',
-                    'url': BASE_URL
-                }
+            # Chế độ incremental chỉ parse lại những trang đã thay đổi so với lần crawl trước
+            incremental_crawler = IncrementalCrawler(incremental_file) if incremental or fast else None
+            if incremental_crawler is not None and engine == 'asyncio':
+                print("Chế độ incremental dùng engine threads")
+            
+            # Danh mục bị cắt bởi max_pages/max_products không được ghi vào lịch như đã quét xong
+            full_listing = not (max_pages or max_products)
+            # Chỉ coi là "đã bị xóa" khi đã crawl toàn bộ danh mục
+            complete = full_listing
+            
+            # Danh mục thay đổi thường xuyên được quét lại thường xuyên, danh mục ổn định thì thưa hơn
+            scheduler = None
+            if schedule:
+                from scheduler import SCHEDULE_FILE_DEFAULT, CategoryScheduler
                 
-        # Crawl với đa luồng
-                detailed_products = []
-                try:
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                        # Tạo các future cho mỗi sản phẩm
-                        future_to_url = {
-                            executor.submit(scrape_mediamart_product, product['url']): product
-                            for product in all_product_links
-                        }
-                        
-                        # Hiển thị tiến trình với tqdm
-                        with tqdm(total=len(future_to_url), desc="Crawling tất cả sản phẩm") as pbar:
-                            for future in concurrent.futures.as_completed(future_to_url):
-                                product = future_to_url[future]
-                                try:
-                                    detail = future.result()
-                                    if detail and 'error' not in detail:
-                                        # Thêm thông tin từ danh sách sản phẩm nếu cần
-                                        for key in product:
-                                            if key not in detail:
-                                                detail[key] = product[key]
-                                        detailed_products.append(detail)
-                                    else:
-                                        print(f"Lỗi khi crawl sản phẩm {product['url']}: {detail.get('error', 'Unknown error')}")
-                                except Exception as e:
-                                    print(f"Lỗi khi xử lý kết quả từ {product['url']}: {e}")
-                                    # Vẫn tiếp tục với sản phẩm tiếp theo
-                                finally:
-                                    # Đảm bảo thanh tiến trình luôn được cập nhật, kể cả khi có lỗi
-                                    pbar.update(1)
+                scheduler = CategoryScheduler(schedule_file or SCHEDULE_FILE_DEFAULT)
+                scheduler.sync_tree(load_menu_tree(ttl=menu_ttl))
+                all_categories = categories
+                categories = scheduler.select(categories, category_budget)
+                print(f"Lập lịch: quét {len(categories)}/{len(all_categories)} danh mục có khả năng đã thay đổi")
+                if discovery == 'listing' and len(categories) < len(all_categories):
+                    # Sản phẩm của danh mục không được quét lần này không phải là đã bị xóa
+                    complete = False
+                if engine == 'asyncio':
+                    print("Chế độ lập lịch dùng engine threads")
+            
+            if discovery == 'sitemap':
+                from sitemap import discover_products
                 
-                except Exception as e:
-                    print(f"Lỗi khi crawl sản phẩm: {e}")
+                # Toàn bộ danh sách sản phẩm lấy từ vài file sitemap thay vì hàng nghìn trang danh mục
+                print("Đọc danh sách sản phẩm từ sitemap...")
                 
-                # Lưu tất cả sản phẩm vào file
-                if detailed_products:
-                    all_products.extend(detailed_products)
-                    
-                    # Tạo tên file với timestamp
-                    timestamp = time.strftime("%Y%m%d_%H%M%S")
-                    all_json_file = os.path.join(data_dir, f"all_products_{timestamp}.json")
-                    all_csv_file = os.path.join(data_dir, f"all_products_{timestamp}.csv")
-                    
-                    print(f"\nLưu {len(detailed_products)} sản phẩm vào file...")
-                    save_products_to_json(detailed_products, all_json_file)
-                    
-                    print(f"\nĐã crawl và lưu thành công {len(detailed_products)} sản phẩm")
-        
-        # Lưu tất cả dữ liệu vào file tổng hợp
-        if all_products:
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            all_json_file = os.path.join(data_dir, f"all_products_{timestamp}.json")
-            all_csv_file = os.path.join(data_dir, f"all_products_{timestamp}.csv")
+                # Sản phẩm có lastmod cũ hơn lần crawl trước được dùng lại và ghi thẳng ra file kết quả
+                failed_sitemaps = []
+                # Sản phẩm dùng lại cũng tính vào max_products, cùng với sản phẩm còn dang dở khi resume
+                limit = max_products
+                if max_products and resume:
+                    counts = frontier.counts()
+                    limit = max(max_products - counts[PENDING] - counts[FAILED], 0)
+                discovered = discover_products(
+                    dedup=dedup, frontier=frontier, on_reused=on_product, failed=failed_sitemaps, limit=limit,
+                    reuse=incremental_crawler.reuse_not_modified if incremental_crawler is not None else None
+                )
+                pending = itertools.chain(frontier.iter_pending(), discovered) if resume else discovered
+                scrape_product_details(
+                    itertools.islice(pending, max_products), max_workers, "Crawling tất cả sản phẩm",
+                    'threads' if incremental_crawler is not None else engine, concurrency, on_product=on_product,
+                    scrape=incremental_crawler.scrape if incremental_crawler else scrape_mediamart_product,
+                    frontier=frontier
+                )
+                if failed_sitemaps:
+                    # Sản phẩm trong sitemap không đọc được vẫn có thể còn trên trang
+                    print(f"Không đọc được {len(failed_sitemaps)} sitemap, không xác định sản phẩm bị xóa")
+                    complete = False
+            elif engine == 'asyncio' and incremental_crawler is None and scheduler is None:
+                # Engine asyncio cần toàn bộ danh sách trước, nhưng vẫn quét các danh mục song song
+                print("Thu thập danh sách sản phẩm từ tất cả danh mục...")
+                all_product_links = collect_product_links(categories, max_pages, dedup=dedup)
+                for product in all_product_links:
+                    frontier.add(product)
+                counts = frontier.counts()
+                remaining = counts[PENDING] + counts[FAILED]
+                if max_products:
+                    remaining = min(remaining, max_products)
+                del all_product_links
+                print(f"\nTổng cộng còn {remaining} sản phẩm cần crawl từ tất cả danh mục")
+                # Đọc dần từ file trạng thái thay vì nạp toàn bộ danh sách vào bộ nhớ
+                scrape_product_details(
+                    itertools.islice(frontier.iter_pending(), remaining), max_workers,
+                    "Crawling tất cả sản phẩm", engine, concurrency, on_product=on_product, frontier=frontier
+                )
+            else:
+                # Quét danh mục và crawl chi tiết cùng lúc: sản phẩm được xử lý ngay khi tìm thấy
+                print("Bắt đầu quét danh mục và crawl chi tiết sản phẩm song song...")
+                crawl_pipeline(
+                    categories, max_pages, max_products, max_workers, desc="Crawling tất cả sản phẩm",
+                    dedup=dedup, frontier=frontier, on_product=all_sink.write,
+                    scrape=incremental_crawler.scrape if incremental_crawler else scrape_mediamart_product,
+                    # Chế độ nhanh: bỏ qua trang chi tiết khi ô sản phẩm trên trang danh mục không đổi
+                    tile_fields=fast, reuse=incremental_crawler.reuse_unchanged_tile if fast else None,
+                    on_category=scheduler.record if scheduler and full_listing else None
+                )
+            
+            if incremental_crawler is not None:
+                # Ghi dần từ SQLite: ở lần chạy đầu mọi sản phẩm đều là "mới"
+                delta_file = os.path.join(data_dir, jsonl_filename(f"delta_{timestamp}", compression))
+                delta = incremental_crawler.write_delta(delta_file, include_removed=complete, compression=compression)
+                incremental_crawler.close()
+                print(f"Incremental: {incremental_crawler.stats}")
+                print(f"Đã lưu {delta['new']} sản phẩm mới, {delta['changed']} thay đổi, "
+                      f"{delta['removed']} bị xóa vào {delta_file}")
             
-            save_products_to_json(all_products, all_json_file)
+            if scheduler is not None:
+                print(f"Lập lịch: {scheduler.stats}")
+                scheduler.close()
             
-            print(f"\nTổng cộng đã crawl {len(all_products)} sản phẩm")
+            print(f"Trạng thái crawl: {frontier.counts()}")
+            frontier.close()
+        
+        all_sink.close()
+        if all_sink.count:
+            print(f"\nTổng cộng đã crawl {all_sink.count} sản phẩm, lưu vào {all_products_file}")
+            if dedup.late_categories:
+                # Sản phẩm được ghi ngay khi crawl xong, có thể trước khi danh mục khác liệt kê lại nó
+                merged = merge_categories(all_products_file, dedup, compression)
+                print(f"Đã bổ sung danh mục cho {merged} sản phẩm")
+            if parquet:
+                # Đọc lại file JSONL theo luồng, ghi Parquet theo từng row group
+                export_parquet(all_products_file, data_dir, timestamp)
+            if spec_index:
+                build_spec_index(all_products_file, spec_index_file)
+            if dedup.duplicates:
+                print(f"Đã bỏ qua {dedup.duplicates} URL trùng lặp giữa các danh mục")
+        else:
+            os.remove(all_products_file)
+            print("Không tìm thấy sản phẩm nào để crawl!")
+        
+        if media is not None:
+            print("Chờ tải xong ảnh sản phẩm...")
+            print(f"Ảnh: {media.close()}")
+        if history is not None:
+            history.close()
+            print(f"Lịch sử giá: {history.stats}, lưu vào {price_history_file}")
     
     except Exception as e:
         print(f"Lỗi: {e}")
+    
+    print_run_stats(data_dir)
+
+def main_distributed(role, queue_file=None, max_workers=MAX_WORKERS_DEFAULT, resume=False,
+                     compression='none', parquet=False, menu_ttl=MENU_TTL_DEFAULT, worker_id=None,
+                     spec_index=False, spec_index_file=None):
+    """
+    Crawl tất cả sản phẩm trên nhiều tiến trình/máy dùng chung một hàng đợi
+    
+    Args:
+        role (str): 'coordinator' chia việc và gộp kết quả, 'worker' nhận và xử lý việc
+        queue_file (str, optional): File SQLite hàng đợi, mọi tiến trình phải thấy cùng một file
+        max_workers (int): Số luồng đồng thời của mỗi worker
+        resume (bool): Coordinator giữ lại hàng đợi của lần chạy bị dừng
+        compression (str): Nén file kết quả JSONL của coordinator
+        parquet (bool): Coordinator xuất thêm file Parquet
+        menu_ttl (float, optional): Số giây file cache menu còn hạn
+        worker_id (str, optional): Tên worker, mặc định '<hostname>-<pid>'
+        spec_index (bool): Coordinator tạo chỉ mục thông số từ file kết quả
+        spec_index_file (str, optional): File lưu chỉ mục thông số
+    """
+    data_dir = 'data'
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        if role == 'worker':
+            configure_fetcher(max_workers * PAGE_WORKERS)
+            from distributed import QUEUE_FILE_DEFAULT, run_worker
+            
+            run_worker(queue_file or QUEUE_FILE_DEFAULT, max_workers, worker_id=worker_id)
+        else:
+            from distributed import QUEUE_FILE_DEFAULT, run_coordinator
+            
+            categories = get_menu_categories(menu_ttl) or []
+            print(f"Tìm thấy {len(categories)} danh mục")
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            all_products_file = os.path.join(data_dir, jsonl_filename(f"all_products_{timestamp}", compression))
+            with JsonlSink(all_products_file, compression) as all_sink:
+                run_coordinator(categories, all_sink, queue_file or QUEUE_FILE_DEFAULT, resume=resume)
+            print(f"Đã lưu {all_sink.count} sản phẩm vào {all_products_file}")
+            if parquet and all_sink.count:
+                export_parquet(all_products_file, data_dir, timestamp)
+            if spec_index:
+                build_spec_index(all_products_file, spec_index_file)
+    except Exception as e:
+        print(f"Lỗi: {e}")
+    
+    print_run_stats(data_dir)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl sản phẩm từ mediamart.vn")
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default=ENGINE_DEFAULT,
+                        help="Cách crawl chi tiết sản phẩm (mặc định: threads)")
+    parser.add_argument('--max-workers', type=int, default=10,
+                        help="Số luồng đồng thời cho engine threads (mặc định: 10)")
+    parser.add_argument('--concurrency', type=int,
+                        help="Số request đồng thời cho engine asyncio (mặc định: 200)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Tiếp tục lần crawl trước từ file trạng thái thay vì bắt đầu lại")
+    parser.add_argument('--state-file', default=STATE_FILE_DEFAULT,
+                        help=f"File SQLite lưu trạng thái crawl (mặc định: {STATE_FILE_DEFAULT})")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Chỉ parse lại sản phẩm đã thay đổi và ghi file delta (mới/thay đổi/bị xóa)")
+    parser.add_argument('--incremental-file', default=INCREMENTAL_FILE_DEFAULT,
+                        help=f"File SQLite lưu dữ liệu các lần crawl trước (mặc định: {INCREMENTAL_FILE_DEFAULT})")
+    parser.add_argument('--fast', action='store_true',
+                        help="Lấy giá/tồn kho từ trang danh mục, chỉ crawl chi tiết sản phẩm mới hoặc đã thay đổi")
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='none',
+                        help="Nén file kết quả JSONL (mặc định: none)")
+    parser.add_argument('--parquet', action='store_true',
+                        help="Xuất thêm file Parquet (cần pyarrow)")
+    parser.add_argument('--parser', choices=PARSER_BACKENDS, default=PARSER_BACKEND,
+                        help=f"Bộ parse HTML trang chi tiết (mặc định: {PARSER_BACKEND})")
+    parser.add_argument('--menu-ttl', type=float, default=MENU_TTL_DEFAULT / 3600,
+                        help="Số giờ file cache menu còn hạn trước khi crawl lại (mặc định: 24)")
+    parser.add_argument('--max-rate', type=float, default=MAX_RATE,
+                        help=f"Số request/giây tối đa cho mỗi host; tốc độ thực tế tự điều chỉnh theo phản hồi (mặc định: {MAX_RATE:g})")
+    parser.add_argument('--cache', choices=CACHE_MODES, default='off',
+                        help="Cache phản hồi HTTP trên đĩa: use (dùng cache còn hạn), cache-only (không truy cập mạng), "
+                             "refresh (tải lại và ghi đè) (mặc định: off)")
+    parser.add_argument('--cache-file',
+                        help="File SQLite của cache HTTP (mặc định: data/http_cache.db)")
+    parser.add_argument('--cache-max-mb', type=float,
+                        help="Dung lượng tối đa của cache (MB, đã nén) trước khi xóa mục cũ nhất (mặc định: 1024)")
+    parser.add_argument('--cache-ttl', type=float,
+                        help="Số giờ một mục cache còn hạn ở chế độ use (mặc định: 168)")
+    parser.add_argument('--metrics-port', type=int, nargs='?', const=METRICS_PORT_DEFAULT,
+                        help=f"Mở cổng HTTP phục vụ /metrics (Prometheus) và /metrics.json; "
+                             f"không kèm số thì dùng cổng {METRICS_PORT_DEFAULT} (mặc định: tắt)")
+    parser.add_argument('--images', action='store_true',
+                        help="Tải ảnh sản phẩm ở nền, lưu theo hash nội dung để mỗi ảnh chỉ lưu một lần")
+    parser.add_argument('--image-dir',
+                        help="Thư mục lưu ảnh (mặc định: data/images)")
+    parser.add_argument('--image-workers', type=int,
+                        help="Số luồng tải ảnh đồng thời (mặc định: 8)")
+    parser.add_argument('--thumbnail-size', type=int, default=0,
+                        help="Tạo thumbnail với cạnh dài nhất này, ví dụ 256 (mặc định: 0, không tạo; cần Pillow)")
+    parser.add_argument('--price-history', action='store_true',
+                        help="Ghi lịch sử giá vào SQLite, chỉ lưu khi giá hoặc khuyến mãi thay đổi")
+    parser.add_argument('--price-history-file',
+                        help="File lịch sử giá (mặc định: data/price_history.db)")
+    parser.add_argument('--schedule', action='store_true',
+                        help="Chỉ quét các danh mục nhiều khả năng đã thay đổi kể từ lần crawl trước")
+    parser.add_argument('--schedule-file',
+                        help="File lịch sử thay đổi của danh mục (mặc định: data/schedule.db)")
+    parser.add_argument('--category-budget', type=int,
+                        help="Số sản phẩm tối đa trong danh sách các danh mục được quét mỗi lần (mặc định: không giới hạn)")
+    parser.add_argument('--spec-index', action='store_true',
+                        help="Tạo chỉ mục thông số sản phẩm để lọc và đếm facet nhanh sau khi crawl")
+    parser.add_argument('--spec-index-file',
+                        help="File chỉ mục thông số (mặc định: data/spec_index.pkl)")
+    parser.add_argument('--discovery', choices=['listing', 'sitemap'], default='listing',
+                        help="Tìm URL sản phẩm bằng cách duyệt trang danh mục hoặc đọc sitemap (mặc định: listing)")
+    parser.add_argument('--serve', action='store_true',
+                        help="Chạy API chỉ đọc trên chỉ mục thông số thay vì crawl; tự nạp lại khi có lần crawl mới")
+    parser.add_argument('--port', type=int,
+                        help="Cổng của API (mặc định: 7860), cũng phục vụ /metrics")
+    parser.add_argument('--role', choices=['standalone', 'coordinator', 'worker'], default='standalone',
+                        help="standalone: crawl trong một tiến trình; coordinator/worker: crawl phân tán qua hàng đợi chung")
+    parser.add_argument('--queue-file',
+                        help="File SQLite hàng đợi dùng chung cho coordinator và worker (mặc định: data/work_queue.db)")
+    parser.add_argument('--worker-id', help="Tên worker (mặc định: <hostname>-<pid>)")
+    args = parser.parse_args()
+    if args.compression == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        # Báo lỗi ngay thay vì khi mở file kết quả, lúc đã crawl được một phần
+        parser.error("--compression zstd cần gói zstandard (pip install zstandard)")
+    if args.engine == 'asyncio' and (args.incremental or args.fast or args.schedule):
+        # Các chế độ này cần fetch có điều kiện hoặc quét theo danh mục, chỉ có ở engine threads
+        parser.error("--engine asyncio không dùng được với --incremental, --fast hay --schedule")
+    if args.serve:
+        from api import API_PORT_DEFAULT, serve as serve_api
+        from specindex import SPEC_INDEX_FILE_DEFAULT
+        
+        serve_api(args.port or API_PORT_DEFAULT, args.spec_index_file or SPEC_INDEX_FILE_DEFAULT)
+        raise SystemExit
+    
+    set_parser_backend(args.parser)
+    configure_rate_limit(max_rate=args.max_rate)
+    # Để trống thì configure_cache dùng giá trị mặc định của httpcache
+    configure_cache(args.cache, args.cache_file,
+                    int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb else None,
+                    args.cache_ttl * 3600 if args.cache_ttl is not None else None)
+    if args.metrics_port:
+        try:
+            start_http_server(args.metrics_port)
+            print(f"Metrics: http://localhost:{args.metrics_port}/metrics")
+        except OSError as e:
+            # Ví dụ nhiều worker trên cùng một máy: chỉ tiến trình đầu tiên giữ được cổng
+            print(f"Không mở được cổng metrics {args.metrics_port}: {e}")
+    
     start_time = time.time()
     # Mặc định chạy ở chế độ tự động với các tham số sau
     # - auto_mode=True: Tự động crawl tất cả sản phẩm mà không cần tương tác
     # - max_pages=None: Không giới hạn số trang
     # - max_products=None: Không giới hạn số sản phẩm
     # - max_workers=10: Sử dụng 10 luồng đồng thời để tăng tốc độ
-    main(auto_mode=True, max_pages=None, max_products=None, max_workers=10)
+    if args.role != 'standalone':
+        main_distributed(args.role, args.queue_file, args.max_workers, args.resume, args.compression,
+                         args.parquet, args.menu_ttl * 3600, args.worker_id, args.spec_index, args.spec_index_file)
+    else:
+        main(auto_mode=True, max_pages=None, max_products=None, max_workers=args.max_workers,
+             engine=args.engine, concurrency=args.concurrency, resume=args.resume, state_file=args.state_file,
+             incremental=args.incremental, incremental_file=args.incremental_file, compression=args.compression,
+             parquet=args.parquet, menu_ttl=args.menu_ttl * 3600, fast=args.fast, images=args.images,
+             image_dir=args.image_dir, image_workers=args.image_workers,
+             thumbnail_size=args.thumbnail_size or None, price_history=args.price_history,
+             price_history_file=args.price_history_file, schedule=args.schedule,
+             schedule_file=args.schedule_file, category_budget=args.category_budget, spec_index=args.spec_index,
+             spec_index_file=args.spec_index_file, discovery=args.discovery)
     end_time = time.time()
     
     # Hiển thị tổng thời gian chạy
@@ -0,0 +1,218 @@
+import hashlib
+import math
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sinks import JsonlSink, read_jsonl
+from storage import atomic_path
+
+# Tham số theo dõi quảng cáo, không ảnh hưởng đến nội dung trang
+TRACKING_PARAMS = {'gclid', 'fbclid', 'zarsrc', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content'}
+
+BLOOM_THRESHOLD = 2_000_000  # Từ số URL này trở lên nên dùng Bloom filter
+
+
+def canonicalize_url(url):
+    """
+    Normalize a product URL so the same page always maps to the same string
+
+    Lowercases scheme and host, drops 'www.', default ports, fragments,
+    tracking parameters and trailing slashes, and sorts the query string.
+
+    Args:
+        url (str): Absolute URL
+
+    Returns:
+        str: Canonical form of the URL
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or 'https'
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and not (scheme == 'http' and parts.port == 80) and not (scheme == 'https' and parts.port == 443):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS
+    ]
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ''))
+
+
+def url_key(url):
+    """
+    64-bit integer digest of a URL, used wherever a compact key is needed
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class SeenSet:
+    """
+    Exact set of URLs stored as 64-bit digests instead of full strings
+    """
+
+    def __init__(self):
+        self._digests = set()
+
+    def add(self, key):
+        """
+        Add a key, returning True if it was not already present
+        """
+        digest = url_key(key)
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+    def __contains__(self, key):
+        return url_key(key) in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+
+class BloomFilter:
+    """
+    Fixed-size probabilistic set for very large catalogs
+
+    A URL already added is always recognised; with probability about
+    error_rate an unseen URL is wrongly reported as seen and skipped.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.num_bits = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, key):
+        # Double hashing: h1 + i*h2 tạo ra num_hashes vị trí từ một digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """
+        Add a key, returning True if it was (probably) not already present
+        """
+        is_new = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                is_new = True
+        if is_new:
+            self._count += 1
+        return is_new
+
+    def __contains__(self, key):
+        return all(self._bits[p // 8] & (1 << (p % 8)) for p in self._positions(key))
+
+    def __len__(self):
+        return self._count
+
+
+class UrlDeduper:
+    """
+    Crawl-wide record of product URLs already queued for a detail fetch
+
+    Remembers every category a URL was found under so the product can
+    report all of them. Products are written as soon as they are crawled,
+    possibly before a later category lists them again, so call
+    merge_categories() on the output once listing has finished.
+    Thread-safe so listing workers can share it.
+
+    Args:
+        expected_urls (int, optional): Expected catalog size; at or above
+            BLOOM_THRESHOLD a BloomFilter is used and only the first
+            category of each product is kept
+    """
+
+    def __init__(self, expected_urls=None):
+        self._lock = threading.Lock()
+        self.use_bloom = bool(expected_urls and expected_urls >= BLOOM_THRESHOLD)
+        self._seen = BloomFilter(expected_urls) if self.use_bloom else SeenSet()
+        self._categories = {}
+        self.duplicates = 0
+        self.late_categories = 0
+
+    def add(self, product, category_name=None):
+        """
+        Canonicalize product['url'] in place and register it
+
+        Args:
+            product (dict): Listing dict with a 'url' key
+            category_name (str, optional): Category the product was found under
+
+        Returns:
+            bool: True if the product is new and should be fetched
+        """
+        url = canonicalize_url(product['url'])
+        product['url'] = url
+        with self._lock:
+            if not self._seen.add(url):
+                self.duplicates += 1
+                categories = self._categories.get(url_key(url))
+                if categories is not None and category_name and category_name not in categories:
+                    categories.append(category_name)
+                    self.late_categories += 1
+                return False
+
+            categories = [category_name] if category_name else []
+            if not self.use_bloom:
+                # Danh sách dùng chung: các danh mục tìm thấy sau vẫn được thêm vào sản phẩm
+                self._categories[url_key(url)] = categories
+            product['categories'] = categories
+            return True
+
+    def categories(self, url):
+        """
+        Every category the URL was found under, None if it is unknown or
+        only the first category is kept (Bloom filter mode)
+        """
+        with self._lock:
+            categories = self._categories.get(url_key(canonicalize_url(url)))
+            return list(categories) if categories is not None else None
+
+    def filter(self, products, category_name=None):
+        """
+        Return only the products not seen before, in their original order
+        """
+        return [product for product in products if self.add(product, category_name)]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._seen)
+
+
+def merge_categories(path, dedup, compression='none'):
+    """
+    Rewrite a JSONL output so every product lists all categories the
+    deduper found it under, including those found after it was written
+
+    Args:
+        path (str): File written by sinks.JsonlSink
+        dedup (UrlDeduper): Deduper used for the whole crawl
+        compression (str): Compression of the file
+
+    Returns:
+        int: Number of products whose category list grew
+    """
+    changed = 0
+    with atomic_path(path) as tmp_path, JsonlSink(tmp_path, compression) as sink:
+        for product in read_jsonl(path):
+            known = dedup.categories(product['url']) if product.get('url') else None
+            if known:
+                categories = list(product.get('categories') or [])
+                missing = [name for name in known if name not in categories]
+                if missing:
+                    product['categories'] = categories + missing
+                    changed += 1
+            sink.write(product)
+    return changed
@@ -0,0 +1,427 @@
+import concurrent.futures
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from dedup import canonicalize_url
+from fetcher import is_transient
+from listproduct import iter_category_pages
+from product import scrape_mediamart_product
+from storage import open_db
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+CATEGORY = 'category'
+PRODUCT = 'product'
+
+QUEUE_FILE_DEFAULT = os.path.join('data', 'work_queue.db')
+LEASE_SECONDS = 60       # Mục không được gia hạn trong thời gian này sẽ được giao cho worker khác
+HEARTBEAT_SECONDS = 15
+POLL_SECONDS = 2
+MAX_ATTEMPTS = 3
+IDLE_LEASES = 5          # Coordinator dừng nếu không worker nào chạy và không có tiến triển trong chừng ấy lease
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_items_state ON items(state, kind);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS product_categories (
+    key TEXT NOT NULL,
+    category TEXT NOT NULL,
+    PRIMARY KEY (key, category)
+);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class WorkQueue:
+    """
+    Shared work queue for a coordinator and any number of worker processes
+
+    Category and product URLs are items that workers claim under a lease.
+    A worker keeps its leases alive with heartbeat(); when it dies the
+    leases expire and the items are handed to another worker. Finished
+    products are stored in the queue so the coordinator can merge them
+    into one output.
+
+    Backed by SQLite, so every process must see the same file on a local
+    or shared disk; each process opens its own WorkQueue.
+
+    Args:
+        path (str): SQLite file shared by all processes
+        reset (bool): Start from an empty queue (coordinator only)
+    """
+
+    def __init__(self, path=QUEUE_FILE_DEFAULT, reset=False):
+        self.path = path
+        self._lock = threading.Lock()
+        # timeout: chờ khi tiến trình khác đang giữ khóa ghi
+        self._conn = open_db(path, _SCHEMA, timeout=30)
+        if reset:
+            with self._lock:
+                self._conn.executescript(
+                    "DELETE FROM items; DELETE FROM results; DELETE FROM product_categories; "
+                    "DELETE FROM workers; DELETE FROM meta;"
+                )
+
+    def put(self, kind, key, payload):
+        """
+        Queue an item unless its key is already known
+
+        Returns:
+            bool: True if the item was new
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO items (key, kind, payload, state, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload, ensure_ascii=False), PENDING, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def add_category(self, key, category):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO product_categories (key, category) VALUES (?, ?)", (key, category)
+            )
+
+    def seal(self):
+        """
+        Mark that the coordinator has queued every category; workers only
+        exit once the queue is sealed and drained
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sealed', '1')")
+
+    def claim(self, worker_id, limit=1, lease=LEASE_SECONDS):
+        """
+        Lease up to `limit` pending items, product pages before categories
+        so the queue drains instead of growing
+
+        Returns:
+            list: (kind, key, payload) tuples now owned by worker_id
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Thu hồi mục của worker đã chết (hết hạn lease mà không gia hạn)
+                self._conn.execute(
+                    "UPDATE items SET state = ?, owner = NULL WHERE state = ? AND lease_until < ?",
+                    (PENDING, IN_FLIGHT, now),
+                )
+                rows = self._conn.execute(
+                    "SELECT key, kind, payload FROM items WHERE state = ? "
+                    "ORDER BY kind = ?, rowid LIMIT ?",
+                    (PENDING, CATEGORY, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE items SET state = ?, owner = ?, lease_until = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE key = ?",
+                    [(IN_FLIGHT, worker_id, now + lease, now, key) for key, _, _ in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(kind, key, json.loads(payload)) for key, kind, payload in rows]
+
+    def heartbeat(self, worker_id, lease=LEASE_SECONDS, done=False):
+        """
+        Extend the lease of every item the worker holds
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET lease_until = ? WHERE owner = ? AND state = ?", (now + lease, worker_id, IN_FLIGHT)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (id, heartbeat_at, done) VALUES (?, ?, ?)",
+                (worker_id, now, int(done)),
+            )
+
+    def complete(self, key, worker_id, result=None):
+        """
+        Mark an item done, storing the product for the merged output
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            if result is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, data, worker, finished_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result, ensure_ascii=False), worker_id, now),
+                )
+            self._conn.execute(
+                "UPDATE items SET state = ?, owner = NULL, error = NULL, updated_at = ? WHERE key = ?",
+                (DONE, now, key),
+            )
+            self._conn.execute("COMMIT")
+
+    def fail(self, key, error, final=False):
+        """
+        Put an item back for another attempt, or give up after MAX_ATTEMPTS
+
+        Args:
+            key (str): Item that failed
+            error: Error message or exception stored with the item
+            final (bool): Give up at once, for errors another attempt will
+                not fix (404, 410, a page that does not parse)
+        """
+        attempts = 0 if final else MAX_ATTEMPTS
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, owner = NULL, "
+                "error = ?, updated_at = ? WHERE key = ?",
+                (attempts, FAILED, PENDING, str(error), time.time(), key),
+            )
+
+    def finished(self):
+        """
+        True once the coordinator sealed the queue and no item is left
+        pending or in flight
+        """
+        with self._lock:
+            sealed = self._conn.execute("SELECT 1 FROM meta WHERE key = 'sealed'").fetchone()
+            active = self._conn.execute(
+                "SELECT 1 FROM items WHERE state IN (?, ?) LIMIT 1", (PENDING, IN_FLIGHT)
+            ).fetchone()
+        return sealed is not None and active is None
+
+    def counts(self):
+        """
+        Returns:
+            dict: Number of items per kind and state
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, state, COUNT(*) FROM items GROUP BY kind, state").fetchall()
+        counts = {kind: {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0} for kind in (CATEGORY, PRODUCT)}
+        for kind, state, count in rows:
+            counts[kind][state] = count
+        return counts
+
+    def workers(self, stale_after=LEASE_SECONDS):
+        """
+        Returns:
+            dict: 'alive', 'stale' and 'done' worker ids by last heartbeat
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute("SELECT id, heartbeat_at, done FROM workers").fetchall()
+        status = {'alive': [], 'stale': [], 'done': []}
+        for worker_id, heartbeat_at, done in rows:
+            if done:
+                status['done'].append(worker_id)
+            elif now - heartbeat_at > stale_after:
+                status['stale'].append(worker_id)
+            else:
+                status['alive'].append(worker_id)
+        return status
+
+    def iter_results(self, batch_size=500):
+        """
+        Yield every finished product with the names of all categories it
+        was listed in, reading in small batches
+        """
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, key, data FROM results WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                ).fetchall()
+                categories = {}
+                if rows:
+                    keys = [key for _, key, _ in rows]
+                    placeholders = ','.join('?' * len(keys))
+                    for key, category in self._conn.execute(
+                        f"SELECT key, category FROM product_categories WHERE key IN ({placeholders}) ORDER BY rowid",
+                        keys,
+                    ):
+                        categories.setdefault(key, []).append(category)
+            if not rows:
+                return
+            for last_rowid, key, data in rows:
+                product = json.loads(data)
+                if key in categories:
+                    product['categories'] = categories[key]
+                yield product
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_coordinator(categories, sink, path=QUEUE_FILE_DEFAULT, resume=False, poll=POLL_SECONDS,
+                    idle_timeout=IDLE_LEASES * LEASE_SECONDS):
+    """
+    Queue every category, wait for the workers to drain the queue and
+    merge their products into one output
+
+    Args:
+        categories (list): Category dicts (name, url) to crawl
+        sink (JsonlSink): Receives every finished product
+        path (str): Shared queue file
+        resume (bool): Keep the queue of an interrupted run instead of
+            starting over
+        idle_timeout (float, optional): Give up after this many seconds
+            with no live worker and no item finished; None waits forever
+
+    Returns:
+        dict: Final item counts
+
+    Raises:
+        RuntimeError: No worker was alive for idle_timeout seconds; the
+            queue is kept, so the run can continue with resume=True
+    """
+    work_queue = WorkQueue(path, reset=not resume)
+    queued = sum(work_queue.put(CATEGORY, category['url'], category) for category in categories)
+    work_queue.seal()
+    print(f"Đã đưa {queued} danh mục vào hàng đợi {path}, chờ các worker...")
+
+    try:
+        settled, progress_at = None, time.time()
+        while not work_queue.finished():
+            counts = work_queue.counts()
+            workers = work_queue.workers()
+            print(
+                f"Danh mục {counts[CATEGORY][DONE]}/{sum(counts[CATEGORY].values())}, "
+                f"sản phẩm {counts[PRODUCT][DONE]}/{sum(counts[PRODUCT].values())}, "
+                f"worker: {len(workers['alive'])} đang chạy, {len(workers['stale'])} mất kết nối"
+            )
+            finished = sum(counts[kind][DONE] + counts[kind][FAILED] for kind in counts)
+            if workers['alive'] or finished != settled:
+                settled, progress_at = finished, time.time()
+            elif idle_timeout is not None and time.time() - progress_at > idle_timeout:
+                raise RuntimeError(
+                    f"Không có worker nào chạy và không có tiến triển trong {idle_timeout:.0f}s "
+                    f"({len(workers['stale'])} worker mất kết nối); chạy lại với --resume để tiếp tục"
+                )
+            time.sleep(poll)
+
+        for product in work_queue.iter_results():
+            sink.write(product)
+        counts = work_queue.counts()
+        print(f"Đã gộp {sink.count} sản phẩm từ các worker: {counts}")
+        return counts
+    finally:
+        work_queue.close()
+
+
+def run_worker(path=QUEUE_FILE_DEFAULT, max_workers=10, max_pages=None, worker_id=None,
+               scrape=scrape_mediamart_product, poll=POLL_SECONDS):
+    """
+    Claim and process items from the shared queue until it is drained
+
+    Categories are listed and their products queued (once across all
+    workers); product pages are scraped and stored in the queue for the
+    coordinator. A background thread heartbeats the worker's leases.
+
+    Args:
+        path (str): Shared queue file
+        max_workers (int): Items processed concurrently by this worker
+        max_pages (int, optional): Maximum listing pages per category
+        worker_id (str, optional): Defaults to '<hostname>-<pid>'
+
+    Returns:
+        int: Number of items this worker completed
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    work_queue = WorkQueue(path)
+    stop = threading.Event()
+    completed = [0]
+    completed_lock = threading.Lock()
+
+    def heartbeat():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                work_queue.heartbeat(worker_id)
+            except sqlite3.Error as e:
+                print(f"Lỗi heartbeat: {e}")
+
+    def process(item):
+        kind, key, payload = item
+        try:
+            if kind == CATEGORY:
+                for page_products in iter_category_pages(payload['url'], max_pages):
+                    for product in page_products:
+                        product['url'] = canonicalize_url(product['url'])
+                        # Sản phẩm đã có trong hàng đợi (từ danh mục khác) chỉ được ghi thêm danh mục
+                        work_queue.put(PRODUCT, product['url'], product)
+                        work_queue.add_category(product['url'], payload['name'])
+                work_queue.complete(key, worker_id)
+            else:
+                detail = scrape(key)
+                if not detail or 'error' in detail:
+                    error = detail.get('error', 'Unknown error') if detail else 'Empty result'
+                    print(f"Lỗi khi xử lý {kind} {key}: {error}")
+                    # Chỉ lỗi tạm thời mới được giao lại; 404/410 hay trang lỗi thì thử lại cũng vậy
+                    work_queue.fail(key, error, final=not is_transient(detail.get('status') if detail else None))
+                    return
+                # Thêm thông tin từ danh sách sản phẩm nếu cần
+                for field in payload:
+                    if field not in detail:
+                        detail[field] = payload[field]
+                work_queue.complete(key, worker_id, detail)
+            with completed_lock:
+                completed[0] += 1
+        except Exception as e:
+            print(f"Lỗi khi xử lý {kind} {key}: {e}")
+            work_queue.fail(key, e, final=not is_transient(e))
+
+    work_queue.heartbeat(worker_id)
+    heartbeat_thread = threading.Thread(target=heartbeat, name="worker-heartbeat", daemon=True)
+    heartbeat_thread.start()
+    print(f"Worker {worker_id} bắt đầu nhận việc từ {path}")
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = set()
+            while True:
+                # Chỉ nhận thêm đúng số luồng đang rảnh để không giữ lease của mục chưa xử lý
+                free = max_workers - len(running)
+                items = work_queue.claim(worker_id, limit=free) if free else []
+                running.update(executor.submit(process, item) for item in items)
+                if not running:
+                    if work_queue.finished():
+                        break
+                    time.sleep(poll)
+                    continue
+                if not items:
+                    _, running = concurrent.futures.wait(
+                        running, timeout=poll, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+        work_queue.heartbeat(worker_id, done=True)
+        work_queue.close()
+    print(f"Worker {worker_id} hoàn thành {completed[0]} mục")
+    return completed[0]
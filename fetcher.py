@@ -0,0 +1,484 @@
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util import make_headers
+from urllib3.util.connection import allowed_gai_family
+
+import metrics
+import ratelimit
+
+BASE_URL = "https://mediamart.vn"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+CONNECT_TIMEOUT = 5    # seconds to establish TCP + TLS
+READ_TIMEOUT = 30      # seconds to wait between bytes of the response
+DEFAULT_POOL_SIZE = 10
+MAX_RETRIES = 4        # retries after the first attempt for transient failures
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CACHE_MODES = ('off', 'use', 'cache-only', 'refresh')
+_RETRY_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+_session = None
+_pool_size = DEFAULT_POOL_SIZE
+_session_lock = threading.Lock()
+_mounted_adapters = {}
+_cache = None
+_cache_mode = 'off'
+
+# Thời gian DNS/kết nối của request đang chạy trên luồng hiện tại, do các lớp kết nối bên dưới ghi lại
+_conn_timing = threading.local()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'errors': 0,
+    'retries': 0,
+    'cache_hits': 0,
+    'bytes_on_wire': 0,
+    'bytes_decoded': 0,
+}
+
+
+def is_transient(error):
+    """
+    Whether a failed fetch may succeed later: a connection error or
+    timeout raised by fetch(), or a status in RETRY_STATUSES
+
+    In cache-only mode nothing goes to the network, so no failure is
+    transient; in particular the 504 returned for a cache miss is final.
+
+    Args:
+        error: Exception raised by fetch() or raise_for_status(), or the
+            HTTP status code of a failed response
+    """
+    if _cache_mode == 'cache-only':
+        return False
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        error = error.response.status_code
+    if isinstance(error, int):
+        return error in RETRY_STATUSES
+    return isinstance(error, _RETRY_EXCEPTIONS)
+
+
+def default_headers():
+    """
+    Headers sent with every request.
+
+    Accept-Encoding is built by urllib3 so 'br' is only advertised when a
+    brotli decoder is installed; gzip and deflate are always available.
+    """
+    headers = make_headers(accept_encoding=True)
+    headers['User-Agent'] = USER_AGENT
+    return headers
+
+
+class _TimedConnectionMixin:
+    """
+    Record DNS and connect (TCP + TLS) time of new connections into
+    _conn_timing; reused keep-alive connections record nothing
+    """
+
+    def _new_conn(self):
+        start = time.monotonic()
+        dns_host = self._dns_host
+        try:
+            results = socket.getaddrinfo(dns_host.strip('[]'), self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except OSError:
+            results = []
+        _conn_timing.dns = getattr(_conn_timing, 'dns', 0.0) + time.monotonic() - start
+        addresses = list(dict.fromkeys(result[4][0] for result in results))
+        if not addresses:
+            # Để urllib3 tự phân giải lại và báo lỗi như bình thường
+            return super()._new_conn()
+        # Kết nối tới IP đã phân giải để không tra DNS lần hai; SNI và Host vẫn dùng self.host.
+        # Thử lần lượt mọi địa chỉ như urllib3 (IPv6 rồi IPv4, nhiều bản ghi A)
+        error = None
+        for address in addresses:
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except (ConnectTimeoutError, NewConnectionError) as e:
+                error = e
+            finally:
+                self._dns_host = dns_host
+        raise error
+
+    def connect(self):
+        start = time.monotonic()
+        dns_before = getattr(_conn_timing, 'dns', 0.0)
+        super().connect()
+        dns = getattr(_conn_timing, 'dns', 0.0) - dns_before
+        _conn_timing.connect = getattr(_conn_timing, 'connect', 0.0) + time.monotonic() - start - dns
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+def _build_session(pool_size):
+    session = requests.Session()
+    adapter = _TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(default_headers())
+    for prefix, custom_adapter in _mounted_adapters.items():
+        session.mount(prefix, custom_adapter)
+    return session
+
+
+def configure(max_workers):
+    """
+    Size the keep-alive pool so every worker thread can hold its own
+    connection, and cap the per-host concurrency window at the same size.
+    Replaces the shared session if the size changes.
+
+    Args:
+        max_workers (int): Number of threads that will fetch concurrently
+    """
+    global _session, _pool_size
+    with _session_lock:
+        pool_size = max(int(max_workers), 1)
+        ratelimit.configure(max_concurrency=pool_size)
+        if _session is not None and pool_size == _pool_size:
+            return
+        old_session = _session
+        _pool_size = pool_size
+        _session = _build_session(pool_size)
+    if old_session is not None:
+        old_session.close()
+
+
+def mount(prefix, adapter):
+    """
+    Route every request whose URL starts with prefix through a custom
+    requests transport adapter, e.g. to replay recorded pages offline.
+    Survives configure() rebuilding the session.
+
+    Args:
+        prefix (str): URL prefix such as 'https://mediamart.vn'
+        adapter (requests.adapters.BaseAdapter): Adapter to use, or None
+            to remove a previously mounted one
+    """
+    global _session
+    with _session_lock:
+        if adapter is None:
+            _mounted_adapters.pop(prefix, None)
+        else:
+            _mounted_adapters[prefix] = adapter
+        old_session = _session
+        _session = None
+    if old_session is not None:
+        old_session.close()
+
+
+def get_session():
+    """
+    Return the shared requests.Session, creating it on first use
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(_pool_size)
+    return _session
+
+
+def configure_cache(mode, path=None, max_bytes=None, ttl=None):
+    """
+    Enable the on-disk response cache for every fetch()
+
+    Modes:
+        'off': no cache (default)
+        'use': serve fresh entries from the cache, fetch and store misses
+        'cache-only': never touch the network; misses get a 504 response
+        'refresh': always fetch and overwrite the cached entry
+
+    Args:
+        mode (str): One of CACHE_MODES
+        path (str, optional): SQLite file, defaults to httpcache.CACHE_FILE_DEFAULT
+        max_bytes (int, optional): Compressed size before LRU eviction
+        ttl (float, optional): Seconds an entry stays fresh in 'use' mode
+    """
+    global _cache, _cache_mode
+    import httpcache
+
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode: {mode}")
+    old_cache = _cache
+    _cache = None
+    if mode != 'off':
+        _cache = httpcache.ResponseCache(
+            path or httpcache.CACHE_FILE_DEFAULT,
+            max_bytes or httpcache.CACHE_MAX_BYTES_DEFAULT,
+            ttl if ttl is not None else httpcache.CACHE_TTL_DEFAULT,
+        )
+    _cache_mode = mode
+    if old_cache is not None:
+        old_cache.close()
+
+
+def cache_enabled():
+    return _cache is not None
+
+
+def _cached_response(url, status, headers, content):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = content
+    return response
+
+
+def lookup_cache(url, headers=None, stage='other'):
+    """
+    Answer a request from the response cache without touching the network
+
+    Used by fetch() and by the asyncio engine, which sends its own
+    requests but shares the cache and the counters with fetch().
+
+    Returns:
+        requests.Response or None: The cached response; a 504 response on
+        a miss in 'cache-only' mode; None when the request has to go to
+        the network (cache off, 'refresh' mode or a miss)
+    """
+    cache = _cache
+    if cache is None or _cache_mode == 'refresh':
+        return None
+    entry = cache.get(url, headers, ignore_ttl=_cache_mode == 'cache-only')
+    if entry is not None:
+        count_stats(cache_hits=1)
+        metrics.CACHE_HITS.inc(stage=stage)
+        return _cached_response(url, *entry)
+    if _cache_mode == 'cache-only':
+        # Giống Cache-Control: only-if-cached, không có trong cache thì trả 504
+        return _cached_response(url, 504, {}, b'')
+    return None
+
+
+def store_cache(url, headers, status, response_headers, content):
+    """
+    Save a response fetched from the network when the cache is enabled
+    """
+    cache = _cache
+    # Chỉ lưu phản hồi xác định (200, 404...), không lưu lỗi tạm thời (kể cả 429) hay 304
+    if cache is not None and status not in RETRY_STATUSES and status != 304:
+        cache.put(url, headers, status, response_headers, content)
+
+
+def count_stats(**counts):
+    """
+    Add to the counters reported by fetch_stats(), e.g. requests=1
+    """
+    with _stats_lock:
+        for key, value in counts.items():
+            _stats[key] += value
+
+
+def _observe(stage, status, dns, connect, elapsed, total):
+    metrics.HTTP_REQUESTS.inc(stage=stage, status=status)
+    if dns or connect:
+        # Chỉ ghi khi mở kết nối mới; kết nối keep-alive dùng lại không tốn DNS/kết nối
+        metrics.HTTP_PHASE_SECONDS.observe(dns, stage=stage, phase='dns')
+        metrics.HTTP_PHASE_SECONDS.observe(connect, stage=stage, phase='connect')
+    # elapsed (requests) tính từ lúc gửi đến khi nhận xong header, gồm cả DNS và kết nối
+    if elapsed is not None:
+        metrics.HTTP_PHASE_SECONDS.observe(max(elapsed - dns - connect, 0.0), stage=stage, phase='ttfb')
+        metrics.HTTP_PHASE_SECONDS.observe(max(total - elapsed, 0.0), stage=stage, phase='download')
+
+
+def record_attempt(limiter, stage, status=None, response_headers=None, elapsed=None, total=None,
+                   wire_bytes=0, decoded_bytes=0, dns=0.0, connect=0.0):
+    """
+    Book-keeping for one HTTP attempt, shared by fetch() and the asyncio
+    engine: return the limiter slot, update the metrics and the counters
+
+    Args:
+        limiter (ratelimit.AdaptiveRateLimiter): Limiter the slot was taken from
+        stage (str): Label for the metrics
+        status (int, optional): HTTP status, None for a connection error
+        response_headers (Mapping, optional): Case-insensitive response headers
+        elapsed (float, optional): Seconds until the response headers
+        total (float, optional): Seconds until the body was read
+        wire_bytes (int): Bytes received, before decompression
+        decoded_bytes (int): Bytes of the decompressed body
+
+    Returns:
+        float or None: The parsed Retry-After of a retryable status
+    """
+    if status is None:
+        limiter.release(status=None)
+        _observe(stage, 'error', dns, connect, None, None)
+        count_stats(requests=1, errors=1)
+        return None
+    retry_after = None
+    if status in RETRY_STATUSES:
+        retry_after = ratelimit.parse_retry_after(response_headers.get('Retry-After'))
+    limiter.release(status, elapsed, retry_after)
+    _observe(stage, str(status), dns, connect, elapsed, total)
+    metrics.HTTP_BYTES.inc(wire_bytes, stage=stage, kind='wire')
+    metrics.HTTP_BYTES.inc(decoded_bytes, stage=stage, kind='decoded')
+    count_stats(requests=1, bytes_on_wire=wire_bytes, bytes_decoded=decoded_bytes)
+    return retry_after
+
+
+def retry_delay(stage, attempt, retries, status=None, retry_after=None):
+    """
+    Seconds to wait before retrying an attempt, counting the retry
+
+    Args:
+        stage (str): Label for the metrics
+        attempt (int): Attempts made so far minus one
+        retries (int): Retries allowed after the first attempt
+        status (int, optional): HTTP status, None for a retryable connection error
+        retry_after (float, optional): Value returned by record_attempt()
+
+    Returns:
+        float or None: The delay, or None when the result is final
+    """
+    if attempt >= retries or (status is not None and status not in RETRY_STATUSES):
+        return None
+    count_stats(retries=1)
+    metrics.HTTP_RETRIES.inc(stage=stage)
+    return max(ratelimit.backoff_delay(attempt), retry_after or 0)
+
+
+def fetch(url, headers=None, timeout=None, retries=MAX_RETRIES, stage='other', **kwargs):
+    """
+    GET a URL through the shared pooled session
+
+    When the response cache is enabled (configure_cache) a cached entry
+    is returned without touching the network or the rate limiter.
+    Otherwise every request first takes a token from the per-host
+    adaptive rate limiter. Connection errors, timeouts and 429/5xx
+    responses are retried up to `retries` times with jittered exponential
+    backoff, waiting at least as long as the server's Retry-After header
+    asks.
+
+    Args:
+        url (str): Absolute URL to fetch
+        headers (dict, optional): Extra headers merged over the defaults
+        timeout (tuple, optional): (connect, read) timeout in seconds
+        retries (int): Retries for transient failures, 0 to disable
+        stage (str): Label for the metrics, e.g. 'menu', 'listing', 'product'
+
+    Returns:
+        requests.Response: The response with its body already read; the
+        last response is returned when a retryable status persists
+    """
+    cached = lookup_cache(url, headers, stage)
+    if cached is not None:
+        return cached
+
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    limiter = ratelimit.get_limiter(urlsplit(url).netloc)
+
+    attempt = 0
+    while True:
+        limiter.acquire()
+        _conn_timing.dns = _conn_timing.connect = 0.0
+        start = time.monotonic()
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            record_attempt(limiter, stage, dns=_conn_timing.dns, connect=_conn_timing.connect)
+            delay = retry_delay(stage, attempt, retries) if isinstance(e, _RETRY_EXCEPTIONS) else None
+            if delay is None:
+                raise
+        else:
+            # raw.tell() counts the (possibly compressed) bytes read off the socket
+            retry_after = record_attempt(
+                limiter, stage, response.status_code, response.headers, response.elapsed.total_seconds(),
+                time.monotonic() - start, response.raw.tell() if response.raw is not None else 0,
+                len(response.content), _conn_timing.dns, _conn_timing.connect,
+            )
+            delay = retry_delay(stage, attempt, retries, response.status_code, retry_after)
+            if delay is None:
+                store_cache(url, headers, response.status_code, response.headers, response.content)
+                return response
+
+        time.sleep(delay)
+        attempt += 1
+
+
+def fetch_stats():
+    """
+    Snapshot of the fetch counters
+
+    Returns:
+        dict: requests, errors, retries, cache hits, new/reused connection
+        counts and byte totals
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+
+    new_connections = 0
+    pooled_requests = 0
+    session = _session
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            if not isinstance(adapter, HTTPAdapter):
+                continue
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    new_connections += pool.num_connections
+                    pooled_requests += pool.num_requests
+
+    stats['connections_opened'] = new_connections
+    stats['connections_reused'] = max(pooled_requests - new_connections, 0)
+    return stats
+
+
+def format_fetch_stats(stats=None):
+    """
+    Human readable one-line summary of fetch_stats()
+    """
+    stats = stats or fetch_stats()
+    ratio = ''
+    if stats['bytes_decoded']:
+        ratio = f" ({stats['bytes_on_wire'] / stats['bytes_decoded']:.0%} of decoded)"
+    return (
+        f"{stats['requests']} requests, {stats['errors']} errors, {stats['retries']} retries, "
+        f"{stats['cache_hits']} cache hits, "
+        f"{stats['connections_opened']} connections opened, "
+        f"{stats['connections_reused']} reused, "
+        f"{stats['bytes_on_wire'] / 1024 / 1024:.1f} MiB on wire{ratio}"
+    )
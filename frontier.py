@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from storage import open_db
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+STATE_FILE_DEFAULT = os.path.join('data', 'crawl_state.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    listing TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_urls_state ON urls(state);
+CREATE TABLE IF NOT EXISTS products (
+    url TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    url TEXT PRIMARY KEY,
+    finished_at REAL NOT NULL
+);
+"""
+
+
+def known_urls(path=STATE_FILE_DEFAULT):
+    """
+    Number of product URLs in the state file of the last run (0 without
+    one); opens the file read-only, before CrawlFrontier may clear it
+    """
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+    except sqlite3.Error:
+        return 0
+    finally:
+        conn.close()
+
+class CrawlFrontier:
+    """
+    On-disk crawl frontier backed by SQLite
+
+    Every product URL moves through pending -> in_flight -> done/failed,
+    finished products are checkpointed as they complete, and categories
+    whose listing has been fully walked are remembered, so a crashed run
+    can be resumed without repeating work. Safe to share between threads.
+
+    Args:
+        path (str): SQLite file to use
+        resume (bool): Keep the state from the previous run; otherwise
+            the frontier starts empty
+    """
+
+    def __init__(self, path=STATE_FILE_DEFAULT, resume=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+
+        with self._lock:
+            if resume:
+                # Các URL đang xử lý khi tiến trình bị dừng phải được crawl lại
+                self._conn.execute(
+                    "UPDATE urls SET state = ? WHERE state = ?", (PENDING, IN_FLIGHT)
+                )
+            else:
+                self._conn.executescript("DELETE FROM urls; DELETE FROM products; DELETE FROM categories;")
+
+    def add(self, product):
+        """
+        Record a listing entry as pending unless the URL is already known
+
+        Returns:
+            bool: True if the URL was new to the frontier
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO urls (url, listing, state, updated_at) VALUES (?, ?, ?, ?)",
+                (product['url'], json.dumps(product, ensure_ascii=False), PENDING, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def pending(self):
+        """
+        Listing entries still waiting for a detail fetch, including ones
+        that failed in a previous run
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT listing FROM urls WHERE state IN (?, ?) ORDER BY rowid", (PENDING, FAILED)
+            ).fetchall()
+        return [json.loads(listing) for (listing,) in rows]
+
+    def iter_pending(self, batch_size=500):
+        """
+        Yield the same entries as pending() in small batches, so a large
+        frontier can be fed to workers without loading it all
+        """
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, listing FROM urls WHERE state IN (?, ?) AND rowid > ? ORDER BY rowid LIMIT ?",
+                    (PENDING, FAILED, last_rowid, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for last_rowid, listing in rows:
+                yield json.loads(listing)
+
+    def mark_in_flight(self, url):
+        self._set_state(url, IN_FLIGHT, attempts_delta=1)
+
+    def mark_done(self, url, detail):
+        """
+        Checkpoint a finished product and mark its URL done in one transaction
+        """
+        now = time.time()
+        data = json.dumps(detail, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products (url, data, finished_at) VALUES (?, ?, ?)",
+                (url, data, now),
+            )
+            self._conn.execute(
+                "UPDATE urls SET state = ?, error = NULL, updated_at = ? WHERE url = ?", (DONE, now, url)
+            )
+            self._conn.execute("COMMIT")
+
+    def mark_failed(self, url, error):
+        self._set_state(url, FAILED, error=str(error))
+
+    def _set_state(self, url, state, error=None, attempts_delta=0):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE urls SET state = ?, error = ?, attempts = attempts + ?, updated_at = ? WHERE url = ?",
+                (state, error, attempts_delta, time.time(), url),
+            )
+
+    def category_done(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM categories WHERE url = ?", (url,)).fetchone()
+        return row is not None
+
+    def mark_category_done(self, url):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO categories (url, finished_at) VALUES (?, ?)", (url, time.time())
+            )
+
+    def iter_products(self, batch_size=500):
+        """
+        Yield every checkpointed product, reading in small batches so the
+        whole catalog is never held in memory
+        """
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, data FROM products WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for last_rowid, data in rows:
+                yield json.loads(data)
+
+    def counts(self):
+        """
+        Returns:
+            dict: Number of URLs in each state
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall()
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from storage import open_db
+
+CACHE_FILE_DEFAULT = os.path.join('data', 'http_cache.db')
+CACHE_MAX_BYTES_DEFAULT = 1024 * 1024 * 1024
+CACHE_TTL_DEFAULT = 7 * 24 * 3600
+EVICT_TO = 0.9  # Khi vượt giới hạn, xóa bớt đến 90% dung lượng cho phép
+
+# Thân phản hồi được lưu ở dạng đã giải nén nên các header này không còn đúng
+_DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at);
+"""
+
+
+def cache_key(url, headers=None):
+    """
+    Key for a GET request: the URL plus the per-request headers, which
+    is what makes e.g. a conditional request differ from a plain one
+    """
+    items = sorted((name.lower(), value) for name, value in (headers or {}).items())
+    data = json.dumps([url, items], ensure_ascii=False)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of HTTP responses with zlib-compressed bodies
+
+    Entries older than ttl are ignored (except in cache-only mode) and the
+    least recently used entries are evicted once the stored bodies exceed
+    max_bytes. Safe to share between threads.
+
+    Args:
+        path (str): SQLite file to use
+        max_bytes (int): Upper bound for the compressed bodies
+        ttl (float, optional): Seconds an entry stays fresh; None for no expiry
+    """
+
+    def __init__(self, path=CACHE_FILE_DEFAULT, max_bytes=CACHE_MAX_BYTES_DEFAULT, ttl=CACHE_TTL_DEFAULT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+
+    def get(self, url, headers=None, ignore_ttl=False):
+        """
+        Look up a cached response
+
+        Returns:
+            tuple or None: (status, headers dict, body bytes) for a fresh
+            entry, None on a miss
+        """
+        key = cache_key(url, headers)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, body, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (not ignore_ttl and self.ttl is not None and now - row[3] > self.ttl):
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.stats['hits'] += 1
+        status, stored_headers, body, _ = row
+        return status, json.loads(stored_headers), zlib.decompress(body)
+
+    def put(self, url, headers, status, response_headers, content):
+        """
+        Store a response body (already decoded) and evict if over budget
+        """
+        key = cache_key(url, headers)
+        kept_headers = {
+            name: value for name, value in response_headers.items() if name.lower() not in _DROPPED_HEADERS
+        }
+        body = zlib.compress(content, 6)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, url, status, headers, body, size, stored_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(kept_headers), body, len(body), now, now),
+            )
+            self._size += len(body) - (old[0] if old else 0)
+            self.stats['stored'] += 1
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * EVICT_TO
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats['evicted'] += len(evicted)
+
+    def summary(self):
+        """
+        Returns:
+            dict: Entry count, compressed size in bytes and hit/miss counters
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {'entries': entries, 'bytes': self._size, **self.stats}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
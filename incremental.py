@@ -0,0 +1,365 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from fetcher import fetch
+from metrics import PARSE_SECONDS
+from listproduct import TILE_FIELDS
+from product import parse_mediamart_product
+from sinks import JsonlSink
+from storage import open_db
+
+INCREMENTAL_FILE_DEFAULT = os.path.join('data', 'incremental.db')
+
+# Các phần của trang chi tiết mà parse_mediamart_product thực sự đọc.
+# Phần còn lại (header, footer, token, quảng cáo) thay đổi liên tục nên không được hash.
+FRAGMENT_CLASSES = (
+    'pdetail-name', 'pdetail-price-box', 'product-price-regular', 'product-price-saving',
+    'pdetail-info', 'table-striped', 'pdetail-des', 'pdetail-slideproduct',
+    'rating-value', 'product-review-list',
+)
+FRAGMENT_IDS = ('gioi-thieu-san-pham',)
+
+# Mã trạng thái cho biết sản phẩm thực sự không còn; các lỗi khác không làm URL bị báo xóa
+GONE_STATUSES = (404, 410)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT NOT NULL,
+    tile_hash TEXT,
+    product TEXT NOT NULL,
+    first_seen_run INTEGER NOT NULL,
+    last_seen_run INTEGER NOT NULL,
+    last_changed_run INTEGER NOT NULL,
+    last_fetched_run INTEGER,
+    last_failed_run INTEGER,
+    removed_run INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_pages_last_seen ON pages(last_seen_run);
+CREATE INDEX IF NOT EXISTS idx_pages_last_changed ON pages(last_changed_run);
+"""
+
+_FRAGMENT_XPATH = ' | '.join(
+    [f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]" for name in FRAGMENT_CLASSES]
+    + [f"//*[@id='{name}']" for name in FRAGMENT_IDS]
+)
+
+
+def known_urls(path=INCREMENTAL_FILE_DEFAULT):
+    """
+    Number of product URLs stored by previous runs (0 without a store),
+    i.e. the catalog size last time; opens the file read-only
+    """
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+    except sqlite3.Error:
+        return 0
+    finally:
+        conn.close()
+
+
+def tile_hash(tile):
+    """
+    Hash the price, discount and stock fields of a listing tile
+
+    Args:
+        tile (dict): Listing entry crawled with tile_fields=True
+
+    Returns:
+        str: Hex digest, identical as long as the tile shows the same data
+    """
+    fields = ['name', *TILE_FIELDS, 'in_stock']
+    data = json.dumps([tile.get(key) for key in fields], ensure_ascii=False)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def fragment_hash(html):
+    """
+    Hash only the parts of a product page that the parser extracts
+
+    Uses lxml directly, which is much cheaper than the full BeautifulSoup
+    parse, so an unchanged page can be recognised without parsing it.
+
+    Args:
+        html (str): Product page HTML
+
+    Returns:
+        str: Hex digest of the relevant fragments
+    """
+    import lxml.html
+    from lxml import etree
+
+    tree = lxml.html.fromstring(html)
+    digest = hashlib.blake2b(digest_size=16)
+    for node in tree.xpath(_FRAGMENT_XPATH):
+        digest.update(etree.tostring(node, encoding='utf-8'))
+    return digest.hexdigest()
+
+
+class IncrementalCrawler:
+    """
+    Product scraper that only re-parses pages that changed since the last run
+
+    Stores ETag, Last-Modified and a fragment hash per URL, sends
+    If-None-Match / If-Modified-Since, and returns the stored product for
+    a 304 or an unchanged fragment. In listing-only fast mode the hash of
+    the category tile is stored too, and reuse_unchanged_tile() skips the
+    detail fetch entirely while the tile stays the same; reuse_not_modified()
+    does the same for sitemap URLs whose lastmod predates the last fetch.
+    Each instance is one crawl run; call write_delta() at the end to get
+    new, changed and removed products.
+
+    Args:
+        path (str): SQLite file holding the previous runs
+    """
+
+    def __init__(self, path=INCREMENTAL_FILE_DEFAULT):
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pages)")}
+        # File tạo bởi phiên bản cũ chưa có các cột này
+        if 'tile_hash' not in columns:
+            self._conn.execute("ALTER TABLE pages ADD COLUMN tile_hash TEXT")
+        if 'last_fetched_run' not in columns:
+            self._conn.execute("ALTER TABLE pages ADD COLUMN last_fetched_run INTEGER")
+            # Lần tải thật gần nhất chắc chắn có là lần trang được parse lại
+            self._conn.execute("UPDATE pages SET last_fetched_run = last_changed_run")
+        if 'last_failed_run' not in columns:
+            self._conn.execute("ALTER TABLE pages ADD COLUMN last_failed_run INTEGER")
+        if 'removed_run' not in columns:
+            self._conn.execute("ALTER TABLE pages ADD COLUMN removed_run INTEGER")
+            # URL đã vắng mặt từ trước lần chạy gần nhất thì đã được báo xóa ở lần đó
+            self._conn.execute(
+                "UPDATE pages SET removed_run = last_seen_run + 1 WHERE last_seen_run < (SELECT MAX(id) FROM runs)"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_removed ON pages(removed_run)")
+        self.run_id = self._conn.execute("INSERT INTO runs (started_at) VALUES (?)", (time.time(),)).lastrowid
+        self.stats = {'new': 0, 'changed': 0, 'not_modified': 0, 'same_hash': 0, 'same_tile': 0, 'same_lastmod': 0}
+        # Hash ô sản phẩm chờ được lưu cùng kết quả scrape() thành công
+        self._pending_tiles = {}
+
+    def _get(self, url):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, last_modified, content_hash, product FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+
+    def _touch(self, url, etag=None, last_modified=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET last_seen_run = ?, last_fetched_run = ?, removed_run = NULL, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), "
+                "tile_hash = COALESCE(?, tile_hash) WHERE url = ?",
+                (self.run_id, self.run_id, etag, last_modified, self._pending_tiles.pop(url, None), url),
+            )
+
+    def _mark_failed(self, url):
+        # Trang không tải được ở lần này không bị coi là đã bị xóa
+        with self._lock:
+            self._conn.execute("UPDATE pages SET last_failed_run = ? WHERE url = ?", (self.run_id, url))
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def reuse_unchanged_tile(self, tile):
+        """
+        Stored product for a listing tile that shows the same data as in
+        the run that last scraped it
+
+        When the URL is new or its tile changed, the tile hash is kept so
+        the following scrape() stores it along with the fresh product.
+
+        Args:
+            tile (dict): Listing entry crawled with tile_fields=True
+
+        Returns:
+            dict or None: The stored product, or None if a detail fetch is needed
+        """
+        url = tile['url']
+        digest = tile_hash(tile)
+        with self._lock:
+            row = self._conn.execute("SELECT tile_hash, product FROM pages WHERE url = ?", (url,)).fetchone()
+            if row and row[0] == digest:
+                self._conn.execute(
+                    "UPDATE pages SET last_seen_run = ?, removed_run = NULL WHERE url = ?", (self.run_id, url)
+                )
+                self.stats['same_tile'] += 1
+                return json.loads(row[1])
+            self._pending_tiles[url] = digest
+        return None
+
+    def reuse_not_modified(self, url, lastmod):
+        """
+        Stored product for a URL whose sitemap lastmod is older than the
+        run that last fetched its page
+
+        Runs that only reused the product from an unchanged tile or an
+        older lastmod do not count, since they never saw the page.
+
+        Args:
+            url (str): Product URL
+            lastmod (float, optional): Unix time from the sitemap
+
+        Returns:
+            dict or None: The stored product, or None if a fetch is needed
+        """
+        if lastmod is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT p.product, r.started_at FROM pages p JOIN runs r ON r.id = p.last_fetched_run WHERE p.url = ?",
+                (url,),
+            ).fetchone()
+            if row is None or lastmod >= row[1]:
+                return None
+            self._conn.execute(
+                "UPDATE pages SET last_seen_run = ?, removed_run = NULL WHERE url = ?", (self.run_id, url)
+            )
+            self.stats['same_lastmod'] += 1
+        return json.loads(row[0])
+
+    def scrape(self, url):
+        """
+        Drop-in replacement for product.scrape_mediamart_product
+
+        Returns:
+            dict: Product data, the stored copy when the page is unchanged
+        """
+        try:
+            return self._scrape(url)
+        finally:
+            # Hash ô chỉ được lưu cùng một lần scrape thành công, không giữ lại khi tải lỗi
+            with self._lock:
+                self._pending_tiles.pop(url, None)
+
+    def _scrape(self, url):
+        row = self._get(url)
+        headers = {}
+        if row:
+            etag, last_modified = row[0], row[1]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        try:
+            response = fetch(url, headers=headers, stage='product')
+        except Exception:
+            self._mark_failed(url)
+            raise
+        if response.status_code == 304 and row:
+            self._touch(url)
+            self._count('not_modified')
+            return json.loads(row[3])
+        if response.status_code != 200:
+            if response.status_code not in GONE_STATUSES:
+                self._mark_failed(url)
+            return {"error": f"Failed to fetch the page: {response.status_code}", "status": response.status_code}
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        content_hash = fragment_hash(response.text)
+        if row and row[2] == content_hash:
+            self._touch(url, etag, last_modified)
+            self._count('same_hash')
+            return json.loads(row[3])
+
+        start = time.perf_counter()
+        product = parse_mediamart_product(response.text, url)
+        PARSE_SECONDS.observe(time.perf_counter() - start, stage='product')
+        data = json.dumps(product, ensure_ascii=False)
+        with self._lock:
+            tile_digest = self._pending_tiles.pop(url, None)
+            if row:
+                self._conn.execute(
+                    "UPDATE pages SET etag = ?, last_modified = ?, content_hash = ?, tile_hash = ?, product = ?, "
+                    "last_seen_run = ?, last_changed_run = ?, last_fetched_run = ?, removed_run = NULL WHERE url = ?",
+                    (etag, last_modified, content_hash, tile_digest, data, self.run_id, self.run_id, self.run_id,
+                     url),
+                )
+            else:
+                self._conn.execute(
+                    "INSERT INTO pages (url, etag, last_modified, content_hash, tile_hash, product, "
+                    "first_seen_run, last_seen_run, last_changed_run, last_fetched_run) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (url, etag, last_modified, content_hash, tile_digest, data,
+                     self.run_id, self.run_id, self.run_id, self.run_id),
+                )
+        self._count('changed' if row else 'new')
+        return product
+
+    def _iter_rows(self, query, params, batch_size=500):
+        # Đọc từng lô theo rowid, không giữ khóa trong lúc người gọi xử lý
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"{query} AND rowid > ? ORDER BY rowid LIMIT ?", (*params, last_rowid, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                last_rowid = row[0]
+                yield row[1:]
+
+    def iter_delta(self, include_removed=True):
+        """
+        Stream what differs from the previous run, one record at a time
+
+        A URL is reported as removed once: in the first run that did not
+        see it, unless its fetch failed in that run. Later runs skip it
+        until it is seen again.
+
+        Args:
+            include_removed (bool): Report URLs not seen in this run as
+                removed; only meaningful after a full-catalog crawl
+
+        Yields:
+            dict: {'change': 'new' | 'changed', 'product': {...}} or
+            {'change': 'removed', 'url': ...}
+        """
+        for first_seen_run, product in self._iter_rows(
+            "SELECT rowid, first_seen_run, product FROM pages WHERE last_changed_run = ?", (self.run_id,)
+        ):
+            yield {'change': 'new' if first_seen_run == self.run_id else 'changed', 'product': json.loads(product)}
+        if include_removed:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE pages SET removed_run = ? WHERE last_seen_run < ? AND removed_run IS NULL "
+                    "AND (last_failed_run IS NULL OR last_failed_run < ?)",
+                    (self.run_id, self.run_id, self.run_id),
+                )
+            for (url,) in self._iter_rows("SELECT rowid, url FROM pages WHERE removed_run = ?", (self.run_id,)):
+                yield {'change': 'removed', 'url': url}
+
+    def write_delta(self, path, include_removed=True, compression='none'):
+        """
+        Write iter_delta() to a JSON Lines file without loading it in memory
+
+        Returns:
+            dict: Number of 'new', 'changed' and 'removed' records
+        """
+        counts = {'new': 0, 'changed': 0, 'removed': 0}
+        with JsonlSink(path, compression) as sink:
+            for record in self.iter_delta(include_removed):
+                sink.write(record)
+                counts[record['change']] += 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -2,93 +2,207 @@
 import requests
 from bs4 import BeautifulSoup
 import json
+import time
+import concurrent.futures
 from urllib.parse import urljoin
 
-def crawl_cap_noi_products(url, max_pages=None):
+from fetcher import BASE_URL, fetch, is_transient
+from metrics import ITEMS, PARSE_SECONDS
+from ratelimit import RETRY_PASSES, backoff_delay
+
+PAGE_WORKERS = 4  # Số trang danh sách được tải đồng thời cho mỗi danh mục
+
+# Các trường hiển thị trên ô sản phẩm của trang danh mục, cùng tên khóa với trang chi tiết
+TILE_FIELDS = {
+    'price': '.product-price',
+    'original_price': '.product-price-regular',
+    'discount_percentage': '.product-price-saving',
+    'stock': '.product-stock',
+}
+
+def crawl_cap_noi_products(url, max_pages=None, tile_fields=False, retry_passes=RETRY_PASSES):
     """
     Crawl product names and URLs from the cap-noi category page
     
     Args:
         url (str): The URL of the cap-noi category page
         max_pages (int, optional): Maximum number of pages to crawl
+        tile_fields (bool): Also keep the price, discount and stock shown
+            on each product tile
+        retry_passes (int): Times the category is walked again, after a
+            backoff, when a listing page still fails with a transient error
         
     Returns:
         list: List of dictionaries containing product names and URLs
     """
-    base_url = "https://mediamart.vn"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
-    all_products = []
-    current_page = 1
-    
-    while True:
-        # Construct the URL for the current page
-        if current_page == 1:
-            page_url = url
-        else:
-            # Assuming pagination format is category-url?page=X
-            if '?' in url:
-                page_url = f"{url}&page={current_page}"
-            else:
-                page_url = f"{url}?page={current_page}"
-        
-        print(f"Crawling page {current_page}: {page_url}")
-        
+    for retry_pass in range(retry_passes + 1):
+        all_products = []
         try:
-            response = requests.get(page_url, headers=headers)
-            response.raise_for_status()  # Raise an exception for bad responses
+            for page_products in iter_category_pages(url, max_pages, tile_fields=tile_fields):
+                all_products.extend(page_products)
+            return all_products
         except requests.exceptions.RequestException as e:
-            print(f"Failed to fetch page {current_page}: {e}")
-            break
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find all product elements on the page
-        product_elements = soup.select('div.col-6.col-md-3.col-lg-3')
-        
-        if not product_elements:
-            print(f"No products found on page {current_page}")
-            break
-            
-        # Extract name and URL from each product element
-        for product_element in product_elements:
-            product_info = {}
-            
-            # Find the product link
-            product_link = product_element.select_one('a.product-item')
-            if product_link:
-                # Get the relative URL and convert to absolute URL
-                relative_url = product_link.get('href')
-                product_info['url'] = urljoin(base_url, relative_url)
-            
-            # Extract product name
-            product_name = product_element.select_one('.product-name')
-            if product_name:
-                product_info['name'] = product_name.text.strip()
-            
-            # Only add products that have both name and URL
-            if 'name' in product_info and 'url' in product_info:
-                all_products.append(product_info)
+            if retry_pass == retry_passes or not is_transient(e):
+                # Trả về phần đã lấy được nhưng báo rõ danh mục chưa quét hết
+                print(f"Danh mục chưa quét hết, chỉ có {len(all_products)} sản phẩm: {e}")
+                return all_products
+            delay = backoff_delay(retry_pass + 1)
+            print(f"Quét lại danh mục sau {delay:.1f}s (lượt {retry_pass + 1}/{retry_passes}): {e}")
+            time.sleep(delay)
+
+def _page_url(url, page):
+    """
+    URL of a listing page; page 1 is the category URL itself
+    """
+    if page == 1:
+        return url
+    # Assuming pagination format is category-url?page=X
+    if '?' in url:
+        return f"{url}&page={page}"
+    return f"{url}?page={page}"
+
+def _fetch_listing_page(url, page, tile_fields=False):
+    """
+    Fetch and parse one listing page
+
+    Returns:
+        tuple: (soup, products) or (None, None) when the page does not exist
+    """
+    page_url = _page_url(url, page)
+    print(f"Crawling page {page}: {page_url}")
+    try:
+        # fetch() đã tự thử lại lỗi tạm thời (429/5xx, mất kết nối)
+        response = fetch(page_url, stage='listing')
+        if response.status_code == 404:
+            print(f"Page {page} not found")
+            return None, None
+        response.raise_for_status()  # Raise an exception for bad responses
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to fetch page {page}: {e}")
+        raise
+
+    start = time.perf_counter()
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    # Find all product elements on the page
+    product_elements = soup.select('div.col-6.col-md-3.col-lg-3')
+
+    # Extract name and URL from each product element
+    page_products = []
+    for product_element in product_elements:
+        product_info = {}
+
+        # Find the product link
+        product_link = product_element.select_one('a.product-item')
+        if product_link:
+            # Get the relative URL and convert to absolute URL
+            relative_url = product_link.get('href')
+            product_info['url'] = urljoin(BASE_URL, relative_url)
+
+        # Extract product name
+        product_name = product_element.select_one('.product-name')
+        if product_name:
+            product_info['name'] = product_name.text.strip()
+
+        if tile_fields:
+            for key, selector in TILE_FIELDS.items():
+                element = product_element.select_one(selector)
+                if element:
+                    product_info[key] = element.text.strip()
+            stock = product_element.select_one('.product-stock')
+            if stock:
+                product_info['in_stock'] = 'out-of-stock' not in stock.get('class', [])
+
+        # Only add products that have both name and URL
+        if 'name' in product_info and 'url' in product_info:
+            page_products.append(product_info)
+
+    PARSE_SECONDS.observe(time.perf_counter() - start, stage='listing')
+    ITEMS.inc(stage='listing', result='ok' if product_elements else 'empty')
+
+    if product_elements:
+        print(f"Found {len(product_elements)} products on page {page}")
+    else:
+        print(f"No products found on page {page}")
+    return soup, page_products
+
+def _last_page_number(soup):
+    """
+    Highest page number shown in the pagination bar, 1 if there is none
+    """
+    numbers = [int(link.text) for link in soup.select('.pagination a.page-link') if link.text.strip().isdigit()]
+    return max(numbers, default=1)
+
+def _has_next_page(soup):
+    return soup.select_one('a.page-link[rel="next"]') is not None
+
+def iter_category_pages(url, max_pages=None, page_workers=PAGE_WORKERS, tile_fields=False):
+    """
+    Walk a category listing page by page, yielding each page's products
+    as soon as it is parsed so callers can start on them immediately
+
+    Page 1 tells how many pages the pagination bar shows; those pages are
+    then fetched concurrently and yielded in page order. Past the last
+    page shown, the walk falls back to following rel="next" one page at
+    a time.
+    
+    Args:
+        url (str): The URL of the category page
+        max_pages (int, optional): Maximum number of pages to crawl
+        page_workers (int): Listing pages fetched concurrently per category
+        tile_fields (bool): Also keep the price, discount and stock shown
+            on each product tile (see TILE_FIELDS)
         
-        print(f"Found {len(product_elements)} products on page {current_page}")
-                
+    Yields:
+        list: Dictionaries containing product names and URLs for one page
+
+    Raises:
+        requests.exceptions.RequestException: A page still failed after
+            fetch() exhausted its retries, so the listing is incomplete
+    """
+    soup, page_products = _fetch_listing_page(url, 1, tile_fields)
+    if not page_products:
+        return
+    yield page_products
+    current_page = 1
+
+    last_page = _last_page_number(soup)
+    if max_pages:
+        last_page = min(last_page, max_pages)
+    if last_page > 1 and _has_next_page(soup):
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(min(page_workers, last_page - 1), 1), thread_name_prefix="listing-page"
+        )
+        try:
+            # executor.map trả kết quả theo đúng thứ tự trang
+            for soup, page_products in executor.map(
+                lambda page: _fetch_listing_page(url, page, tile_fields), range(2, last_page + 1)
+            ):
+                if not page_products:
+                    return
+                yield page_products
+                current_page += 1
+        finally:
+            # Dừng sớm (max_products, lỗi) thì bỏ các trang chưa bắt đầu tải
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    while True:
         # Check if there's a next page
-        next_page = soup.select_one('a.page-link[rel="next"]')
-        if not next_page:
+        if not _has_next_page(soup):
             print("No more pages")
-            break
-            
-        # Increment page counter
-        current_page += 1
-        
+            return
+
         # Stop if max_pages is reached
-        if max_pages and current_page > max_pages:
+        if max_pages and current_page >= max_pages:
             print(f"Reached maximum number of pages ({max_pages})")
-            break
-    
-    return all_products
+            return
+
+        # Thanh phân trang chỉ hiện một phần các trang, dò tiếp từng trang theo rel="next"
+        current_page += 1
+        soup, page_products = _fetch_listing_page(url, current_page, tile_fields)
+        if not page_products:
+            return
+        yield page_products
 
 def save_products_to_json(products, filename):
     """
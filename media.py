@@ -0,0 +1,223 @@
+import concurrent.futures
+import hashlib
+import mimetypes
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+from dedup import url_key
+from fetcher import fetch
+from storage import atomic_path, open_db
+
+IMAGE_DIR_DEFAULT = os.path.join('data', 'images')
+MEDIA_WORKERS_DEFAULT = 8
+THUMBNAIL_SIZE_DEFAULT = 256
+QUEUE_FACTOR = 64  # Kích thước hàng đợi = QUEUE_FACTOR * số luồng tải ảnh
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_sha ON images(sha256);
+"""
+
+_STOP = object()
+
+
+class LocalStore:
+    """
+    Content-addressed file store: '<directory>/ab/abcdef....jpg'
+
+    Any object with the same exists/put/path methods (e.g. an S3 bucket
+    wrapper) can be passed to MediaDownloader instead.
+    """
+
+    def __init__(self, directory=IMAGE_DIR_DEFAULT):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, data):
+        path = self.path(key)
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        return path
+
+
+def _extension(url, content_type):
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    if ext in ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.avif'):
+        return ext
+    return mimetypes.guess_extension((content_type or '').split(';')[0].strip()) or '.bin'
+
+
+def make_thumbnail(source, destination, size=THUMBNAIL_SIZE_DEFAULT):
+    """
+    Write a JPEG thumbnail that fits in size x size; runs in a worker
+    process, needs Pillow
+
+    Returns:
+        str: destination
+    """
+    from PIL import Image
+
+    with Image.open(source) as image, atomic_path(destination) as tmp_path:
+        image.thumbnail((size, size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(tmp_path, 'JPEG', quality=85, optimize=True)
+    return destination
+
+
+class MediaDownloader:
+    """
+    Background image downloader with its own thread pool
+
+    submit() only queues the URLs, so the HTML crawl normally does not
+    wait for images. The queue is bounded like the one in pipeline.py:
+    when downloads fall far behind, submit() blocks until the workers
+    catch up, so memory stays flat on a fast crawl. Each URL is fetched
+    once per run and skipped entirely if a previous run already stored
+    it; files are named by the SHA-256 of their content, so an image
+    shared by many products is stored once. Optional thumbnails are
+    resized in a process pool.
+
+    Args:
+        directory (str): Root of the image store and its index
+        max_workers (int): Concurrent image downloads
+        thumbnail_size (int, optional): Longest side of the thumbnails;
+            None to skip them. Needs Pillow.
+        store (LocalStore, optional): Where to put the files, defaults
+            to a LocalStore under directory
+    """
+
+    def __init__(self, directory=IMAGE_DIR_DEFAULT, max_workers=MEDIA_WORKERS_DEFAULT, thumbnail_size=None,
+                 store=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.store = store or LocalStore(directory)
+        self.thumbnail_size = thumbnail_size
+        self.stats = {'queued': 0, 'downloaded': 0, 'already_stored': 0, 'same_content': 0, 'failed': 0,
+                      'thumbnails': 0}
+        self._lock = threading.Lock()
+        self._conn = open_db(os.path.join(directory, 'index.db'), _SCHEMA)
+        self._seen = set()
+        self._queue = queue.Queue(maxsize=max(max_workers * QUEUE_FACTOR, 1))
+
+        self._thumb_pool = None
+        if thumbnail_size:
+            try:
+                import PIL  # noqa: F401
+                self._thumb_pool = concurrent.futures.ProcessPoolExecutor()
+            except ImportError:
+                print("Chưa cài Pillow, bỏ qua tạo thumbnail")
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"media-{i}", daemon=True) for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, urls):
+        """
+        Queue image URLs for download; blocks while the queue is full
+        """
+        for url in urls or ():
+            key = url_key(url)
+            with self._lock:
+                if key in self._seen:
+                    continue
+                self._seen.add(key)
+                self.stats['queued'] += 1
+            self._queue.put(url)
+
+    def submit_product(self, product):
+        self.submit(product.get('image_urls'))
+
+    def path_for(self, url):
+        """
+        Local path of a downloaded image, None if it is not stored yet
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM images WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _worker(self):
+        while True:
+            url = self._queue.get()
+            if url is _STOP:
+                return
+            try:
+                self._download(url)
+            except Exception as e:
+                self._count('failed')
+                print(f"Lỗi khi tải ảnh {url}: {e}")
+
+    def _download(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM images WHERE url = ?", (url,)).fetchone()
+        if row and os.path.exists(row[0]):
+            self._count('already_stored')
+            return
+
+        response = fetch(url, stage='media')
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        data = response.content
+        digest = hashlib.sha256(data).hexdigest()
+        name = digest + _extension(url, response.headers.get('Content-Type'))
+        if self.store.exists(name):
+            # Cùng nội dung với ảnh của sản phẩm khác đã lưu
+            path = self.store.path(name)
+            self._count('same_content')
+        else:
+            path = self.store.put(name, data)
+            self._count('downloaded')
+            if self._thumb_pool is not None:
+                thumbnail = os.path.join(self.directory, 'thumbs', str(self.thumbnail_size), f"{digest}.jpg")
+                future = self._thumb_pool.submit(make_thumbnail, path, thumbnail, self.thumbnail_size)
+                future.add_done_callback(self._thumbnail_done)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (url, sha256, path, size, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, digest, path, len(data), time.time()),
+            )
+
+    def _thumbnail_done(self, future):
+        try:
+            future.result()
+            self._count('thumbnails')
+        except Exception as e:
+            print(f"Lỗi khi tạo thumbnail: {e}")
+
+    def close(self):
+        """
+        Wait for queued downloads and thumbnails to finish
+
+        Returns:
+            dict: Download statistics
+        """
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        if self._thumb_pool is not None:
+            self._thumb_pool.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+        return self.stats
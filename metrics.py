@@ -0,0 +1,266 @@
+"""
+In-process crawl metrics with a Prometheus text endpoint and a JSON summary
+
+    import metrics
+    metrics.HTTP_REQUESTS.inc(stage='product', status='200')
+    metrics.start_http_server(7860)    # GET /metrics, GET /metrics.json
+
+No client library is needed; the exposition format is written by hand.
+"""
+import json
+import threading
+import time
+
+METRICS_PORT_DEFAULT = 7860
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+_started_at = time.time()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _summary_key(key):
+    return ','.join(f"{name}={value}" for name, value in key) or 'total'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """
+    Monotonic count per label set
+    """
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def expose(self):
+        lines = self._header()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+    def summary(self):
+        return {_summary_key(key): value for key, value in sorted(self.values().items())}
+
+
+class Gauge(_Metric):
+    """
+    Current value per label set; set() it directly or register a callback
+    that is read at scrape time (e.g. a queue's qsize)
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self._values = {}
+        self._callbacks = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def track(self, callback, **labels):
+        with self._lock:
+            self._callbacks[_label_key(labels)] = callback
+
+    def untrack(self, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            callback = self._callbacks.pop(key, None)
+        # Giữ lại giá trị cuối cùng sau khi hàng đợi kết thúc
+        if callback is not None:
+            self.set(callback(), **labels)
+
+    def values(self):
+        with self._lock:
+            values = dict(self._values)
+            callbacks = dict(self._callbacks)
+        for key, callback in callbacks.items():
+            values[key] = callback()
+        return values
+
+    expose = Counter.expose
+    summary = Counter.summary
+
+
+class Histogram(_Metric):
+    """
+    Bucketed distribution per label set, with count and sum
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def _snapshot(self):
+        with self._lock:
+            return {key: (list(counts), count, total) for key, (counts, count, total) in self._values.items()}
+
+    def expose(self):
+        lines = self._header()
+        for key, (counts, count, total) in sorted(self._snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+        return lines
+
+    def _quantile(self, counts, count, q):
+        # Nội suy tuyến tính trong bucket chứa phân vị, như histogram_quantile của Prometheus
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = bound
+        return self.buckets[-1]
+
+    def summary(self):
+        result = {}
+        for key, (counts, count, total) in sorted(self._snapshot().items()):
+            if not count:
+                continue
+            result[_summary_key(key)] = {
+                'count': count,
+                'mean': round(total / count, 6),
+                'p50': round(self._quantile(counts, count, 0.5), 6),
+                'p95': round(self._quantile(counts, count, 0.95), 6),
+            }
+        return result
+
+
+HTTP_REQUESTS = Counter('mediamart_http_requests_total', 'HTTP responses by stage and status code')
+HTTP_PHASE_SECONDS = Histogram(
+    'mediamart_http_phase_seconds', 'Time spent in dns, connect, ttfb and download per request'
+)
+HTTP_BYTES = Counter('mediamart_http_bytes_total', 'Bytes received on the wire and after decoding')
+HTTP_RETRIES = Counter('mediamart_http_retries_total', 'Requests retried after a transient failure')
+CACHE_HITS = Counter('mediamart_http_cache_hits_total', 'Responses served from the on-disk cache')
+PARSE_SECONDS = Histogram('mediamart_parse_seconds', 'HTML parse and extraction time per page')
+ITEMS = Counter('mediamart_items_total', 'Pages and products processed by stage and result')
+QUEUE_DEPTH = Gauge('mediamart_queue_depth', 'Items waiting in crawl queues')
+
+
+def expose():
+    """
+    Every registered metric in the Prometheus text exposition format
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.expose())
+    lines.append("# TYPE mediamart_uptime_seconds gauge")
+    lines.append(f"mediamart_uptime_seconds {time.time() - _started_at:.3f}")
+    return '\n'.join(lines) + '\n'
+
+
+def summary():
+    """
+    JSON-friendly snapshot: counters as totals per label set, histograms
+    as count/mean/p50/p95
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+    result = {'uptime_seconds': round(time.time() - _started_at, 3)}
+    for metric in metrics:
+        result[metric.name] = metric.summary()
+    return result
+
+
+def write_summary(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary(), f, ensure_ascii=False, indent=4)
+
+
+def start_http_server(port=METRICS_PORT_DEFAULT, host='0.0.0.0'):
+    """
+    Serve /metrics (Prometheus) and /metrics.json from a daemon thread
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = expose().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif self.path == '/metrics.json':
+                body = json.dumps(summary(), ensure_ascii=False).encode('utf-8')
+                content_type = 'application/json; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,182 @@
+import re
+import sys
+
+ROW_GROUP_SIZE = 10000
+
+_DIGITS = re.compile(r'\d+')
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def parse_price(text):
+    """
+    Convert a price string such as '12.990.000₫' to integer VND
+
+    Returns:
+        int or None: Price in VND, None when the text holds no digits
+    """
+    if not text:
+        return None
+    digits = ''.join(_DIGITS.findall(text))
+    return int(digits) if digits else None
+
+
+def parse_number(text):
+    """
+    Parse the first number in a string such as '-15%' or '4,5' as a float,
+    ignoring the sign (discounts are stored as positive percentages)
+    """
+    if text is None:
+        return None
+    match = _NUMBER.search(str(text))
+    if not match:
+        return None
+    return float(match.group(0).replace(',', '.'))
+
+
+def parse_int(text):
+    if text is None:
+        return None
+    match = _DIGITS.search(str(text))
+    return int(match.group(0)) if match else None
+
+
+def product_row(product):
+    """
+    Typed, flat row for the products table
+    """
+    discount = product.get('discount_percentage')
+    return {
+        'url': product.get('url') or product.get('product_url'),
+        'product_url': product.get('product_url'),
+        'name': product.get('name'),
+        'model': product.get('model'),
+        'brand': product.get('brand'),
+        'warranty': product.get('warranty'),
+        'origin': product.get('origin'),
+        'price_vnd': parse_price(product.get('price')),
+        'original_price_vnd': parse_price(product.get('original_price')),
+        # Chỉ coi là phần trăm khi chuỗi có dấu %, tránh nhầm với số tiền tiết kiệm
+        'discount_pct': parse_number(discount) if discount and '%' in discount else None,
+        'rating': parse_number(product.get('rating')),
+        'reviews_count': parse_int(product.get('reviews_count')),
+        'key_features': product.get('key_features') or [],
+        'image_urls': product.get('image_urls') or [],
+        'categories': product.get('categories') or [],
+        'description': product.get('description'),
+    }
+
+
+def _schemas():
+    import pyarrow as pa
+
+    products = pa.schema([
+        ('url', pa.string()),
+        ('product_url', pa.string()),
+        ('name', pa.string()),
+        ('model', pa.string()),
+        ('brand', pa.string()),
+        ('warranty', pa.string()),
+        ('origin', pa.string()),
+        ('price_vnd', pa.int64()),
+        ('original_price_vnd', pa.int64()),
+        ('discount_pct', pa.float32()),
+        ('rating', pa.float32()),
+        ('reviews_count', pa.int32()),
+        ('key_features', pa.list_(pa.string())),
+        ('image_urls', pa.list_(pa.string())),
+        ('categories', pa.list_(pa.string())),
+        ('description', pa.string()),
+    ])
+    specifications = pa.schema([
+        ('url', pa.string()),
+        ('key', pa.string()),
+        ('value', pa.string()),
+    ])
+    return products, specifications
+
+
+class ParquetProductWriter:
+    """
+    Write products to two Parquet files: one typed row per product and a
+    long (url, key, value) table for specifications
+
+    Rows are buffered and flushed one row group at a time, so products
+    can be written incrementally with bounded memory. Requires pyarrow.
+
+    Args:
+        stem (str): Output path without extension; writes
+            '<stem>.parquet' and '<stem>_specs.parquet'
+        row_group_size (int): Products per row group
+    """
+
+    def __init__(self, stem, row_group_size=ROW_GROUP_SIZE):
+        import pyarrow.parquet as pq
+
+        self.products_path = f"{stem}.parquet"
+        self.specs_path = f"{stem}_specs.parquet"
+        self.row_group_size = row_group_size
+        self.count = 0
+        self._products_schema, self._specs_schema = _schemas()
+        self._products_writer = pq.ParquetWriter(self.products_path, self._products_schema, compression='zstd')
+        self._specs_writer = pq.ParquetWriter(self.specs_path, self._specs_schema, compression='zstd')
+        self._rows = []
+        self._specs = []
+
+    def write(self, product):
+        row = product_row(product)
+        self._rows.append(row)
+        for key, value in (product.get('specifications') or {}).items():
+            self._specs.append({'url': row['url'], 'key': key, 'value': value})
+        self.count += 1
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+
+        if self._rows:
+            self._products_writer.write_table(pa.Table.from_pylist(self._rows, schema=self._products_schema))
+            self._rows = []
+        if self._specs:
+            self._specs_writer.write_table(pa.Table.from_pylist(self._specs, schema=self._specs_schema))
+            self._specs = []
+
+    def close(self):
+        self.flush()
+        self._products_writer.close()
+        self._specs_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_products_to_parquet(products, stem, row_group_size=ROW_GROUP_SIZE):
+    """
+    Stream an iterable of product dicts into Parquet files
+
+    Args:
+        products (iterable): Product dicts, e.g. sinks.read_jsonl(path)
+        stem (str): Output path without extension
+
+    Returns:
+        int: Number of products written
+    """
+    with ParquetProductWriter(stem, row_group_size) as writer:
+        for product in products:
+            writer.write(product)
+    print(f"Đã lưu {writer.count} sản phẩm vào {writer.products_path} và {writer.specs_path}")
+    return writer.count
+
+
+if __name__ == "__main__":
+    from sinks import read_jsonl
+
+    if len(sys.argv) != 2:
+        print("Cách dùng: python parquet_export.py data/all_products_<timestamp>.jsonl[.gz|.zst]")
+        sys.exit(1)
+    source = sys.argv[1]
+    stem = re.sub(r'\.jsonl(\.gz|\.zst)?$', '', source)
+    export_products_to_parquet(read_jsonl(source), stem)
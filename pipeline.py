@@ -0,0 +1,307 @@
+import itertools
+import queue
+import threading
+import time
+import concurrent.futures
+
+from fetcher import is_transient
+from frontier import FAILED, PENDING
+from listproduct import crawl_cap_noi_products, iter_category_pages
+from metrics import ITEMS, QUEUE_DEPTH
+from product import scrape_mediamart_product
+from ratelimit import RETRY_PASSES, backoff_delay
+
+LISTING_WORKERS_DEFAULT = 4   # Số danh mục được quét đồng thời
+QUEUE_FACTOR = 4              # Kích thước hàng đợi = QUEUE_FACTOR * số luồng chi tiết
+WINDOW_FACTOR = 2             # Số task đã submit tối đa = WINDOW_FACTOR * số luồng
+
+_DONE = object()
+
+
+def windowed_map(fn, items, max_workers, window=None):
+    """
+    Run fn over items on a thread pool, submitting lazily
+
+    At most `window` tasks are submitted at a time and the next item is
+    only pulled from the iterator when one finishes, so memory does not
+    grow with the number of items. Results come back in completion order.
+
+    Args:
+        fn (callable): Called with one item per task
+        items (iterable): Items to process, consumed lazily
+        max_workers (int): Number of threads
+        window (int, optional): Tasks in flight, defaults to
+            WINDOW_FACTOR * max_workers
+
+    Yields:
+        tuple: (item, future) for each finished task; call future.result()
+    """
+    window = window or max(max_workers * WINDOW_FACTOR, 1)
+    items = iter(items)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(fn, item): item for item in itertools.islice(items, window)}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                # Nạp task mới trước khi trả kết quả để luồng không phải chờ người gọi ghi file
+                for next_item in itertools.islice(items, 1):
+                    pending[executor.submit(fn, next_item)] = next_item
+                yield item, future
+
+
+def crawl_pipeline(categories, max_pages=None, max_products=None, max_workers=10,
+                   listing_workers=LISTING_WORKERS_DEFAULT, on_product=None, desc="Crawling", dedup=None,
+                   frontier=None, scrape=scrape_mediamart_product, tile_fields=False, reuse=None,
+                   on_category=None):
+    """
+    Crawl listing and detail pages at the same time
+
+    Listing threads walk several categories concurrently and push every
+    product they find into a bounded queue; detail threads start scraping
+    as soon as the first URL arrives. When detail workers fall behind the
+    queue fills up and listing threads block, so memory stays bounded.
+    Products whose detail fetch still fails with a transient error
+    (connection error, timeout, 429/5xx) are set aside and retried in up
+    to RETRY_PASSES deferred passes, after a backoff, once the main queue
+    has drained; other failures such as a 404 or a parse error are final
+    at once. A category whose listing page fails the same way is listed
+    again in those passes (products already queued are skipped by dedup
+    and the frontier).
+
+    Args:
+        categories (list): Category dicts (name, url) to walk
+        max_pages (int, optional): Maximum listing pages per category
+        max_products (int, optional): Stop listing after this many products
+        max_workers (int): Number of detail scraping threads
+        listing_workers (int): Number of categories listed concurrently
+        on_product (callable, optional): Called with each finished product
+            from the consumer thread; products are collected into the
+            returned list when omitted
+        desc (str): Label for the progress bar
+        dedup (UrlDeduper, optional): Crawl-wide seen-set; products already
+            queued from another category are dropped before the detail fetch
+        frontier (CrawlFrontier, optional): On-disk state; URLs left pending
+            by a previous run are queued first, finished categories are not
+            listed again and every product is checkpointed as it completes
+        scrape (callable): Function fetching one product URL, e.g.
+            IncrementalCrawler.scrape; defaults to scrape_mediamart_product
+        tile_fields (bool): Keep price, discount and stock from the listing
+            tiles (listing-only fast mode)
+        reuse (callable, optional): Called with each listing entry before
+            the detail fetch; a returned dict is used as the product and
+            the fetch is skipped, e.g. IncrementalCrawler.reuse_unchanged_tile
+        on_category (callable, optional): Called with (category, entries)
+            once a category has been listed completely, with every listing
+            entry found in it, e.g. CategoryScheduler.record
+
+    Returns:
+        list: Product detail dicts (empty when on_product is given)
+    """
+    from tqdm import tqdm
+
+    product_queue = queue.Queue(maxsize=max(max_workers * QUEUE_FACTOR, 1))
+    stop_listing = threading.Event()
+    queued_lock = threading.Lock()
+    queued = [0]
+
+    results = []
+    results_lock = threading.Lock()
+    retry_later = []
+    retry_categories = []
+
+    def enqueue(product):
+        with queued_lock:
+            if max_products and queued[0] >= max_products:
+                stop_listing.set()
+                return False
+            queued[0] += 1
+        # Chặn khi hàng đợi đầy để luồng chi tiết kịp xử lý
+        product_queue.put(product)
+        return True
+
+    def list_category(category):
+        if frontier is not None and frontier.category_done(category['url']):
+            print(f"Bỏ qua danh mục đã quét xong: {category['name']}")
+            return
+        listed = [] if on_category is not None else None
+        for page_products in iter_category_pages(category['url'], max_pages, tile_fields=tile_fields):
+            if listed is not None:
+                listed.extend(page_products)
+            for product in page_products:
+                if stop_listing.is_set():
+                    return
+                if dedup is not None and not dedup.add(product, category['name']):
+                    continue
+                if frontier is not None and not frontier.add(product):
+                    continue
+                if not enqueue(product):
+                    return
+        if frontier is not None:
+            frontier.mark_category_done(category['url'])
+        if on_category is not None:
+            on_category(category, listed)
+
+    def produce():
+        try:
+            if frontier is not None:
+                counts = frontier.counts()
+                resumed = counts[PENDING] + counts[FAILED]
+                if resumed:
+                    print(f"Tiếp tục {resumed} sản phẩm còn dang dở từ lần chạy trước")
+                # Đọc dần từ file trạng thái thay vì nạp toàn bộ danh sách vào bộ nhớ
+                for product in frontier.iter_pending():
+                    if dedup is not None:
+                        dedup.add(product)
+                    if not enqueue(product):
+                        break
+            list_categories(categories, final=RETRY_PASSES == 0)
+        finally:
+            # Luôn báo dừng, kể cả khi luồng quét danh mục lỗi, để các luồng chi tiết không chờ mãi
+            for _ in range(max_workers):
+                product_queue.put(_DONE)
+
+    def list_categories(categories, final):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=listing_workers) as executor:
+            futures = {executor.submit(list_category, category): category for category in categories}
+            for future in concurrent.futures.as_completed(futures):
+                category = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    if final or not is_transient(e):
+                        print(f"Lỗi khi quét danh mục {category['name']}: {e}")
+                        continue
+                    # Trang danh mục vẫn lỗi sau khi fetch() đã thử lại: quét lại ở lượt sau
+                    print(f"Danh mục {category['name']} chưa quét hết, sẽ quét lại sau: {e}")
+                    with results_lock:
+                        retry_categories.append(category)
+
+    def fail(product, error, final, pbar):
+        if not final:
+            # Để lại cho lượt thử lại sau, khi host có thể đã hết quá tải
+            with results_lock:
+                retry_later.append(product)
+            return
+        if frontier is not None:
+            frontier.mark_failed(product['url'], error)
+        ITEMS.inc(stage='product', result='failed')
+        print(f"Lỗi khi crawl sản phẩm {product['url']}: {error}")
+        pbar.update(1)
+
+    def consume(pbar, final):
+        while True:
+            product = product_queue.get()
+            if product is _DONE:
+                return
+            try:
+                if frontier is not None:
+                    frontier.mark_in_flight(product['url'])
+                detail = reuse(product) if reuse is not None else None
+                if detail is None:
+                    detail = scrape(product['url'])
+                if detail and 'error' not in detail:
+                    # Thêm thông tin từ danh sách sản phẩm nếu cần
+                    for key in product:
+                        if key not in detail:
+                            detail[key] = product[key]
+                    if frontier is not None:
+                        frontier.mark_done(product['url'], detail)
+                    if on_product is not None:
+                        on_product(detail)
+                    else:
+                        with results_lock:
+                            results.append(detail)
+                    ITEMS.inc(stage='product', result='ok')
+                    pbar.update(1)
+                else:
+                    # Chỉ lỗi tạm thời mới được thử lại; 404 hay trang lỗi thì thử lại cũng vậy
+                    fail(product, detail.get('error', 'Unknown error'),
+                         final or not is_transient(detail.get('status')), pbar)
+            except Exception as e:
+                fail(product, e, final or not is_transient(e), pbar)
+
+    def run_consumers(pbar, final):
+        consumers = [
+            threading.Thread(target=consume, args=(pbar, final), name=f"detail-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for consumer in consumers:
+            consumer.start()
+        for consumer in consumers:
+            consumer.join()
+
+    QUEUE_DEPTH.track(product_queue.qsize, queue='product')
+    QUEUE_DEPTH.track(lambda: len(retry_later), queue='retry')
+    producer = threading.Thread(target=produce, name="listing-producer", daemon=True)
+    with tqdm(desc=desc, unit="sp") as pbar:
+        producer.start()
+        run_consumers(pbar, final=RETRY_PASSES == 0)
+        producer.join()
+
+        for retry_pass in range(RETRY_PASSES):
+            if not retry_later and not retry_categories:
+                break
+            products, retry_later[:] = list(retry_later), []
+            pending_categories, retry_categories[:] = list(retry_categories), []
+            delay = backoff_delay(retry_pass + 1)
+            print(f"Thử lại {len(products)} sản phẩm và {len(pending_categories)} danh mục lỗi sau {delay:.1f}s "
+                  f"(lượt {retry_pass + 1}/{RETRY_PASSES})")
+            time.sleep(delay)
+            final = retry_pass == RETRY_PASSES - 1
+
+            # Hàng đợi đã rỗng; luồng nạp chạy song song với luồng chi tiết nên không bị chặn
+            def refill(products, pending_categories, final):
+                for product in products:
+                    product_queue.put(product)
+                list_categories(pending_categories, final)
+                for _ in range(max_workers):
+                    product_queue.put(_DONE)
+
+            feeder = threading.Thread(target=refill, args=(products, pending_categories, final),
+                                      name="retry-producer", daemon=True)
+            feeder.start()
+            run_consumers(pbar, final=final)
+            feeder.join()
+
+    QUEUE_DEPTH.untrack(queue='product')
+    QUEUE_DEPTH.untrack(queue='retry')
+
+    return results
+
+
+def collect_product_links(categories, max_pages=None, max_products=None, listing_workers=LISTING_WORKERS_DEFAULT,
+                          dedup=None):
+    """
+    Walk several categories concurrently and return all product links,
+    for engines that need the complete list up front
+
+    Args:
+        categories (list): Category dicts (name, url) to walk
+        max_pages (int, optional): Maximum listing pages per category
+        max_products (int, optional): Maximum number of links to return
+        listing_workers (int): Number of categories listed concurrently
+        dedup (UrlDeduper, optional): Crawl-wide seen-set used to drop repeats
+
+    Returns:
+        list: Product dicts (name, url) in category order
+    """
+    def list_category(category):
+        try:
+            # Quét lại danh mục sau một lúc nếu trang danh mục vẫn lỗi tạm thời
+            return crawl_cap_noi_products(category['url'], max_pages)
+        except Exception as e:
+            print(f"Lỗi khi quét danh mục {category['name']}: {e}")
+            return []
+
+    all_product_links = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=listing_workers) as executor:
+        for category, links in zip(categories, executor.map(list_category, categories)):
+            print(f"Tìm thấy {len(links)} sản phẩm trong danh mục {category['name']}")
+            if dedup is not None:
+                links = dedup.filter(links, category['name'])
+            all_product_links.extend(links)
+
+    if max_products and len(all_product_links) > max_products:
+        all_product_links = all_product_links[:max_products]
+    return all_product_links
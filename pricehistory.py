@@ -0,0 +1,287 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from parquet_export import parse_number, parse_price
+from storage import open_db
+
+PRICE_HISTORY_FILE_DEFAULT = os.path.join('data', 'price_history.db')
+BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    model TEXT,
+    name TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_products_model ON products(model);
+CREATE TABLE IF NOT EXISTS observations (
+    product_id INTEGER NOT NULL,
+    crawl_id INTEGER NOT NULL,
+    observed_at REAL NOT NULL,
+    price INTEGER,
+    original_price INTEGER,
+    discount_pct REAL,
+    PRIMARY KEY (product_id, crawl_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_observations_time ON observations(observed_at);
+CREATE TABLE IF NOT EXISTS latest (
+    product_id INTEGER PRIMARY KEY,
+    price INTEGER,
+    original_price INTEGER,
+    discount_pct REAL,
+    last_seen_crawl INTEGER NOT NULL
+);
+"""
+
+_FILE_TIMESTAMP = re.compile(r'(\d{8}_\d{6})')
+
+
+def price_values(product):
+    """
+    Typed price fields of a scraped product
+
+    Returns:
+        tuple: (price, original_price) in VND and the discount in percent,
+        each None when the page does not show it
+    """
+    discount = product.get('discount_percentage')
+    return (
+        parse_price(product.get('price')),
+        parse_price(product.get('original_price')),
+        # Chỉ coi là phần trăm khi chuỗi có dấu %, giống parquet_export.product_row
+        parse_number(discount) if discount and '%' in discount else None,
+    )
+
+
+def start_of_today():
+    return time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+
+
+class PriceHistory:
+    """
+    Time series of product prices across crawls
+
+    Every instance that records something is one crawl. record() stores
+    an observation only when the price, original price or discount
+    differs from the last one seen for that product, so the history holds
+    one row per change instead of one per run. Products are keyed by URL
+    and indexed by model; the observations are clustered by (product,
+    crawl) and indexed by time. Safe to call record() from several threads.
+
+    Args:
+        path (str): SQLite file holding the history
+        started_at (float, optional): Time of the crawl, defaults to now
+        source (str, optional): Where the observations come from, e.g. a file name
+    """
+
+    def __init__(self, path=PRICE_HISTORY_FILE_DEFAULT, started_at=None, source=None):
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+        self.started_at = started_at or time.time()
+        self.source = source
+        # Lần crawl chỉ được tạo khi có quan sát đầu tiên, để chỉ truy vấn thì không ghi gì
+        self.crawl_id = None
+        self.stats = {'seen': 0, 'new': 0, 'changed': 0, 'unchanged': 0}
+        self._pending = []
+
+    def record(self, product, observed_at=None):
+        """
+        Queue a product's prices; written in batches of BATCH_SIZE
+        """
+        url = product.get('url') or product.get('product_url')
+        if not url:
+            return
+        row = (url, product.get('model'), product.get('name'), observed_at or time.time(), *price_values(product))
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= BATCH_SIZE:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            if self.crawl_id is None:
+                self.crawl_id = conn.execute(
+                    "INSERT INTO crawls (started_at, source) VALUES (?, ?)", (self.started_at, self.source)
+                ).lastrowid
+            for url, model, name, observed_at, *prices in rows:
+                conn.execute(
+                    "INSERT INTO products (url, model, name) VALUES (?, ?, ?) ON CONFLICT(url) DO UPDATE SET "
+                    "model = COALESCE(excluded.model, model), name = COALESCE(excluded.name, name)",
+                    (url, model, name),
+                )
+                product_id = conn.execute("SELECT id FROM products WHERE url = ?", (url,)).fetchone()[0]
+                last = conn.execute(
+                    "SELECT price, original_price, discount_pct FROM latest WHERE product_id = ?", (product_id,)
+                ).fetchone()
+                self.stats['seen'] += 1
+                if last is not None and list(last) == prices:
+                    conn.execute(
+                        "UPDATE latest SET last_seen_crawl = ? WHERE product_id = ?", (self.crawl_id, product_id)
+                    )
+                    self.stats['unchanged'] += 1
+                    continue
+                # Cùng sản phẩm xuất hiện hai lần trong một lần crawl: giữ quan sát sau cùng
+                conn.execute(
+                    "INSERT OR REPLACE INTO observations "
+                    "(product_id, crawl_id, observed_at, price, original_price, discount_pct) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (product_id, self.crawl_id, observed_at, *prices),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO latest (product_id, price, original_price, discount_pct, last_seen_crawl) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (product_id, *prices, self.crawl_id),
+                )
+                self.stats['changed' if last else 'new'] += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def history(self, model=None, url=None):
+        """
+        Every recorded price change of a product, oldest first
+
+        Args:
+            model (str, optional): Product model, may match several URLs
+            url (str, optional): Product URL
+
+        Returns:
+            list: Dicts with url, model, observed_at, price, original_price
+            and discount_pct
+        """
+        if (model is None) == (url is None):
+            raise ValueError("Pass exactly one of model or url")
+        column, value = ('model', model) if model is not None else ('url', url)
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.url, p.model, o.observed_at, o.price, o.original_price, o.discount_pct "
+                f"FROM products p JOIN observations o ON o.product_id = p.id WHERE p.{column} = ? "
+                "ORDER BY p.url, o.crawl_id",
+                (value,),
+            ).fetchall()
+        keys = ('url', 'model', 'observed_at', 'price', 'original_price', 'discount_pct')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def discount_changes(self, since=None):
+        """
+        Products whose discount changed at or after `since`
+
+        Args:
+            since (float, optional): Unix time, defaults to the start of today
+
+        Returns:
+            list: Dicts with url, model, name, observed_at, the old and new
+            discount_pct and the current price
+        """
+        since = start_of_today() if since is None else since
+        self.flush()
+        with self._lock:
+            # Chỉ quan sát thay đổi được lưu, nên mọi dòng trong khoảng thời gian
+            # (trừ lần đầu thấy sản phẩm) đều so được với dòng ngay trước nó
+            rows = self._conn.execute(
+                """
+                SELECT p.url, p.model, p.name, o.observed_at, prev.discount_pct, o.discount_pct, o.price
+                FROM observations o
+                JOIN products p ON p.id = o.product_id
+                JOIN observations prev ON prev.product_id = o.product_id AND prev.crawl_id = (
+                    SELECT MAX(crawl_id) FROM observations
+                    WHERE product_id = o.product_id AND crawl_id < o.crawl_id
+                )
+                WHERE o.observed_at >= ? AND o.discount_pct IS NOT prev.discount_pct
+                ORDER BY o.observed_at
+                """,
+                (since,),
+            ).fetchall()
+        keys = ('url', 'model', 'name', 'observed_at', 'old_discount_pct', 'discount_pct', 'price')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def import_file(path, history_path=PRICE_HISTORY_FILE_DEFAULT):
+    """
+    Load the prices of an existing all_products_<timestamp> file as one crawl
+
+    The crawl time is read from the timestamp in the file name, falling
+    back to the file's modification time. Import files oldest first.
+
+    Returns:
+        dict: Counts of new, changed and unchanged products
+    """
+    from sinks import read_jsonl
+
+    match = _FILE_TIMESTAMP.search(os.path.basename(path))
+    if match:
+        started_at = time.mktime(time.strptime(match.group(1), '%Y%m%d_%H%M%S'))
+    else:
+        started_at = os.path.getmtime(path)
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            products = json.load(f)
+    else:
+        products = read_jsonl(path)
+    with PriceHistory(history_path, started_at, source=os.path.basename(path)) as history:
+        for product in products:
+            history.record(product, observed_at=started_at)
+    return history.stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lịch sử giá sản phẩm")
+    parser.add_argument('--file', default=PRICE_HISTORY_FILE_DEFAULT,
+                        help=f"File SQLite lịch sử giá (mặc định: {PRICE_HISTORY_FILE_DEFAULT})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="Nạp các file all_products_<timestamp> đã crawl")
+    import_parser.add_argument('paths', nargs='+')
+    history_parser = commands.add_parser('history', help="Lịch sử giá của một model hoặc URL")
+    history_parser.add_argument('--model')
+    history_parser.add_argument('--url')
+    discounts_parser = commands.add_parser('discounts', help="Sản phẩm đổi mức giảm giá từ đầu ngày")
+    discounts_parser.add_argument('--days', type=float, default=0,
+                                  help="Tính thêm số ngày trước hôm nay (mặc định: 0)")
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        # Sắp theo tên file (chứa timestamp) để các lần crawl được nạp theo thứ tự thời gian
+        for path in sorted(args.paths, key=os.path.basename):
+            print(f"{path}: {import_file(path, args.file)}")
+        sys.exit(0)
+
+    with PriceHistory(args.file) as history:
+        if args.command == 'history':
+            rows = history.history(model=args.model, url=args.url)
+        else:
+            rows = history.discount_changes(start_of_today() - args.days * 86400)
+    print(json.dumps(rows, ensure_ascii=False, indent=4))
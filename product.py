@@ -1,41 +1,56 @@
-import requests
 from bs4 import BeautifulSoup
-import json
+import os
 import re
-import pandas as pd
+import time
+
+from fetcher import fetch
+from metrics import PARSE_SECONDS
 
 def scrape_mediamart_product(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
-    response = requests.get(url, headers=headers)
+    response = fetch(url, stage='product')
     if response.status_code != 200:
-        return {"error": f"Failed to fetch the page: {response.status_code}"}
-    soup = BeautifulSoup(response.text, 'html.parser')    # Extract basic product information
+        return {"error": f"Failed to fetch the page: {response.status_code}", "status": response.status_code}
+    start = time.perf_counter()
+    product = parse_mediamart_product(response.text, url)
+    PARSE_SECONDS.observe(time.perf_counter() - start, stage='product')
+    return product
+
+def parse_mediamart_product(html, url, backend=None, timings=None):
+    """
+    Extract product fields from an already downloaded product page.
+    Kept free of network access so it can run in a worker process.
+    
+    Args:
+        html (str): Product page HTML
+        url (str): URL the page was fetched from
+        backend (str, optional): 'lxml', 'html.parser' or 'selectolax';
+            defaults to PARSER_BACKEND
+        timings (dict, optional): When given, seconds spent on each
+            extraction step are added to it (used by benchmark.py)
+    """
+    doc = _get_backend(backend or PARSER_BACKEND)
+    clock = _StepClock(timings)
+    root = doc.parse(html)
+    clock.lap("parse")
+    
+    # Extract basic product information
     product_data = {
-        "name": soup.select_one('.pdetail-name h1').text.strip() if soup.select_one('.pdetail-name h1') else None,
-        "price": soup.select_one('.pdetail-price-box h3').text.strip() if soup.select_one('.pdetail-price-box h3') else None,
-        "original_price": soup.select_one('.product-price-regular').text.strip() if soup.select_one('.product-price-regular') else None,
-        "discount_percentage": soup.select_one('.product-price-saving').text.strip() if soup.select_one('.product-price-saving') else None,
+        "name": doc.text_of(doc.select_one(root, '.pdetail-name h1')),
+        "price": doc.text_of(doc.select_one(root, '.pdetail-price-box h3')),
+        "original_price": doc.text_of(doc.select_one(root, '.product-price-regular')),
+        "discount_percentage": doc.text_of(doc.select_one(root, '.product-price-saving')),
         "product_url": url,
     }
-      # Extract model from pdetail-info
-    model_element = soup.select_one('.pdetail-info p:first-child b:first-child')
-    if model_element:
-        product_data["model"] = model_element.text.strip()
-    else:
-        product_data["model"] = None
-        
-    # Extract brand and other information from product specifications table
-    # Look for brand in the specifications table
-    brand_row = soup.select_one('table.table.table-striped tr:has(td:contains("Thương hiệu"))')
-    if brand_row:
-        brand_element = brand_row.select_one('td:nth-child(2) span')
-        if brand_element:
-            product_data["brand"] = brand_element.text.strip()
-        else:
-            product_data["brand"] = None
+    # Extract model from pdetail-info
+    product_data["model"] = doc.text_of(doc.select_one(root, '.pdetail-info p:first-child b:first-child'))
+    clock.lap("name_price_model")
+    
+    # One pass over the specifications table: builds the spec dict and
+    # picks the value element of each SPEC_LABELS field by its spec key
+    specs, labelled = _extract_specifications(doc, root)
+    
+    if "brand" in labelled:
+        product_data["brand"] = doc.text_of(labelled["brand"])
     else:
         # Fallback to extracting from product name if brand not found in table
         if product_data["name"]:
@@ -44,96 +59,202 @@ def scrape_mediamart_product(url):
                 product_data["brand"] = "Coex"  # Since it's a Coex product as per name
         else:
             product_data["brand"] = None
-            
-    # Extract warranty period
-    warranty_row = soup.select_one('table.table.table-striped tr:has(td:contains("Bảo hành"))')
-    if warranty_row:
-        warranty_element = warranty_row.select_one('td:nth-child(2) span')
-        if warranty_element:
-            product_data["warranty"] = warranty_element.text.strip()
-            
-    # Extract origin country
-    origin_row = soup.select_one('table.table.table-striped tr:has(td:contains("Xuất xứ"))')
-    if origin_row:
-        origin_element = origin_row.select_one('td:nth-child(2) span')
-        if origin_element:
-            product_data["origin"] = origin_element.text.strip()
-      # Extract key features
+    
+    for field in ("warranty", "origin"):
+        if labelled.get(field) is not None:
+            product_data[field] = doc.text_of(labelled[field])
+    clock.lap("specifications")
+    
+    # Extract key features
     features = []
-    feature_elements = soup.select('.pdetail-des ul li')
-    for feature in feature_elements:
-        if feature.text.strip():
-            features.append(feature.text.strip())
+    for feature in doc.select(root, '.pdetail-des ul li'):
+        text = doc.text(feature).strip()
+        if text:
+            features.append(text)
     product_data["key_features"] = features
+    clock.lap("key_features")
     
-    # Extract technical specifications
+    product_data["specifications"] = specs
+    
+    # Extract product description (id="gioi-thieu-san-pham" is the correct selector)
+    description = doc.select_one(root, '#gioi-thieu-san-pham')
+    if description is not None:
+        product_data["description"] = '\n'.join(doc.strings(description))
+    clock.lap("description")
+    
+    # Extract product images, removing duplicates (carousels clone slides)
+    image_urls = []
+    unique_urls = set()
+    for img in doc.select(root, '.pdetail-slideproduct img'):
+        img_url = doc.attr(img, 'data-src')
+        if img_url and img_url not in unique_urls:
+            unique_urls.add(img_url)
+            image_urls.append(img_url)
+    product_data["image_urls"] = image_urls
+    clock.lap("image_urls")
+    
+    # Extract rating information
+    rating_element = doc.select_one(root, '.rating-value')
+    if rating_element is not None:
+        product_data["rating"] = doc.text_of(rating_element)
+    
+    # Extract review count from product-review-list
+    reviews_count_element = doc.select_one(root, '.product-review-list span')
+    if reviews_count_element is not None:
+        # Extract the number from text like "(1) đánh giá | Viết nhận xét"
+        review_match = re.search(r'\((\d+)\)', doc.text_of(reviews_count_element))
+        product_data["reviews_count"] = review_match.group(1) if review_match else "0"
+    clock.lap("rating_reviews")
+    
+    return product_data
+
+class _StepClock:
+    """
+    Accumulates elapsed time per step into a dict; a no-op without one
+    """
+    def __init__(self, timings):
+        self.timings = timings
+        self.last = time.perf_counter() if timings is not None else None
+    
+    def lap(self, step):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[step] = self.timings.get(step, 0.0) + now - self.last
+        self.last = now
+
+# Rows whose label contains these words also fill the top-level fields
+SPEC_LABELS = {
+    "brand": "Thương hiệu",
+    "warranty": "Bảo hành",
+    "origin": "Xuất xứ",
+}
+
+def _extract_specifications(doc, root):
     specs = {}
-    spec_rows = soup.select('table.table.table-striped tr')
-    for row in spec_rows:
+    labelled = {}
+    for row in doc.select(root, 'table.table.table-striped tr'):
+        cells = doc.select(row, 'td')
+        
         # Skip header rows
-        if row.select_one('th'):
+        if doc.select_one(row, 'th') is not None:
             continue
-            
-        # Extract specification key and value
-        cells = row.select('td')
+        
         if len(cells) == 2:
-            key = cells[0].text.strip().rstrip(':')
-            # Extract text from all li elements in the value cell
+            key = doc.text(cells[0]).strip().rstrip(':')
             value_cell = cells[1]
-            value_items = value_cell.select('li')
+            for field, label in SPEC_LABELS.items():
+                if field not in labelled and label in key:
+                    # Chỉ lấy giá trị nằm trong thẻ span như trước, để kết quả không đổi
+                    labelled[field] = doc.select_one(value_cell, 'span')
+            value_items = doc.select(value_cell, 'li')
             
             if value_items:
                 # If there are multiple items, join them with commas
                 values = []
                 for item in value_items:
-                    # Extract just the text, avoiding nested elements
-                    item_text = item.get_text(strip=True)
+                    item_text = ''.join(doc.strings(item))
                     if item_text:
                         values.append(item_text)
-                        
-                if len(values) == 1:
-                    specs[key] = values[0]
-                else:
-                    specs[key] = ", ".join(values)
+                specs[key] = values[0] if len(values) == 1 else ", ".join(values)
             else:
                 # If no li elements, just get the text
-                specs[key] = value_cell.text.strip()
+                specs[key] = doc.text(value_cell).strip()
+    return specs, labelled
+
+class _SoupBackend:
+    """
+    BeautifulSoup with a configurable tree builder ('lxml' or 'html.parser')
+    """
+    def __init__(self, features):
+        self.features = features
     
-    product_data["specifications"] = specs
-      # Extract product description (id="gioi-thieu-san-pham" is the correct selector)
-    description = soup.select_one('#gioi-thieu-san-pham')
-    if description:
-        product_data["description"] = description.get_text(separator='\n', strip=True)    # Extract product images
-    image_urls = []
-    image_elements = soup.select('.pdetail-slideproduct img')
-    # Remove duplicate images by using a set of URLs
-    unique_urls = set()
-    for img in image_elements:
-        if img.get('data-src'):
-            # Only add non-cloned images to avoid duplicates
-            img_url = img.get('data-src')
-            # Convert .webp URLs to .jpg URLs for better compatibility
-            if img_url not in unique_urls:
-                unique_urls.add(img_url)
-                image_urls.append(img_url)
-    product_data["image_urls"] = image_urls
-      # Extract rating information
-    rating_element = soup.select_one('.rating-value')
-    if rating_element:
-        product_data["rating"] = rating_element.text.strip()
-        
-    # Extract review count from product-review-list
-    reviews_count_element = soup.select_one('.product-review-list span')
-    if reviews_count_element:
-        # Extract the number from text like "(1) đánh giá | Viết nhận xét"
-        review_text = reviews_count_element.text.strip()
-        review_match = re.search(r'\((\d+)\)', review_text)
-        if review_match:
-            product_data["reviews_count"] = review_match.group(1)
-        else:
-            product_data["reviews_count"] = "0"
+    def parse(self, html):
+        return BeautifulSoup(html, self.features)
     
-    return product_data
+    def select_one(self, node, css):
+        return node.select_one(css)
+    
+    def select(self, node, css):
+        return node.select(css)
+    
+    def text(self, node):
+        return node.text
+    
+    def strings(self, node):
+        return list(node.stripped_strings)
+    
+    def attr(self, node, name):
+        return node.get(name)
+    
+    def text_of(self, node):
+        return node.text.strip() if node is not None else None
+
+class _SelectolaxBackend(_SoupBackend):
+    """
+    selectolax (lexbor) backend, several times faster than BeautifulSoup
+    """
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+    
+    def parse(self, html):
+        tree = self._parser(html)
+        # BeautifulSoup leaves script/style contents out of .text, do the same
+        tree.strip_tags(['script', 'style', 'template'])
+        return tree
+    
+    def select_one(self, node, css):
+        return node.css_first(css)
+    
+    def select(self, node, css):
+        return node.css(css)
+    
+    def text(self, node):
+        return node.text(deep=True)
+    
+    def strings(self, node):
+        return [part for part in node.text(deep=True, separator='\x00', strip=True).split('\x00') if part]
+    
+    def attr(self, node, name):
+        return node.attributes.get(name)
+    
+    def text_of(self, node):
+        return node.text(deep=True).strip() if node is not None else None
+
+PARSER_BACKENDS = ('lxml', 'html.parser', 'selectolax')
+
+def _default_backend():
+    backend = os.environ.get('MEDIAMART_PARSER')
+    if backend in PARSER_BACKENDS:
+        return backend
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+PARSER_BACKEND = _default_backend()
+_backends = {}
+
+def _get_backend(name):
+    backend = _backends.get(name)
+    if backend is None:
+        if name not in PARSER_BACKENDS:
+            raise ValueError(f"Unknown parser backend: {name}")
+        backend = _SelectolaxBackend() if name == 'selectolax' else _SoupBackend(name)
+        _backends[name] = backend
+    return backend
+
+def set_parser_backend(name):
+    """
+    Choose the HTML parser used by parse_mediamart_product. Also exported
+    through MEDIAMART_PARSER so worker processes pick the same backend.
+    """
+    global PARSER_BACKEND
+    _get_backend(name)
+    PARSER_BACKEND = name
+    os.environ['MEDIAMART_PARSER'] = name
 
 # # Example usage
 # url = "https://mediamart.vn/may-giat/may-giat-long-ngang-lg-inverter-10g-fv1410s4w1"
@@ -0,0 +1,238 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+INITIAL_RATE = 10.0    # request/giây cho mỗi host khi bắt đầu
+MIN_RATE = 0.5
+MAX_RATE = 100.0
+BURST = 5              # Số request được phép dồn cùng lúc
+ADDITIVE_STEP = 1.0    # Tăng khoảng 1 request/giây sau mỗi giây không bị chặn
+DECREASE_FACTOR = 0.5  # Giảm một nửa khi gặp 429/503 hoặc lỗi kết nối
+SLOW_FACTOR = 3.0      # Latency gấp SLOW_FACTOR lần mức thấp nhất được coi là quá tải
+DECREASE_INTERVAL = 1.0  # Chỉ giảm tối đa một lần mỗi giây cho cùng một đợt quá tải
+
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+RETRY_PASSES = 2  # Số lượt thử lại sau cùng cho việc vẫn lỗi tạm thời khi fetch() đã thử hết
+
+THROTTLE_STATUSES = (429, 503)
+SLOT_POLL = 0.01  # Giây giữa hai lần kiểm tra chỗ trống của acquire_async
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """
+    Full-jitter exponential backoff: a random delay in [0, base * 2**attempt],
+    capped at cap seconds
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header given either in seconds or as an HTTP date
+
+    Returns:
+        float or None: Seconds to wait
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket plus AIMD concurrency window for one host
+
+    The request rate and the number of requests in flight both grow
+    additively while the host answers quickly, and are halved on
+    429/503, connection errors or a sharp latency increase. A
+    Retry-After header pauses the whole host for that long.
+
+    Args:
+        rate (float): Initial requests per second
+        max_concurrency (int): Upper bound of the concurrency window,
+            normally the number of worker threads
+    """
+
+    def __init__(self, rate=INITIAL_RATE, max_concurrency=10, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.concurrency_limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._latency_floor = None
+
+    def reserve(self):
+        """
+        Take one token without blocking
+
+        Returns:
+            float: Seconds the caller must wait before sending
+        """
+        with self._cond:
+            now = time.monotonic()
+            interval = 1.0 / self.rate
+            # GCRA: cho phép dồn tối đa BURST request rồi giãn đều theo rate
+            start = max(self._next_slot, now - (BURST - 1) * interval)
+            self._next_slot = start + interval
+            wait = max(start - now, self._paused_until - now, 0.0)
+            return wait
+
+    def acquire(self):
+        """
+        Block until a token and a concurrency slot are available
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        with self._cond:
+            while self.in_flight >= int(self.concurrency_limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """
+        acquire() for coroutines: waits for the token and the concurrency
+        slot without blocking the event loop; pair it with release()
+        """
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        while True:
+            # Cửa sổ dùng chung với các luồng của fetch(), nên kiểm tra định kỳ thay vì chờ Condition
+            with self._cond:
+                if self.in_flight < int(self.concurrency_limit):
+                    self.in_flight += 1
+                    return
+            await asyncio.sleep(SLOT_POLL)
+
+    def release(self, status=None, latency=None, retry_after=None):
+        """
+        Return the concurrency slot taken by acquire() and adapt
+
+        Args:
+            status (int, optional): HTTP status, None for a connection error
+            latency (float, optional): Seconds until the response headers
+            retry_after (float, optional): Parsed Retry-After header
+        """
+        with self._cond:
+            self.in_flight = max(self.in_flight - 1, 0)
+            self._record(status, latency, retry_after)
+            self._cond.notify_all()
+
+    def record(self, status=None, latency=None, retry_after=None):
+        """
+        Adapt to a response without touching the concurrency window, for
+        callers that only use reserve()
+        """
+        with self._cond:
+            self._record(status, latency, retry_after)
+            self._cond.notify_all()
+
+    def _record(self, status, latency, retry_after):
+        now = time.monotonic()
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+        if status is None or status in THROTTLE_STATUSES:
+            self.throttled += 1
+            self._decrease(now, DECREASE_FACTOR)
+            return
+        if status >= 500:
+            return
+
+        if latency is not None:
+            if self._latency_floor is None or latency < self._latency_floor:
+                self._latency_floor = latency
+            if latency > SLOW_FACTOR * self._latency_floor and latency > 0.5:
+                self._decrease(now, 0.8)
+                return
+
+        # Tăng cộng: mỗi phản hồi tốt tăng ADDITIVE_STEP / rate, tức khoảng ADDITIVE_STEP mỗi giây
+        self.rate = min(self.max_rate, self.rate + ADDITIVE_STEP / self.rate)
+        self.concurrency_limit = min(
+            float(self.max_concurrency), self.concurrency_limit + 1.0 / self.concurrency_limit
+        )
+
+    def _decrease(self, now, factor):
+        if now - self._last_decrease < DECREASE_INTERVAL:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.concurrency_limit = max(1.0, self.concurrency_limit * factor)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'rate': round(self.rate, 2),
+                'concurrency_limit': int(self.concurrency_limit),
+                'in_flight': self.in_flight,
+                'throttled': self.throttled,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_settings = {'rate': INITIAL_RATE, 'max_concurrency': 10, 'max_rate': MAX_RATE}
+
+
+def configure(max_concurrency=None, rate=None, max_rate=None):
+    """
+    Set the defaults for limiters created afterwards and resize the
+    concurrency window of existing ones
+    """
+    with _limiters_lock:
+        if max_concurrency is not None:
+            _settings['max_concurrency'] = max(int(max_concurrency), 1)
+        if rate is not None:
+            _settings['rate'] = rate
+        if max_rate is not None:
+            _settings['max_rate'] = max_rate
+        for limiter in _limiters.values():
+            with limiter._cond:
+                limiter.max_concurrency = _settings['max_concurrency']
+                limiter.concurrency_limit = min(limiter.concurrency_limit, float(limiter.max_concurrency))
+                limiter.max_rate = _settings['max_rate']
+                limiter._cond.notify_all()
+
+
+def get_limiter(host):
+    """
+    Shared limiter for a host, created on first use
+    """
+    limiter = _limiters.get(host)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(host)
+            if limiter is None:
+                limiter = _limiters[host] = AdaptiveRateLimiter(
+                    rate=_settings['rate'],
+                    max_concurrency=_settings['max_concurrency'],
+                    max_rate=_settings['max_rate'],
+                )
+    return limiter
+
+
+def limiter_stats():
+    """
+    Returns:
+        dict: Current rate, window and throttle count per host
+    """
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {host: limiter.snapshot() for host, limiter in limiters.items()}
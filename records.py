@@ -0,0 +1,132 @@
+import sys
+
+# Trường của sản phẩm từ scrape_mediamart_product và trang danh mục
+FIELDS = (
+    'name', 'price', 'original_price', 'discount_percentage', 'product_url', 'url', 'model', 'brand',
+    'warranty', 'origin', 'key_features', 'specifications', 'description', 'image_urls', 'rating',
+    'reviews_count', 'reviews', 'categories', 'in_stock', 'stock',
+)
+# Giá trị lặp lại giữa nhiều sản phẩm, được intern để các bản ghi dùng chung một chuỗi
+CATEGORICAL_FIELDS = frozenset(('brand', 'warranty', 'origin', 'stock', 'rating', 'reviews_count'))
+LIST_FIELDS = frozenset(('key_features', 'image_urls', 'categories', 'reviews'))
+MAX_INTERNED_LENGTH = 64  # Giá trị thông số dài hơn thường là duy nhất, intern không có lợi
+
+_MISSING = object()
+
+
+class _Pool:
+    """
+    Shared instances of immutable values (strings, tuples of field or
+    spec names), so every record points at one copy
+    """
+
+    def __init__(self):
+        self._tuples = {}
+
+    @staticmethod
+    def string(value):
+        if isinstance(value, str) and len(value) <= MAX_INTERNED_LENGTH:
+            return sys.intern(value)
+        return value
+
+    def names(self, names):
+        names = tuple(sys.intern(name) for name in names)
+        return self._tuples.setdefault(names, names)
+
+
+_pool = _Pool()
+
+
+class ProductRecord:
+    """
+    Compact, read-only form of a product dict
+
+    Known fields live in __slots__ instead of a per-product dict; lists
+    become tuples; spec names, categories and repeated values (brand,
+    origin, warranty, short spec values) are interned; the tuple of field
+    names and the tuple of spec names are shared by every product with
+    the same layout. Fields outside FIELDS are kept in a small extra dict.
+    to_dict() gives back exactly the dict the record was made from,
+    including key order.
+
+        record = ProductRecord.from_dict(product)
+        record.get('price'), record['specifications']['Thương hiệu']
+        record.to_dict() == product
+    """
+
+    __slots__ = FIELDS + ('_order', '_spec_keys', '_spec_values', '_extra')
+
+    @classmethod
+    def from_dict(cls, product):
+        record = cls()
+        record._order = _pool.names(product)
+        record._extra = None
+        for key, value in product.items():
+            if key == 'specifications' and isinstance(value, dict):
+                record._spec_keys = _pool.names(value)
+                record._spec_values = tuple(_pool.string(item) for item in value.values())
+                continue
+            if key in LIST_FIELDS and isinstance(value, list):
+                value = tuple(_pool.string(item) for item in value) if key == 'categories' else tuple(value)
+            elif key in CATEGORICAL_FIELDS:
+                value = _pool.string(value)
+            if key in FIELDS:
+                setattr(record, key, value)
+            else:
+                if record._extra is None:
+                    record._extra = {}
+                record._extra[key] = value
+        return record
+
+    def _value(self, key):
+        if key == 'specifications':
+            keys = getattr(self, '_spec_keys', None)
+            if keys is not None:
+                return dict(zip(keys, self._spec_values))
+        if key in FIELDS:
+            value = getattr(self, key, _MISSING)
+        else:
+            value = self._extra.get(key, _MISSING) if self._extra else _MISSING
+        if key in LIST_FIELDS and isinstance(value, tuple):
+            return list(value)
+        return value
+
+    def get(self, key, default=None):
+        if key not in self._order:
+            return default
+        return self._value(key)
+
+    def __getitem__(self, key):
+        if key not in self._order:
+            raise KeyError(key)
+        return self._value(key)
+
+    def __contains__(self, key):
+        return key in self._order
+
+    def keys(self):
+        return self._order
+
+    def to_dict(self):
+        """
+        The product as a plain dict, equal to the one from_dict() received
+        """
+        return {key: self._value(key) for key in self._order}
+
+    def __eq__(self, other):
+        if isinstance(other, ProductRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ProductRecord({self.to_dict()!r})"
+
+
+def compact(products):
+    """
+    Yield ProductRecord for each product dict, e.g. over sinks.read_jsonl(path)
+    """
+    for product in products:
+        yield ProductRecord.from_dict(product)
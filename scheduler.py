@@ -0,0 +1,204 @@
+import hashlib
+import math
+import os
+import threading
+import time
+
+from category import iter_menu_tree
+from incremental import tile_hash
+from storage import open_db
+
+SCHEDULE_FILE_DEFAULT = os.path.join('data', 'schedule.db')
+DEFAULT_CHANGE_RATE = 1 / (24 * 3600)  # Danh mục chưa có lịch sử: giả định đổi khoảng mỗi ngày một lần
+MIN_PRIORITY = 0.5                     # Chỉ quét lại khi xác suất danh mục đã thay đổi từ lần quét trước >= 50%
+MAX_INTERVAL = 7 * 24 * 3600           # Danh mục ổn định nhất vẫn được quét lại ít nhất mỗi tuần
+# Tốc độ thay đổi nhỏ nhất: danh mục chưa từng thay đổi đến hạn quét lại đúng sau MAX_INTERVAL
+MIN_CHANGE_RATE = -math.log(1 - MIN_PRIORITY) / MAX_INTERVAL
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    url TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    parent TEXT,
+    listing_hash TEXT,
+    products INTEGER,
+    visits INTEGER NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0,
+    observed_seconds REAL NOT NULL DEFAULT 0,
+    last_crawled REAL
+);
+"""
+
+
+def listing_hash(products):
+    """
+    Order-independent hash of a category listing: which products it shows
+    and their tile data (price, discount, stock when crawled in fast mode)
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in sorted(f"{product['url']} {tile_hash(product)}" for product in products):
+        digest.update(entry.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def estimate_change_rate(visits, changes, observed_seconds):
+    """
+    Poisson change rate of a page revisited at intervals, from the number
+    of revisits that found it changed (Cho & Garcia-Molina's bias-reduced
+    estimator, which stays finite when every revisit saw a change)
+
+    Returns:
+        float or None: Changes per second, None without any revisit
+    """
+    if visits <= 0 or observed_seconds <= 0:
+        return None
+    ratio = (visits - changes + 0.5) / (visits + 0.5)
+    return -math.log(ratio) * visits / observed_seconds
+
+
+class CategoryScheduler:
+    """
+    Chooses which categories to crawl in a run from how often their
+    listings actually changed in past runs
+
+    Every crawled category stores a hash of its listing; a revisit that
+    finds a different hash counts as a change. From the changes and the
+    time between visits a change rate is estimated per category, and the
+    priority of a category is the probability that it changed since it
+    was last crawled. Fast-moving categories come due within hours while
+    stable ones wait up to MAX_INTERVAL. Categories never revisited borrow
+    the rate of their parent in the menu tree.
+
+    Args:
+        path (str): SQLite file holding the visit history
+    """
+
+    def __init__(self, path=SCHEDULE_FILE_DEFAULT):
+        self._lock = threading.Lock()
+        self._conn = open_db(path, _SCHEMA)
+        self.stats = {'changed': 0, 'unchanged': 0, 'first_visit': 0}
+
+    def sync_tree(self, tree):
+        """
+        Register the categories of a menu tree and their parents
+        """
+        rows = [(node['url'], node['name'], parent['url'] if parent else None)
+                for node, parent in iter_menu_tree(tree)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO categories (url, name, parent) VALUES (?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET name = excluded.name, parent = excluded.parent",
+                rows,
+            )
+
+    def _rows(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, parent, visits, changes, observed_seconds, last_crawled, products FROM categories"
+            ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def rank(self, categories, now=None):
+        """
+        Categories with their priority, most likely changed first
+
+        Args:
+            categories (list): Category dicts (name, url)
+
+        Returns:
+            list: (priority, rate, category) tuples; priority is the
+            probability of a change since the last crawl, 1.0 when the
+            category was never crawled or is older than MAX_INTERVAL
+        """
+        now = now or time.time()
+        rows = self._rows()
+        ranked = []
+        for category in categories:
+            row = rows.get(category['url'])
+            if row is None or row[4] is None:
+                ranked.append((1.0, None, category))
+                continue
+            parent, visits, changes, observed_seconds, last_crawled, _ = row
+            rate = estimate_change_rate(visits, changes, observed_seconds)
+            if rate is None and parent in rows:
+                rate = estimate_change_rate(*rows[parent][1:4])
+            if rate is None:
+                rate = DEFAULT_CHANGE_RATE
+            rate = max(rate, MIN_CHANGE_RATE)
+            age = max(now - last_crawled, 0)
+            priority = 1.0 if age >= MAX_INTERVAL else 1 - math.exp(-rate * age)
+            ranked.append((priority, rate, category))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return ranked
+
+    def select(self, categories, budget=None, min_priority=MIN_PRIORITY, now=None):
+        """
+        Categories to crawl in this run
+
+        Args:
+            categories (list): Category dicts (name, url)
+            budget (int, optional): Maximum number of products to list,
+                estimated from each category's size in its last crawl;
+                categories are taken by priority until it is spent
+            min_priority (float): Skip categories less likely than this
+                to have changed since their last crawl
+
+        Returns:
+            list: The chosen category dicts, highest priority first
+        """
+        rows = self._rows()
+        selected = []
+        spent = 0
+        for priority, _, category in self.rank(categories, now):
+            if priority < min_priority:
+                break
+            row = rows.get(category['url'])
+            cost = (row[5] if row and row[5] else 0) or 1
+            if budget is not None and selected and spent + cost > budget:
+                continue
+            selected.append(category)
+            spent += cost
+        return selected
+
+    def record(self, category, products, now=None):
+        """
+        Store the listing of a fully crawled category
+
+        Args:
+            category (dict): Category (name, url)
+            products (list): Every listing entry found in the category
+
+        Returns:
+            bool or None: Whether the listing changed since the last
+            crawl, None on the first one
+        """
+        now = now or time.time()
+        digest = listing_hash(products)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT listing_hash, last_crawled FROM categories WHERE url = ?", (category['url'],)
+            ).fetchone()
+            if row is None or row[1] is None:
+                self._conn.execute(
+                    "INSERT INTO categories (url, name, listing_hash, products, last_crawled) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(url) DO UPDATE SET listing_hash = excluded.listing_hash, "
+                    "products = excluded.products, last_crawled = excluded.last_crawled",
+                    (category['url'], category['name'], digest, len(products), now),
+                )
+                self.stats['first_visit'] += 1
+                return None
+            changed = row[0] != digest
+            self._conn.execute(
+                "UPDATE categories SET listing_hash = ?, products = ?, visits = visits + 1, "
+                "changes = changes + ?, observed_seconds = observed_seconds + ?, last_crawled = ? WHERE url = ?",
+                (digest, len(products), int(changed), max(now - row[1], 0), now, category['url']),
+            )
+            self.stats['changed' if changed else 'unchanged'] += 1
+            return changed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,96 @@
+import gzip
+import json
+import threading
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+_EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def jsonl_filename(stem, compression='none'):
+    """
+    Build the output filename for a JSONL sink, e.g. 'all_products.jsonl.gz'
+    """
+    return f"{stem}.jsonl{_EXTENSIONS[compression]}"
+
+
+class JsonlSink:
+    """
+    Append-only JSON Lines writer
+
+    Each record is serialised and written as soon as write() is called,
+    so memory use does not grow with the number of products. Safe to call
+    from several worker threads.
+
+    Args:
+        path (str): Output file
+        compression (str): 'none', 'gzip' or 'zstd' (needs the zstandard package)
+        flush_every (int): Flush the underlying file after this many records
+        on_write (callable, optional): Called with every record after it is
+            written, e.g. to queue its images for download
+    """
+
+    def __init__(self, path, compression='none', flush_every=100, on_write=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.path = path
+        self.count = 0
+        self._flush_every = flush_every
+        self._on_write = on_write
+        self._lock = threading.Lock()
+        self._raw = None
+        if compression == 'gzip':
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+        elif compression == 'zstd':
+            import io
+            import zstandard
+            self._raw = open(path, 'wb')
+            writer = zstandard.ZstdCompressor().stream_writer(self._raw)
+            self._file = io.TextIOWrapper(writer, encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line)
+            self._file.write('\n')
+            self.count += 1
+            if self.count % self._flush_every == 0:
+                self._file.flush()
+        if self._on_write is not None:
+            self._on_write(record)
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+            if self._raw is not None:
+                self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_jsonl(path):
+    """
+    Yield records from a JSON Lines file written by JsonlSink, picking
+    the decompressor from the file extension
+    """
+    if path.endswith('.gz'):
+        f = gzip.open(path, 'rt', encoding='utf-8')
+    elif path.endswith('.zst'):
+        import io
+        import zstandard
+        f = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+    else:
+        f = open(path, 'r', encoding='utf-8')
+    with f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
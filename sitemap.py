@@ -0,0 +1,228 @@
+"""
+Product URL discovery from robots.txt and XML sitemaps
+
+    for url, lastmod in iter_product_urls():
+        ...
+
+Sitemap indexes are followed recursively; each (sub-)sitemap, gzipped or
+not, is decompressed and parsed incrementally in small chunks and every
+element is discarded once read, so memory does not grow with the
+catalog. A sitemap index entry whose lastmod is older than `since` is not
+fetched at all, and neither are its URLs yielded.
+"""
+import zlib
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin, urlsplit
+from xml.etree.ElementTree import XMLPullParser
+
+from dedup import canonicalize_url
+from fetcher import BASE_URL, fetch
+
+CHUNK_SIZE = 64 * 1024
+MAX_DEPTH = 3  # Sitemap index lồng nhau tối đa
+SITE_TIMEZONE = timezone(timedelta(hours=7))  # Giờ Việt Nam, dùng cho lastmod không ghi múi giờ
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def parse_lastmod(value):
+    """
+    W3C datetime ('2024-05-01', '2024-05-01T08:30:00+07:00', '...Z') to
+    a Unix timestamp; values without a timezone are in SITE_TIMEZONE
+
+    A date without a time says the page changed at some point that day,
+    so it maps to the end of the day: a page fetched in the morning and
+    changed in the afternoon is not taken as unchanged.
+
+    Returns:
+        float or None: None when the value is missing or unreadable
+    """
+    if not value:
+        return None
+    value = value.strip().replace('Z', '+00:00')
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if 'T' not in value:
+        moment += timedelta(days=1)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=SITE_TIMEZONE)
+    return moment.timestamp()
+
+
+def sitemaps_from_robots(base_url=BASE_URL):
+    """
+    Sitemap URLs declared in robots.txt, falling back to /sitemap.xml
+
+    Returns:
+        list: Absolute sitemap URLs
+    """
+    response = fetch(urljoin(base_url + '/', 'robots.txt'), stage='sitemap')
+    sitemaps = []
+    if response.status_code == 200:
+        for line in response.text.splitlines():
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sitemap' and value.strip():
+                sitemaps.append(urljoin(base_url + '/', value.strip()))
+    return sitemaps or [urljoin(base_url + '/', 'sitemap.xml')]
+
+
+def _chunks(content):
+    # Giải nén dần từng phần thay vì tạo cả file XML đã giải nén trong bộ nhớ
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if content[:2] == _GZIP_MAGIC else None
+    for start in range(0, len(content), CHUNK_SIZE):
+        chunk = content[start:start + CHUNK_SIZE]
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        if chunk:
+            yield chunk
+    if decompressor is not None:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _iter_entries(content):
+    """
+    Yield ('sitemap' | 'url', loc, lastmod) for every entry of a sitemap
+    or sitemap index, parsing incrementally
+    """
+    parser = XMLPullParser(events=('end',))
+    for chunk in _chunks(content):
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            kind = _local_name(element.tag)
+            if kind not in ('url', 'sitemap'):
+                continue
+            loc = lastmod = None
+            for child in element:
+                name = _local_name(child.tag)
+                if name == 'loc':
+                    loc = (child.text or '').strip()
+                elif name == 'lastmod':
+                    lastmod = (child.text or '').strip()
+            # Bỏ phần tử đã đọc để cây XML không lớn dần theo số URL
+            element.clear()
+            if loc:
+                yield kind, loc, lastmod
+    parser.close()
+
+
+def iter_sitemap(url, since=None, depth=0, failed=None):
+    """
+    Every URL listed in a sitemap, following sitemap indexes
+
+    Args:
+        url (str): Sitemap or sitemap index URL
+        since (float, optional): Unix time; entries (and whole sub-sitemaps)
+            with an older lastmod are skipped, entries without one are kept
+        failed (list, optional): Receives the URL of every sitemap that
+            could not be read, i.e. the listing is incomplete
+
+    Yields:
+        tuple: (url, lastmod) with lastmod as written in the sitemap or None
+    """
+    response = fetch(url, stage='sitemap')
+    if response.status_code != 200:
+        print(f"Lỗi khi tải sitemap {url}: {response.status_code}")
+        if failed is not None:
+            failed.append(url)
+        return
+    for kind, loc, lastmod in _iter_entries(response.content):
+        if since is not None:
+            modified = parse_lastmod(lastmod)
+            if modified is not None and modified < since:
+                continue
+        if kind == 'sitemap':
+            if depth >= MAX_DEPTH:
+                print(f"Bỏ qua sitemap lồng quá sâu: {loc}")
+                if failed is not None:
+                    failed.append(loc)
+                continue
+            yield from iter_sitemap(loc, since, depth + 1, failed)
+        else:
+            yield loc, lastmod
+
+
+def is_product_url(url, base_url=BASE_URL):
+    """
+    Product pages are two levels deep on the site: /<category>/<product>
+    """
+    parts = urlsplit(url)
+    if parts.netloc.lower().replace('www.', '') != urlsplit(base_url).netloc.lower().replace('www.', ''):
+        return False
+    segments = [segment for segment in parts.path.split('/') if segment]
+    return len(segments) == 2 and not parts.query
+
+
+def iter_product_urls(base_url=BASE_URL, since=None, sitemaps=None, url_filter=is_product_url, failed=None):
+    """
+    Stream product URLs with their lastmod from the site's sitemaps
+
+    Args:
+        base_url (str): Site whose robots.txt lists the sitemaps
+        since (float, optional): Only URLs modified at or after this time
+        sitemaps (list, optional): Sitemap URLs to read instead of robots.txt
+        url_filter (callable): Keeps product URLs, drops category and
+            content pages
+        failed (list, optional): Receives the URLs of unreadable sitemaps
+
+    Yields:
+        tuple: (url, lastmod)
+    """
+    for sitemap_url in sitemaps or sitemaps_from_robots(base_url):
+        for url, lastmod in iter_sitemap(sitemap_url, since, failed=failed):
+            if url_filter is None or url_filter(url):
+                yield url, lastmod
+
+
+def discover_products(base_url=BASE_URL, since=None, dedup=None, frontier=None, reuse=None, on_reused=None,
+                      failed=None, limit=None):
+    """
+    Listing-style entries {'url', 'lastmod'} for every product in the
+    sitemaps that still needs a detail fetch
+
+    Args:
+        base_url (str): Site whose robots.txt lists the sitemaps
+        since (float, optional): Only URLs modified at or after this time
+        dedup (UrlDeduper, optional): Drops URLs already seen in this crawl
+        frontier (CrawlFrontier, optional): Drops URLs already known to the frontier
+        reuse (callable, optional): Called with (url, lastmod as Unix time);
+            returns the stored product when the page has not changed since
+            it was last fetched, e.g. IncrementalCrawler.reuse_not_modified
+        on_reused (callable, optional): Receives each reused product,
+            completed with the sitemap entry, instead of it being yielded
+        failed (list, optional): Receives the URLs of unreadable sitemaps
+        limit (int, optional): Stop after this many products, reused or
+            yielded
+
+    Yields:
+        dict: Entries to fetch, with the canonical URL
+    """
+    if limit is not None and limit <= 0:
+        return
+    handled = 0
+    for url, lastmod in iter_product_urls(base_url, since, failed=failed):
+        product = {'url': canonicalize_url(url), 'lastmod': lastmod}
+        if dedup is not None and not dedup.add(product):
+            continue
+        if frontier is not None and not frontier.add(product):
+            continue
+        stored = reuse(product['url'], parse_lastmod(lastmod)) if reuse is not None else None
+        if stored is None:
+            yield product
+        else:
+            # Như khi crawl từ trang danh mục: bổ sung các trường của mục sitemap (url, lastmod)
+            for key in product:
+                if key not in stored:
+                    stored[key] = product[key]
+            if on_reused is not None:
+                on_reused(stored)
+        handled += 1
+        if limit is not None and handled >= limit:
+            return
@@ -0,0 +1,450 @@
+"""
+In-memory inverted index over product specifications
+
+    index = SpecIndex.build(read_jsonl('data/all_products_<timestamp>.jsonl'))
+    index.save('data/spec_index.pkl')
+
+    index = SpecIndex.load('data/spec_index.pkl')
+    result = index.search(
+        {'Thương hiệu': ['Samsung', 'LG'], 'Kích thước màn hình': ('50 inch', None), 'price': (None, 15000000)},
+        facets=['Thương hiệu', 'Độ phân giải'],
+    )
+
+Spec keys and values are normalized (lowercase, Vietnamese diacritics
+removed) so 'Thương hiệu' and 'thuong hieu' are the same key. Every
+(key, value) pair has a posting list stored as a bitmap (a Python int,
+bit i set for product i), so compound filters are a few big-integer
+AND/OR operations and facet counts are popcounts. Values with a unit
+('55 inch', '1,8 lít', '9.000 BTU') are also parsed into numbers in a
+canonical unit and kept in sorted range indexes, together with price,
+original price and discount.
+"""
+import bisect
+import functools
+import os
+import pickle
+import re
+import sys
+import time
+import unicodedata
+
+from parquet_export import parse_number, parse_price
+from records import ProductRecord
+from storage import atomic_path
+
+SPEC_INDEX_FILE_DEFAULT = os.path.join('data', 'spec_index.pkl')
+INDEX_VERSION = 2
+RANGE_BLOCK = 1024  # Số phần tử giữa hai bitmap tiền tố của chỉ mục khoảng
+
+# Trường phân loại lấy thẳng từ sản phẩm, ngoài bảng thông số
+PRODUCT_FACETS = ('brand', 'origin', 'warranty', 'categories')
+
+# Đơn vị (đã bỏ dấu, chữ thường) -> (đơn vị chuẩn, hệ số nhân)
+UNITS = {
+    'inch': ('inch', 1), 'in': ('inch', 1), '"': ('inch', 1),
+    'mm': ('cm', 0.1), 'cm': ('cm', 1), 'm': ('cm', 100),
+    'g': ('kg', 0.001), 'gr': ('kg', 0.001), 'kg': ('kg', 1),
+    'ml': ('l', 0.001), 'l': ('l', 1), 'lit': ('l', 1),
+    'w': ('w', 1), 'kw': ('w', 1000),
+    'thang': ('thang', 1), 'nam': ('thang', 12),
+    'mb': ('gb', 1 / 1024), 'gb': ('gb', 1), 'tb': ('gb', 1024),
+    'btu': ('btu', 1), 'hp': ('hp', 1), 'mah': ('mah', 1), 'v': ('v', 1), 'hz': ('hz', 1),
+    'kg/h': ('kg/h', 1), 'l/h': ('l/h', 1), 'vong/phut': ('vong/phut', 1),
+}
+
+_QUANTITY = re.compile(r'^\s*(\d+(?:[.,]\d+)*)\s*([^\d\s]*(?:/[^\d\s]+)?)\s*$')
+_THOUSANDS = re.compile(r'^\d{1,3}(?:\.\d{3})+$')
+_NON_WORD = re.compile(r'[^a-z0-9/"]+')
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(bitmap):
+        return bin(bitmap).count('1')
+
+
+def strip_diacritics(text):
+    """
+    'Thương hiệu' -> 'Thuong hieu'
+    """
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_key(text):
+    """
+    Index key of a spec name: 'Kích thước màn hình' -> 'kich_thuoc_man_hinh'
+    """
+    return _NON_WORD.sub('_', strip_diacritics(str(text)).lower()).strip('_')
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_value(text):
+    """
+    Index value of a spec: 'Việt Nam' -> 'viet nam'
+    """
+    return ' '.join(strip_diacritics(str(text)).lower().split())
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_quantity(text):
+    """
+    Parse a single number with an optional unit into a canonical unit
+
+    '55 inch' -> (55.0, 'inch'), '1,8 lít' -> (1.8, 'l'), '9.000 BTU' ->
+    (9000.0, 'btu'), '2 năm' -> (24.0, 'thang'), '150' -> (150.0, '')
+
+    Returns:
+        tuple or None: (value, unit), None if the text is not one quantity
+    """
+    if text is None:
+        return None
+    match = _QUANTITY.match(normalize_value(text))
+    if not match:
+        return None
+    number, unit = match.groups()
+    if _THOUSANDS.match(number):
+        number = number.replace('.', '')
+    elif number.count('.') + number.count(',') > 1:
+        return None
+    value = float(number.replace(',', '.'))
+    if not unit:
+        return value, ''
+    if unit not in UNITS:
+        return None
+    canonical, factor = UNITS[unit]
+    return value * factor, canonical
+
+
+def to_bitmap(ids):
+    """
+    Bitmap with the bits of the given document ids set
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    # Đặt bit trong bytearray rồi đổi sang int một lần, tránh OR lặp lại trên số lớn
+    buffer = bytearray(max(ids) // 8 + 1)
+    for doc_id in ids:
+        buffer[doc_id >> 3] |= 1 << (doc_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def iter_ids(bitmap):
+    """
+    Document ids of the set bits, ascending
+    """
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield byte_index * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+class RangeIndex:
+    """
+    Sorted numeric values of one field with prefix bitmaps every
+    RANGE_BLOCK entries, so a range query costs one AND-NOT of two
+    prebuilt bitmaps plus at most two partial blocks
+    """
+
+    def __init__(self, pairs, unit=''):
+        pairs = sorted(pairs)
+        self.unit = unit
+        self.values = [value for value, _ in pairs]
+        self.ids = [doc_id for _, doc_id in pairs]
+        self.prefix = [0]
+        for start in range(0, len(self.ids), RANGE_BLOCK):
+            self.prefix.append(self.prefix[-1] | to_bitmap(self.ids[start:start + RANGE_BLOCK]))
+
+    def __len__(self):
+        return len(self.values)
+
+    def _upto(self, position):
+        # Bitmap của các phần tử ở vị trí < position trong thứ tự đã sắp
+        block, rest = divmod(position, RANGE_BLOCK)
+        bitmap = self.prefix[block]
+        if rest:
+            start = block * RANGE_BLOCK
+            bitmap |= to_bitmap(self.ids[start:start + rest])
+        return bitmap
+
+    def range(self, low=None, high=None):
+        """
+        Documents with low <= value <= high; None leaves a side open
+        """
+        start = 0 if low is None else bisect.bisect_left(self.values, low)
+        end = len(self.values) if high is None else bisect.bisect_right(self.values, high)
+        if start >= end:
+            return 0
+        return self._upto(end) & ~self._upto(start)
+
+    def bounds(self, bitmap=None):
+        """
+        (min, max) over all documents or over those in bitmap
+        """
+        if bitmap is None:
+            return (self.values[0], self.values[-1]) if self.values else None
+        bitmap &= self.prefix[-1]
+        if not bitmap:
+            return None
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+
+        def matches(position):
+            doc_id = self.ids[position]
+            return (doc_id >> 3) < len(data) and data[doc_id >> 3] >> (doc_id & 7) & 1
+
+        # Bitmap tiền tố cho biết khối đầu tiên/cuối cùng có phần tử khớp; chỉ quét trong hai khối đó
+        blocks = len(self.prefix) - 1
+        first_block = next(b for b in range(blocks) if self.prefix[b + 1] & bitmap)
+        last_block = next(b for b in reversed(range(blocks)) if bitmap & ~self.prefix[b])
+        first = next(i for i in range(first_block * RANGE_BLOCK, len(self.ids)) if matches(i))
+        last = next(i for i in reversed(range(min((last_block + 1) * RANGE_BLOCK, len(self.ids)))) if matches(i))
+        return self.values[first], self.values[last]
+
+
+class SpecIndex:
+    """
+    Posting lists per normalized (key, value) plus numeric range indexes
+
+    Build with SpecIndex.build(products) or add() each product and call
+    finalize(). Queries never modify the index, so a loaded index can be
+    shared between threads.
+    """
+
+    def __init__(self):
+        self.docs = []         # ProductRecord theo id tài liệu
+        self.postings = {}     # key -> {value -> bitmap}
+        self.key_labels = {}   # key -> tên gốc đầu tiên gặp, để hiển thị
+        self.value_labels = {}  # (key, value) -> giá trị gốc đầu tiên gặp
+        self.numeric = {}      # key -> RangeIndex
+        self.built_at = None
+        self._pending_postings = {}
+        self._numeric_pairs = {}
+        self._numeric_units = {}
+
+    @classmethod
+    def build(cls, products):
+        """
+        Index an iterable of product dicts, e.g. sinks.read_jsonl(path)
+        """
+        index = cls()
+        for product in products:
+            index.add(product)
+        index.finalize()
+        return index
+
+    def _post(self, key, label, value, doc_id):
+        value_key = normalize_value(value)
+        if not value_key:
+            return
+        self.key_labels.setdefault(key, label)
+        self.value_labels.setdefault((key, value_key), str(value).strip())
+        self._pending_postings.setdefault(key, {}).setdefault(value_key, []).append(doc_id)
+
+    def _add_number(self, key, value, unit, doc_id):
+        if value is None:
+            return
+        # Một khóa chỉ giữ một loại đơn vị (đơn vị gặp đầu tiên)
+        if self._numeric_units.setdefault(key, unit) != unit:
+            return
+        self._numeric_pairs.setdefault(key, []).append((value, doc_id))
+
+    def add(self, product):
+        """
+        Add one product; it becomes searchable after finalize()
+
+        Returns:
+            int: The product's document id
+        """
+        doc_id = len(self.docs)
+        # Bản ghi gọn (chuỗi lặp lại dùng chung) thay vì dict, cả danh mục nằm trong bộ nhớ
+        self.docs.append(ProductRecord.from_dict(product))
+        for field in PRODUCT_FACETS:
+            value = product.get(field)
+            for item in value if isinstance(value, list) else [value]:
+                if item:
+                    self._post(field, field, item, doc_id)
+        # Tên thông số khác nhau về hoa/thường hay dấu ('Màu sắc', 'màu sắc') được gộp về một khóa,
+        # mỗi giá trị chỉ được tính một lần cho sản phẩm
+        specs = {}
+        for label, value in (product.get('specifications') or {}).items():
+            key = normalize_key(label)
+            if not key or value is None:
+                continue
+            specs.setdefault(key, (label, {}))[1].setdefault(normalize_value(value), value)
+        for key, (label, values) in specs.items():
+            quantities = set()
+            for value in values.values():
+                self._post(key, label, value, doc_id)
+                quantity = parse_quantity(value)
+                # '55 inch' và '55"' là cùng một số, chỉ thêm một lần vào chỉ mục khoảng
+                if quantity is not None and quantity not in quantities:
+                    quantities.add(quantity)
+                    self._add_number(key, *quantity, doc_id)
+                    self.key_labels.setdefault(key, label)
+
+        discount = product.get('discount_percentage')
+        self._add_number('price', parse_price(product.get('price')), 'vnd', doc_id)
+        self._add_number('original_price', parse_price(product.get('original_price')), 'vnd', doc_id)
+        self._add_number('discount', parse_number(discount) if discount and '%' in discount else None, '%', doc_id)
+        return doc_id
+
+    def finalize(self):
+        """
+        Build the posting bitmaps and range indexes from what add() collected
+        """
+        for key, values in self._pending_postings.items():
+            postings = self.postings.setdefault(key, {})
+            for value, ids in values.items():
+                postings[value] = postings.get(value, 0) | to_bitmap(ids)
+        self._pending_postings = {}
+        for key, pairs in self._numeric_pairs.items():
+            if key in self.numeric:
+                # Thêm sản phẩm vào chỉ mục đã finalize: dựng lại chỉ mục khoảng của khóa
+                pairs = list(zip(self.numeric[key].values, self.numeric[key].ids)) + pairs
+            self.numeric[key] = RangeIndex(pairs, self._numeric_units[key])
+        self._numeric_pairs = {}
+        self.built_at = time.time()
+        return self
+
+    def _resolve_key(self, key):
+        if key in self.postings or key in self.numeric:
+            return key
+        return normalize_key(key)
+
+    def _range_bounds(self, key, bounds):
+        def number(value):
+            if value is None or isinstance(value, (int, float)):
+                return value
+            quantity = parse_quantity(value)
+            if quantity is None:
+                raise ValueError(f"Không đọc được giá trị số: {value}")
+            unit = self.numeric[key].unit
+            if quantity[1] and unit and quantity[1] != unit:
+                raise ValueError(f"Đơn vị của {value} khác đơn vị của {key} ({unit})")
+            return quantity[0]
+        low, high = bounds
+        return number(low), number(high)
+
+    def filter(self, filters):
+        """
+        Bitmap of the products matching every filter
+
+        Args:
+            filters (dict): Spec name -> a value, a list of values (any
+                of them matches) or a (low, high) tuple for a numeric
+                range; low/high may be numbers, strings with a unit such
+                as '50 inch', or None for an open side
+
+        Returns:
+            int: Bitmap of matching document ids
+        """
+        result = (1 << len(self.docs)) - 1
+        for raw_key, condition in (filters or {}).items():
+            key = self._resolve_key(raw_key)
+            if isinstance(condition, tuple):
+                if key not in self.numeric:
+                    return 0
+                result &= self.numeric[key].range(*self._range_bounds(key, condition))
+            else:
+                values = self.postings.get(key, {})
+                matched = 0
+                for value in condition if isinstance(condition, list) else [condition]:
+                    matched |= values.get(normalize_value(value), 0)
+                result &= matched
+            if not result:
+                break
+        return result
+
+    def facet_counts(self, key, bitmap=None, limit=None):
+        """
+        Number of matching products per value of a key, most common first
+
+        Returns:
+            dict: Original value label -> count
+        """
+        key = self._resolve_key(key)
+        counts = []
+        for value, postings in self.postings.get(key, {}).items():
+            count = _popcount(postings & bitmap if bitmap is not None else postings)
+            if count:
+                counts.append((count, self.value_labels[(key, value)]))
+        counts.sort(key=lambda item: (-item[0], item[1]))
+        return {label: count for count, label in counts[:limit]}
+
+    def search(self, filters=None, facets=(), limit=20, offset=0):
+        """
+        Compound filter with facet counts and a page of products
+
+        Returns:
+            dict: 'total', 'products' (the page, in document order),
+            'facets' (value counts per requested key) and 'ranges'
+            (min/max of the requested numeric keys among the matches)
+        """
+        return self.page(self.filter(filters), facets, limit, offset)
+
+    def page(self, bitmap, facets=(), limit=20, offset=0):
+        """
+        Products, facet counts and ranges for an already computed bitmap,
+        e.g. a filter() result narrowed down further by the caller
+        """
+        page = []
+        for position, doc_id in enumerate(iter_ids(bitmap)):
+            if position < offset:
+                continue
+            if len(page) >= limit:
+                break
+            page.append(self.docs[doc_id].to_dict())
+        result = {'total': _popcount(bitmap), 'products': page, 'facets': {}, 'ranges': {}}
+        for raw_key in facets or ():
+            key = self._resolve_key(raw_key)
+            if key in self.postings:
+                result['facets'][raw_key] = self.facet_counts(key, bitmap)
+            if key in self.numeric:
+                result['ranges'][raw_key] = self.numeric[key].bounds(bitmap)
+        return result
+
+    def keys(self):
+        """
+        Indexed keys with their original label and number of distinct values
+        """
+        return {
+            key: {'label': self.key_labels.get(key, key), 'values': len(self.postings.get(key, {})),
+                  'unit': self.numeric[key].unit if key in self.numeric else None}
+            for key in sorted(set(self.postings) | set(self.numeric))
+        }
+
+    def save(self, path=SPEC_INDEX_FILE_DEFAULT):
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((INDEX_VERSION, self.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path=SPEC_INDEX_FILE_DEFAULT):
+        """
+        Load an index written by save(); only load files you built yourself
+        """
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != INDEX_VERSION:
+            raise ValueError(f"{path} được tạo bởi phiên bản chỉ mục khác ({version}), cần build lại")
+        index = cls.__new__(cls)
+        index.__dict__.update(state)
+        return index
+
+
+if __name__ == "__main__":
+    from sinks import read_jsonl
+
+    if len(sys.argv) not in (2, 3):
+        print("Cách dùng: python specindex.py data/all_products_<timestamp>.jsonl[.gz|.zst] [data/spec_index.pkl]")
+        sys.exit(1)
+    start = time.perf_counter()
+    spec_index = SpecIndex.build(read_jsonl(sys.argv[1]))
+    output = sys.argv[2] if len(sys.argv) == 3 else SPEC_INDEX_FILE_DEFAULT
+    spec_index.save(output)
+    print(f"Đã tạo chỉ mục {len(spec_index.docs)} sản phẩm, {len(spec_index.keys())} khóa trong "
+          f"{time.perf_counter() - start:.2f}s, lưu vào {output}")
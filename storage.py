@@ -0,0 +1,64 @@
+import contextlib
+import os
+import sqlite3
+import threading
+
+
+def open_db(path, schema, timeout=5.0):
+    """
+    Open (or create) a SQLite file shared between threads
+
+    Creates the parent directory, switches the file to WAL so readers do
+    not block the writer, and applies the schema, which must only use
+    CREATE ... IF NOT EXISTS statements. The connection is in autocommit
+    mode; callers serialise access with their own lock.
+
+    Args:
+        path (str): SQLite file to open
+        schema (str): SQL script run on every open
+        timeout (float): Seconds to wait while another process holds the write lock
+
+    Returns:
+        sqlite3.Connection: The open connection
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(schema)
+    return conn
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Temporary path to write a file to, moved over path on success
+
+    The temporary name is unique per process and thread, so concurrent
+    writers of the same file never share it, and readers only ever see
+    the old file or the complete new one. On error the temporary file is
+    removed and path is left untouched.
+
+        with atomic_path('data/spec_index.pkl') as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                ...
+
+    Args:
+        path (str): Final file
+
+    Yields:
+        str: Temporary file in the same directory as path
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,51 @@
+from dedup import BloomFilter, UrlDeduper, canonicalize_url, merge_categories
+from sinks import JsonlSink, read_jsonl
+
+
+def test_canonicalize_url():
+    assert canonicalize_url('HTTPS://www.MediaMart.vn:443/tivi/?utm_source=x&b=2&a=1#top') == \
+        'https://mediamart.vn/tivi?a=1&b=2'
+    assert canonicalize_url('http://mediamart.vn:8080/') == 'http://mediamart.vn:8080/'
+
+
+def test_deduper_keeps_every_category():
+    dedup = UrlDeduper()
+    first = {'url': 'https://www.mediamart.vn/tivi-a/'}
+    assert dedup.add(first, 'Tivi')
+    assert first['url'] == 'https://mediamart.vn/tivi-a'
+    assert not dedup.add({'url': 'https://mediamart.vn/tivi-a?gclid=1'}, 'Samsung')
+    assert not dedup.add({'url': 'https://mediamart.vn/tivi-a'}, 'Tivi')
+    assert first['categories'] == ['Tivi', 'Samsung']
+    assert dedup.categories('https://mediamart.vn/tivi-a/') == ['Tivi', 'Samsung']
+    assert dedup.duplicates == 2
+    assert dedup.late_categories == 1
+    assert len(dedup) == 1
+
+
+def test_filter_keeps_order():
+    dedup = UrlDeduper()
+    products = [{'url': f'https://mediamart.vn/{name}'} for name in ('a', 'b', 'a', 'c')]
+    assert [product['url'][-1] for product in dedup.filter(products, 'X')] == ['a', 'b', 'c']
+
+
+def test_bloom_filter_never_forgets():
+    bloom = BloomFilter(1000)
+    urls = [f'https://mediamart.vn/p{i}' for i in range(1000)]
+    assert all(bloom.add(url) for url in urls[:10])
+    assert all(url in bloom for url in urls[:10])
+    assert not bloom.add(urls[0])
+
+
+def test_merge_categories_adds_late_matches(tmp_path):
+    path = str(tmp_path / 'all_products.jsonl')
+    dedup = UrlDeduper()
+    product = {'url': 'https://mediamart.vn/a', 'name': 'A'}
+    dedup.add(product, 'Tivi')
+    with JsonlSink(path) as sink:
+        sink.write(dict(product, categories=list(product['categories'])))
+        sink.write({'name': 'Không có URL'})
+    dedup.add({'url': 'https://mediamart.vn/a'}, 'Samsung')
+
+    assert merge_categories(path, dedup) == 1
+    assert [record.get('categories') for record in read_jsonl(path)] == [['Tivi', 'Samsung'], None]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['all_products.jsonl']
@@ -0,0 +1,53 @@
+from frontier import DONE, FAILED, IN_FLIGHT, PENDING, CrawlFrontier, known_urls
+
+
+def listing(url):
+    return {'url': url, 'name': url.upper()}
+
+
+def test_add_ignores_known_urls(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / 'state.db'))
+    assert frontier.add(listing('a'))
+    assert not frontier.add(listing('a'))
+    assert frontier.counts() == {PENDING: 1, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+    frontier.close()
+
+
+def test_resume_retries_in_flight_and_failed(tmp_path):
+    path = str(tmp_path / 'state.db')
+    frontier = CrawlFrontier(path)
+    for url in 'abcd':
+        frontier.add(listing(url))
+    frontier.mark_category_done('category')
+    frontier.mark_in_flight('a')
+    frontier.mark_done('a', {'url': 'a', 'price': 1})
+    frontier.mark_in_flight('b')
+    frontier.mark_in_flight('c')
+    frontier.mark_failed('c', 'timeout')
+    # Tiến trình dừng đột ngột: b vẫn đang in_flight
+    frontier.close()
+
+    frontier = CrawlFrontier(path, resume=True)
+    assert [product['url'] for product in frontier.iter_pending(batch_size=1)] == ['b', 'c', 'd']
+    assert frontier.pending() == [listing('b'), listing('c'), listing('d')]
+    assert list(frontier.iter_products()) == [{'url': 'a', 'price': 1}]
+    assert frontier.category_done('category')
+    frontier.close()
+
+
+def test_new_run_starts_empty(tmp_path):
+    path = str(tmp_path / 'state.db')
+    frontier = CrawlFrontier(path)
+    frontier.add(listing('a'))
+    frontier.mark_category_done('category')
+    frontier.close()
+    assert known_urls(path) == 1
+
+    frontier = CrawlFrontier(path)
+    assert frontier.pending() == []
+    assert not frontier.category_done('category')
+    frontier.close()
+
+
+def test_known_urls_without_state_file(tmp_path):
+    assert known_urls(str(tmp_path / 'missing.db')) == 0
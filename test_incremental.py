@@ -0,0 +1,167 @@
+import time
+
+import pytest
+
+import fetcher
+import ratelimit
+from benchmark import UNLIMITED_RATE, FixtureAdapter
+from incremental import IncrementalCrawler
+
+A = f"{fetcher.BASE_URL}/tivi/a"
+B = f"{fetcher.BASE_URL}/tivi/b"
+
+
+class Site:
+    """
+    Product pages served through fetcher.mount(); each version of a page
+    is a new file, since FixtureAdapter caches bodies by file name
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pages = {}
+        self.statuses = {}
+        self._files = 0
+
+    def publish(self, url, name):
+        self._files += 1
+        file_name = f"page_{self._files}.html"
+        (self.directory / file_name).write_text(
+            f'<html><div class="pdetail-name"><h1>{name}</h1></div></html>', encoding='utf-8'
+        )
+        self.pages[url] = file_name
+        self.statuses.pop(url, None)
+
+    def fail(self, url, status):
+        self.statuses[url] = status
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    directory = tmp_path / 'pages'
+    directory.mkdir()
+    site = Site(directory)
+    ratelimit.configure(rate=UNLIMITED_RATE, max_rate=UNLIMITED_RATE)
+    # Lỗi 5xx được fetch() thử lại: bỏ thời gian chờ giữa các lần thử
+    monkeypatch.setattr(ratelimit, 'backoff_delay', lambda attempt, **kwargs: 0.0)
+    fetcher.mount(fetcher.BASE_URL, FixtureAdapter(site.pages, str(directory), site.statuses))
+    yield site
+    fetcher.mount(fetcher.BASE_URL, None)
+
+
+def run(path, urls, include_removed=True):
+    crawler = IncrementalCrawler(path)
+    try:
+        for url in urls:
+            crawler.scrape(url)
+        delta = list(crawler.iter_delta(include_removed))
+    finally:
+        crawler.close()
+    return sorted((record['change'], record.get('url') or record['product']['name']) for record in delta)
+
+
+def test_first_run_reports_everything_new(tmp_path, site):
+    site.publish(A, 'A')
+    site.publish(B, 'B')
+    assert run(str(tmp_path / 'inc.db'), [A, B]) == [('new', 'A'), ('new', 'B')]
+
+
+def test_unchanged_page_is_not_in_delta(tmp_path, site):
+    path = str(tmp_path / 'inc.db')
+    site.publish(A, 'A')
+    site.publish(B, 'B')
+    run(path, [A, B])
+    site.publish(B, 'B2')
+    assert run(path, [A, B]) == [('changed', 'B2')]
+
+
+def test_removed_url_is_reported_once(tmp_path, site):
+    path = str(tmp_path / 'inc.db')
+    site.publish(A, 'A')
+    site.publish(B, 'B')
+    run(path, [A, B])
+    assert run(path, [A]) == [('removed', B)]
+    assert run(path, [A]) == []
+
+
+def test_removed_url_is_reported_again_after_it_came_back(tmp_path, site):
+    path = str(tmp_path / 'inc.db')
+    site.publish(A, 'A')
+    site.publish(B, 'B')
+    run(path, [A, B])
+    run(path, [A])
+    assert run(path, [A, B]) == []
+    assert run(path, [A]) == [('removed', B)]
+
+
+def test_failed_fetch_is_not_removed(tmp_path, site):
+    path = str(tmp_path / 'inc.db')
+    site.publish(A, 'A')
+    site.publish(B, 'B')
+    run(path, [A, B])
+    site.fail(B, 503)
+    assert run(path, [A, B]) == []
+
+
+def test_gone_page_is_removed(tmp_path, site):
+    path = str(tmp_path / 'inc.db')
+    site.publish(A, 'A')
+    site.publish(B, 'B')
+    run(path, [A, B])
+    site.fail(B, 404)
+    assert run(path, [A, B]) == [('removed', B)]
+
+
+def test_partial_crawl_skips_removals(tmp_path, site):
+    path = str(tmp_path / 'inc.db')
+    site.publish(A, 'A')
+    site.publish(B, 'B')
+    run(path, [A, B])
+    assert run(path, [A], include_removed=False) == []
+
+
+def test_unchanged_tile_skips_the_fetch(tmp_path, site):
+    path = str(tmp_path / 'inc.db')
+    site.publish(A, 'A')
+    tile = {'url': A, 'name': 'A', 'price': '1.000.000đ'}
+    crawler = IncrementalCrawler(path)
+    assert crawler.reuse_unchanged_tile(tile) is None
+    crawler.scrape(A)
+    crawler.close()
+
+    crawler = IncrementalCrawler(path)
+    assert crawler.reuse_unchanged_tile(tile)['name'] == 'A'
+    assert crawler.reuse_unchanged_tile(dict(tile, price='900.000đ')) is None
+    crawler.close()
+
+
+def test_failed_fetch_drops_pending_tile(tmp_path, site):
+    site.fail(A, 500)
+    crawler = IncrementalCrawler(str(tmp_path / 'inc.db'))
+    crawler.reuse_unchanged_tile({'url': A, 'name': 'A'})
+    crawler.scrape(A)
+    assert crawler._pending_tiles == {}
+    crawler.close()
+
+
+def test_lastmod_is_compared_with_the_last_real_fetch(tmp_path, site):
+    path = str(tmp_path / 'inc.db')
+    site.publish(A, 'A')
+    tile = {'url': A, 'name': 'A'}
+    crawler = IncrementalCrawler(path)
+    crawler.reuse_unchanged_tile(tile)
+    crawler.scrape(A)
+    crawler.close()
+    changed_at = time.time()
+    time.sleep(0.01)
+
+    # Chỉ dùng lại từ ô sản phẩm: không được coi là đã tải trang
+    crawler = IncrementalCrawler(path)
+    assert crawler.reuse_unchanged_tile(tile) is not None
+    crawler.close()
+
+    crawler = IncrementalCrawler(path)
+    assert crawler.reuse_not_modified(A, changed_at) is None
+    assert crawler.reuse_not_modified(A, changed_at - 60)['name'] == 'A'
+    assert crawler.reuse_not_modified(A, None) is None
+    crawler.close()
@@ -0,0 +1,83 @@
+import email.utils
+import time
+
+import pytest
+
+import ratelimit
+from ratelimit import AdaptiveRateLimiter, backoff_delay, parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('not a date') is None
+    later = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= parse_retry_after(later) <= 31
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=1.0, cap=8.0) <= min(8.0, 2 ** attempt)
+
+
+def test_good_responses_increase_rate():
+    limiter = AdaptiveRateLimiter(rate=10, max_concurrency=4)
+    limiter.concurrency_limit = 2.0
+    for _ in range(20):
+        limiter.record(200, 0.1)
+    assert limiter.rate > 10
+    assert 2 < limiter.concurrency_limit <= 4
+
+
+def test_throttle_halves_once_per_interval(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    limiter = AdaptiveRateLimiter(rate=10, max_concurrency=8)
+    limiter.record(429)
+    limiter.record(503)
+    assert limiter.rate == pytest.approx(5)
+    assert limiter.concurrency_limit == pytest.approx(4)
+    assert limiter.throttled == 2
+    now[0] += ratelimit.DECREASE_INTERVAL
+    limiter.record(None)
+    assert limiter.rate == pytest.approx(2.5)
+
+
+def test_rate_never_drops_below_minimum():
+    limiter = AdaptiveRateLimiter(rate=1, min_rate=0.5)
+    for _ in range(5):
+        limiter._last_decrease = 0.0
+        limiter.record(429)
+    assert limiter.rate == 0.5
+    assert limiter.concurrency_limit == 1.0
+
+
+def test_server_errors_do_not_adapt():
+    limiter = AdaptiveRateLimiter(rate=10)
+    limiter.record(500, 0.1)
+    assert limiter.rate == 10
+    assert limiter.throttled == 0
+
+
+def test_retry_after_pauses_the_host(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    limiter = AdaptiveRateLimiter(rate=10)
+    limiter.record(429, retry_after=30)
+    assert limiter.reserve() == pytest.approx(30)
+
+
+def test_reserve_allows_a_burst_then_spaces_requests(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: 100.0)
+    limiter = AdaptiveRateLimiter(rate=10)
+    waits = [limiter.reserve() for _ in range(ratelimit.BURST + 2)]
+    assert waits[:ratelimit.BURST] == [0.0] * ratelimit.BURST
+    assert waits[ratelimit.BURST:] == pytest.approx([0.1, 0.2])
+
+
+def test_release_frees_the_slot():
+    limiter = AdaptiveRateLimiter(rate=1000, max_concurrency=1)
+    limiter.acquire()
+    assert limiter.snapshot()['in_flight'] == 1
+    limiter.release(200, 0.01)
+    assert limiter.snapshot()['in_flight'] == 0
@@ -0,0 +1,84 @@
+import pytest
+
+import specindex
+from specindex import RangeIndex, SpecIndex, iter_ids, normalize_key, parse_quantity, to_bitmap
+
+PRODUCTS = [
+    {'url': 'https://mediamart.vn/a', 'name': 'Tivi Samsung 55', 'brand': 'Samsung', 'price': '12.990.000đ',
+     'categories': ['Tivi'], 'specifications': {'Kích thước màn hình': '55 inch', 'Độ phân giải': '4K'}},
+    {'url': 'https://mediamart.vn/b', 'name': 'Tivi LG 43', 'brand': 'LG', 'price': '7.490.000đ',
+     'categories': ['Tivi'], 'specifications': {'Kích thước màn hình': '43"', 'Độ phân giải': 'Full HD'}},
+    {'url': 'https://mediamart.vn/c', 'name': 'Tivi Samsung 65', 'brand': 'Samsung', 'price': '21.990.000đ',
+     'categories': ['Tivi', 'Khuyến mãi'],
+     'specifications': {'Kích thước màn hình': '65 inch', 'độ phân giải': '4k', 'Độ Phân Giải': '4K'}},
+    {'url': 'https://mediamart.vn/d', 'name': 'Nồi cơm', 'brand': 'Sharp', 'price': '990.000đ',
+     'categories': ['Gia dụng'], 'specifications': {'Dung tích': '1,8 lít'}},
+]
+
+
+@pytest.fixture
+def index():
+    return SpecIndex.build(PRODUCTS)
+
+
+def names(index, bitmap):
+    return [index.docs[doc_id].to_dict()['name'] for doc_id in iter_ids(bitmap)]
+
+
+def test_normalize_and_parse_quantity():
+    assert normalize_key('Kích thước màn hình') == 'kich_thuoc_man_hinh'
+    assert parse_quantity('55 inch') == (55.0, 'inch')
+    assert parse_quantity('1,8 lít') == (1.8, 'l')
+    assert parse_quantity('9.000 BTU') == (9000.0, 'btu')
+    assert parse_quantity('2 năm') == (24.0, 'thang')
+    assert parse_quantity('4K UHD') is None
+
+
+def test_bitmap_round_trip():
+    assert list(iter_ids(to_bitmap([0, 3, 9, 64]))) == [0, 3, 9, 64]
+    assert to_bitmap([]) == 0
+
+
+def test_value_filters(index):
+    assert names(index, index.filter({'brand': 'samsung'})) == ['Tivi Samsung 55', 'Tivi Samsung 65']
+    assert names(index, index.filter({'Thương hiệu': 'Samsung'})) == []
+    assert names(index, index.filter({'brand': ['LG', 'Sharp']})) == ['Tivi LG 43', 'Nồi cơm']
+    assert names(index, index.filter({'brand': 'Samsung', 'categories': 'khuyen mai'})) == ['Tivi Samsung 65']
+
+
+def test_range_filters(index):
+    assert names(index, index.filter({'Kích thước màn hình': ('50 inch', None)})) == \
+        ['Tivi Samsung 55', 'Tivi Samsung 65']
+    assert names(index, index.filter({'price': (None, 10_000_000)})) == ['Tivi LG 43', 'Nồi cơm']
+    assert index.filter({'dung_tich': (2, None)}) == 0
+    with pytest.raises(ValueError):
+        index.filter({'kich_thuoc_man_hinh': ('50 kg', None)})
+
+
+def test_merged_keys_count_a_product_once(index):
+    assert index.facet_counts('do_phan_giai') == {'4K': 2, 'Full HD': 1}
+    assert len(index.numeric['kich_thuoc_man_hinh']) == 3
+
+
+def test_search_with_facets_and_ranges(index):
+    result = index.search({'categories': 'Tivi'}, facets=['brand', 'kich_thuoc_man_hinh'], limit=2, offset=1)
+    assert result['total'] == 3
+    assert [product['name'] for product in result['products']] == ['Tivi LG 43', 'Tivi Samsung 65']
+    assert result['facets']['brand'] == {'Samsung': 2, 'LG': 1}
+    assert result['ranges']['kich_thuoc_man_hinh'] == (43.0, 65.0)
+
+
+def test_range_index_across_blocks(monkeypatch):
+    monkeypatch.setattr(specindex, 'RANGE_BLOCK', 4)
+    ranges = RangeIndex([(value, doc_id) for doc_id, value in enumerate([5, 1, 9, 3, 7, 2, 8, 6, 4, 0])])
+    assert sorted(iter_ids(ranges.range(3, 7))) == [0, 3, 4, 7, 8]
+    assert ranges.bounds(to_bitmap([2, 5, 6])) == (2, 9)
+    assert ranges.range(20, None) == 0
+
+
+def test_save_and_load(tmp_path, index):
+    path = str(tmp_path / 'index' / 'spec_index.pkl')
+    index.save(path)
+    loaded = SpecIndex.load(path)
+    assert names(loaded, loaded.filter({'brand': 'LG'})) == ['Tivi LG 43']
+    assert sorted(p.name for p in (tmp_path / 'index').iterdir()) == ['spec_index.pkl']